@@ -0,0 +1,8 @@
+#!/usr/bin/env bash
+
+set -e
+set -x
+
+# Microbenchmark of .llmignore matching over every file in a directory
+# (defaults to REPO_ROOT)
+python -m src.core.llmignore "${@}"
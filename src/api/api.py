@@ -3,7 +3,7 @@ import subprocess
 
 from fastapi import APIRouter
 
-from src.api.endpoints import files, directories, utils, programming, command, context, ai_plugin
+from src.api.endpoints import files, directories, utils, programming, command, context, search, ai_plugin
 
 api_router = APIRouter()
 api_router.include_router(files.router, prefix="/files", tags=["files"])
@@ -11,6 +11,7 @@ api_router.include_router(directories.router, prefix="/directories", tags=["dire
 api_router.include_router(programming.router, prefix="/programming", tags=["programming"])
 api_router.include_router(command.commands_router, prefix="/commands", tags=["commands"])
 api_router.include_router(context.router, prefix="/context", tags=["context"])
+api_router.include_router(search.router, prefix="/search", tags=["search"])
 api_router.include_router(utils.router, prefix="/utils", tags=["utils"])
 
 ai_plugin_router = APIRouter()
@@ -1,10 +1,25 @@
-from typing import Optional
-from fastapi import HTTPException, APIRouter
+import asyncio
+import codecs
+import functools
+import os
+from typing import AsyncIterator, Callable, List, Optional
+from fastapi import HTTPException, APIRouter, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 import docker
 
 from src.core.config import settings
-from src.utils import run_command_in_image, get_filesystem_path
-from src.schemas import Command, CommandResponseModel, load_commands
+from src.utils import stream_command_in_image, get_changed_files, get_filesystem_path, format_sse
+from src.core.container_pool import CommandStream, container_pool
+from src.core.local_process import stream_local_command
+from src.core.command_executor import command_executor
+from src.core.jobs import Job, job_store, CANCELLED, COMPLETED, FAILED, TIMED_OUT
+from src.core.command_cache import command_result_cache, repo_fingerprinter
+from src.core.test_impact import find_impacted_tests
+from src.core.sharding import duration_history, merge_exit_codes, run_sharded_tests
+from src.core.pytest_results import PytestResults, case_to_dict, junit_xml_path, last_failed, record_test_results
+from src.schemas import (Command, CommandResponseModel, JobResponseModel, JobOutputResponseModel,
+                         PytestResultsResponseModel, load_commands)
 
 
 from fastapi import APIRouter, HTTPException, Depends, Query
@@ -27,6 +42,18 @@ def clean_name(flag_or_arg_name: str) -> str:
         flag_or_arg_name = 'flag' + flag_or_arg_name
     return flag_or_arg_name
 
+class NoTestsAffected(Exception):
+    """
+    Raised for commands in `affected_tests` mode when no test is affected by
+    the current changes.
+    """
+
+
+def no_tests_affected(e: NoTestsAffected) -> HTTPException:
+    # The same for running the command directly, as a job or streamed
+    return HTTPException(status_code=409, detail=f"No tests to run: {e}")
+
+
 def create_router_for_command(command: Command) -> APIRouter:
     router = APIRouter()
 
@@ -49,11 +76,9 @@ def create_router_for_command(command: Command) -> APIRouter:
                     fields[python_friendly_flag_name] = (str, Field(Query("", description="Flag: " + flag.description)))
 
     CommandModel = create_model(command.name.capitalize(), **fields)
+    command_executor.set_limit(command.name, command.max_concurrency)
 
-    @router.post(f"/command/{command.name}", response_model=CommandResponseModel, description=command.description)
-    async def run_command(
-        command_model: CommandModel = Depends()
-    ) -> Dict[str, Any]:
+    def build_command_line(command_model: CommandModel, include_paths: bool = True) -> List[str]:
         command_line = [command.command]
 
         # Add arguments and flags to the command line
@@ -61,6 +86,8 @@ def create_router_for_command(command: Command) -> APIRouter:
             for arg in command.args:
                 python_friendly_arg_name = clean_name(arg.name)
                 value = getattr(command_model, python_friendly_arg_name, None)
+                if arg.is_directory_or_file and not include_paths:
+                    continue
                 if value is not None:
                     if arg.is_directory_or_file:
                         command_line.extend([get_filesystem_path(str(value))])
@@ -89,16 +116,413 @@ def create_router_for_command(command: Command) -> APIRouter:
                         else:
                             command_line.append(flag_str)
 
+        if command.mode == "affected_tests" and include_paths:
+            try:
+                changed_files = get_changed_files(settings.REPO_ROOT)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            impacted = find_impacted_tests(changed_files, settings.REPO_ROOT)
+            if impacted.test_files is not None:
+                if not impacted.test_files:
+                    raise NoTestsAffected(impacted.reason)
+                # Without paths pytest would run every test
+                command_line.extend(impacted.test_files)
+
+        return command_line
+
+    def cache_inputs(command_model: CommandModel) -> List[str]:
+        if command.cache_inputs is not None:
+            return [get_filesystem_path(path) for path in command.cache_inputs]
+        paths = []
+        for arg in command.args or []:
+            value = getattr(command_model, clean_name(arg.name), None)
+            if arg.is_directory_or_file and value is not None:
+                paths.append(get_filesystem_path(str(value)))
+        # Without paths the command sees the whole repo
+        return paths or [settings.REPO_ROOT]
+
+    @router.post(f"/command/{command.name}", response_model=CommandResponseModel, description=command.description)
+    async def run_command(
+        response: Response,
+        command_model: CommandModel = Depends()
+    ) -> Dict[str, Any]:
         try:
-            exit_code, output_str = run_command_in_image(settings.TARGET_REPO_DOCKER_IMAGE_NAME, command_line)
-        except docker.errors.ImageNotFound:
-            raise HTTPException(status_code=400, 
-                                detail=f"Target repo docker image with name '{settings.TARGET_REPO_DOCKER_IMAGE_NAME}' not found.")
-        return {"command": ' '.join(command_line), "exit_code": exit_code, "output_str": output_str}
+            command_line = await run_in_threadpool(build_command_line, command_model)
+        except NoTestsAffected as e:
+            raise no_tests_affected(e)
+        if command.cacheable:
+            inputs = cache_inputs(command_model)
+            fingerprint = await run_in_threadpool(repo_fingerprinter.fingerprint_inputs, inputs)
+            cache_key = (tuple(command_line), fingerprint)
+            cached = command_result_cache.get(cache_key)
+            response.headers["X-Command-Cache"] = "hit" if cached is not None else "miss"
+            if cached is not None:
+                return cached
+
+        if command.shards is not None and command.shards > 1:
+            shard_command_line = await run_in_threadpool(build_command_line, command_model, False)
+            result = await run_sharded_command(command, command_line, shard_command_line)
+            # Only cache runs where every shard ran to completion
+            shards = result.get("shards")
+            if command.cacheable and shards and all(shard["status"] == COMPLETED for shard in shards) and \
+                    await run_in_threadpool(repo_fingerprinter.fingerprint_inputs, inputs) == fingerprint:
+                command_result_cache.put(cache_key, cacheable_result(result))
+            return result
+
+        job = await run_command_job(command, command_line)
+        result = command_job_result(job, command_line)
+        # Don't cache the result if files changed while the command ran
+        if command.cacheable and job.status == COMPLETED and \
+                await run_in_threadpool(repo_fingerprinter.fingerprint_inputs, inputs) == fingerprint:
+            command_result_cache.put(cache_key, cacheable_result(result))
+        return result
+
+    @router.post(f"/command/{command.name}/jobs", response_model=JobResponseModel, status_code=202,
+                 description=command.description + ". Runs in the background and returns a job to poll for the result.")
+    async def submit_command_job(
+        command_model: CommandModel = Depends(),
+        priority: int = Query(0, description="Jobs with a higher priority run first"),
+        timeout_seconds: Optional[float] = Query(None, gt=0, description="Kill the command if it runs for longer than this"),
+    ) -> Dict[str, Any]:
+        try:
+            command_line = await run_in_threadpool(build_command_line, command_model)
+        except NoTestsAffected as e:
+            raise no_tests_affected(e)
+        job = start_command_job(command, command_line, priority=priority, timeout_seconds=timeout_seconds)
+        return job.to_dict()
+
+    @router.post(f"/command/{command.name}/stream",
+                 description=command.description + ". Streams the output as server-sent events.")
+    async def stream_command(
+        command_model: CommandModel = Depends()
+    ) -> StreamingResponse:
+        """
+        Run the command and stream its output as server-sent events while it
+        runs: `output` events with chunks of stdout/stderr, then an `exit`
+        event with the exit code, or an `error` event if the command could
+        not be run or timed out. Disconnecting stops the command.
+        """
+        try:
+            command_line = await run_in_threadpool(build_command_line, command_model)
+        except NoTestsAffected as e:
+            raise no_tests_affected(e)
+        return StreamingResponse(iter_command_events(command.name, command_line,
+                                                     open_command_stream(command_line, command.backend),
+                                                     command.timeout_seconds or settings.COMMAND_TIMEOUT_SECONDS),
+                                 media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    if command.junit_xml:
+        @router.post(f"/command/{command.name}/rerun_failed", response_model=CommandResponseModel,
+                     description=command.description + ". Only runs the tests that failed the last time they ran; "
+                                                       "path arguments are ignored.")
+        async def rerun_failed_tests(
+            command_model: CommandModel = Depends()
+        ) -> Dict[str, Any]:
+            # Tests in files deleted since can't be run
+            node_ids = [node_id for node_id in last_failed.node_ids()
+                        if os.path.exists(os.path.join(settings.REPO_ROOT, node_id.split("::", 1)[0]))]
+            if not node_ids:
+                return {"command": command.command, "exit_code": 0, "output_str": "No failed tests to rerun"}
+            command_line = await run_in_threadpool(build_command_line, command_model, False)
+            command_line += [os.path.join(settings.REPO_ROOT, node_id) for node_id in node_ids]
+            return command_job_result(await run_command_job(command, command_line), command_line)
 
     return router
 
 
+def start_command_job(command: Command,
+                      command_line: List[str],
+                      priority: int = 0,
+                      timeout_seconds: Optional[float] = None) -> Job:
+    """
+    Submit a run of the command as a job. For commands with `junit_xml` set
+    pytest is asked for a JUnit XML report, which is parsed into the job's
+    `test_results` once the command exits.
+    """
+    on_finish = None
+    if command.junit_xml and "--collect-only" not in command_line:
+        report_path = junit_xml_path()
+        command_line = command_line + [f"--junitxml={report_path}"]
+        on_finish = functools.partial(store_test_results, report_path)
+    return job_store.submit(command.name, command_line, open_command_stream(command_line, command.backend),
+                            priority=priority, timeout_seconds=timeout_seconds or command.timeout_seconds,
+                            on_finish=on_finish)
+
+
+def store_test_results(report_path: str, job: Job) -> None:
+    job.test_results = record_test_results(report_path, settings.REPO_ROOT, last_failed, duration_history)
+
+
+async def run_command_job(command: Command, command_line: List[str]) -> Job:
+    """
+    Run the command as a job and wait for it to finish.
+    """
+    job = start_command_job(command, command_line)
+    try:
+        await asyncio.wrap_future(job.future)
+    except asyncio.CancelledError:
+        if not job.future.cancelled():
+            # The client disconnected
+            job.stop(CANCELLED)
+            raise
+        # Otherwise the job was cancelled through `/commands/jobs/{id}/cancel`
+        # while it was queued
+    except docker.errors.ImageNotFound:
+        raise HTTPException(status_code=400, 
+                            detail=f"Target repo docker image with name '{settings.TARGET_REPO_DOCKER_IMAGE_NAME}' not found.")
+    if job.status == CANCELLED:
+        raise HTTPException(status_code=409, detail=f"Command was cancelled (job {job.id}).")
+    if job.status == TIMED_OUT:
+        raise HTTPException(status_code=504,
+                            detail=f"Command timed out after {job.timeout_seconds} seconds (job {job.id}).")
+    if job.status == FAILED:
+        raise HTTPException(status_code=500, detail=f"Command could not be run: {job.error}")
+    return job
+
+
+def cacheable_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Copy of a command's result to serve from the cache. The resources used
+    and the output handle belong to the run that produced it, and the handle
+    stops working once that job is evicted from the job store, so both are
+    left out of responses served from the cache.
+    """
+    cached = dict(result, usage=None, output_handle=None)
+    if cached.get("shards"):
+        cached["shards"] = [dict(shard, usage=None, output_handle=None) for shard in cached["shards"]]
+    return cached
+
+
+def command_job_result(job: Job, command_line: List[str]) -> Dict[str, Any]:
+    return {
+        "command": ' '.join(command_line),
+        "exit_code": job.exit_code,
+        "output_str": job.output.summary(),
+        "output_handle": job.id,
+        "output_size": job.output.size,
+        "output_truncated": job.output.truncated,
+        "test_results": job.test_results.summary() if job.test_results is not None else None,
+        "usage": job.usage(),
+    }
+
+
+async def run_sharded_command(command: Command, command_line: List[str], shard_command_line: List[str]) -> Dict[str, Any]:
+    """
+    Run a pytest command with its tests split across `command.shards`
+    containers, and merge the shards' results into one response.
+    """
+    run = await run_sharded_tests(functools.partial(start_command_job, command), command_line, shard_command_line,
+                                  command.shards, duration_history, settings.REPO_ROOT)
+    if not run.shard_jobs:
+        # Collection failed or found no tests
+        job = run.collect_job
+        if isinstance(job.future.exception(), docker.errors.ImageNotFound):
+            raise HTTPException(status_code=400,
+                                detail=f"Target repo docker image with name '{settings.TARGET_REPO_DOCKER_IMAGE_NAME}' not found.")
+        return {
+            "command": ' '.join(job.command_line),
+            "exit_code": job.exit_code if job.exit_code is not None else 1,
+            "output_str": job.output.summary() if job.error is None else job.error,
+            "output_handle": job.id,
+            "output_size": job.output.size,
+            "output_truncated": job.output.truncated,
+            "usage": job.usage(),
+        }
+
+    shards = []
+    sections = []
+    for i, (job, test_count) in enumerate(zip(run.shard_jobs, run.shard_tests)):
+        shards.append({
+            "command": ' '.join(job.command_line),
+            "status": job.status,
+            "exit_code": job.exit_code,
+            "test_count": test_count,
+            "output_handle": job.id,
+            "duration_seconds": job.finished_at - job.started_at if job.started_at and job.finished_at else None,
+            "usage": job.usage(),
+        })
+        header = f"===== shard {i + 1}/{len(run.shard_jobs)}: {test_count} tests, {job.status}"
+        header += f", exit code {job.exit_code} =====" if job.exit_code is not None else " ====="
+        sections.append(header + "\n" + (job.output.summary() if job.error is None else job.error))
+    return {
+        "command": ' '.join(command_line),
+        "exit_code": merge_exit_codes([job.exit_code for job in run.shard_jobs]),
+        "output_str": "\n".join(sections),
+        "output_handle": None,
+        "output_size": sum(job.output.size for job in run.shard_jobs),
+        "output_truncated": any(job.output.truncated for job in run.shard_jobs),
+        "shards": shards,
+        "test_results": PytestResults.merge(job.test_results for job in run.shard_jobs).summary()
+        if command.junit_xml else None,
+    }
+
+
+def open_command_stream(command_line: List[str], backend: Optional[str] = None) -> Callable[[], CommandStream]:
+    """
+    Return a function that starts the command with `backend`, or the
+    configured COMMAND_BACKEND.
+    """
+    backend = backend or settings.COMMAND_BACKEND
+    if backend == "local":
+        return functools.partial(stream_local_command, command_line, settings.REPO_ROOT,
+                                 cpu_seconds=settings.LOCAL_COMMAND_CPU_SECONDS,
+                                 memory_bytes=settings.LOCAL_COMMAND_MEMORY_BYTES,
+                                 max_output_bytes=settings.LOCAL_COMMAND_MAX_OUTPUT_BYTES)
+    if backend == "docker-pool":
+        return functools.partial(container_pool.stream, command_line)
+    return functools.partial(stream_command_in_image, settings.TARGET_REPO_DOCKER_IMAGE_NAME, command_line)
+
+
+async def iter_command_events(name: str,
+                              command_line: List[str],
+                              open_stream: Callable[[], CommandStream],
+                              timeout_seconds: Optional[float] = None) -> AsyncIterator[str]:
+    yield format_sse("start", {"command": ' '.join(command_line)})
+    # Chunks can split multi-byte characters
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    try:
+        # Recorded like the usage of runs as jobs
+        on_finish = functools.partial(job_store.usage_stats.record, name) if job_store.usage_stats is not None else None
+        async for kind, value in command_executor.stream(name, open_stream, timeout_seconds=timeout_seconds,
+                                                         on_finish=on_finish):
+            if kind == "output":
+                text = decoder.decode(value)
+                if text:
+                    yield format_sse("output", {"output_str": text})
+                continue
+            text = decoder.decode(b"", final=True)
+            if text:
+                yield format_sse("output", {"output_str": text})
+            if kind == "timeout":
+                yield format_sse("error", {"detail": f"Command timed out after {value} seconds."})
+            else:
+                yield format_sse("exit", {"exit_code": value})
+    except docker.errors.ImageNotFound:
+        yield format_sse("error", {"detail": f"Target repo docker image with name '{settings.TARGET_REPO_DOCKER_IMAGE_NAME}' not found."})
+    except (docker.errors.DockerException, OSError) as e:
+        yield format_sse("error", {"detail": str(e)})
+
+
+@commands_router.get("/pool/stats")
+async def get_container_pool_stats():
+    """
+    Number of pooled containers that are idle, in use, and that have been
+    created, recycled or replaced after failing a health check.
+    """
+    return container_pool.stats()
+
+
+@commands_router.get("/queue/stats")
+async def get_command_queue_stats():
+    """
+    Number of runs of each command currently running and waiting to run, and
+    how long runs have waited for a free slot.
+    """
+    return command_executor.stats()
+
+
+@commands_router.get("/usage/stats")
+async def get_command_usage_stats():
+    """
+    Percentiles of the queue wait, start latency, wall time, CPU time, peak
+    memory and output size of recent runs of each command.
+    """
+    return job_store.usage_stats.stats() if job_store.usage_stats is not None else {}
+
+
+@commands_router.get("/cache/stats")
+async def get_command_cache_stats():
+    """
+    Hits and misses of the result cache for commands marked `cacheable`.
+    """
+    return command_result_cache.stats()
+
+
+@commands_router.get("/test_results/{handle}", response_model=PytestResultsResponseModel)
+async def get_test_results(handle: str):
+    """
+    Outcome and duration of every test in a test run, using the
+    `output_handle` from its response.
+    """
+    job = get_job_or_404(handle)
+    if job.test_results is None:
+        raise HTTPException(status_code=404, detail=f"No test results for {handle}")
+    return {"id": job.id, "tests": [case_to_dict(case) for case in job.test_results.cases]}
+
+
+@commands_router.get("/last_failed", response_model=List[str])
+async def get_last_failed_tests():
+    """
+    Node IDs of the tests that failed the last time they ran.
+    """
+    return last_failed.node_ids()
+
+
+@commands_router.delete("/last_failed", status_code=204)
+async def clear_last_failed_tests():
+    last_failed.clear()
+
+
+@commands_router.get("/jobs", response_model=List[JobResponseModel])
+async def list_jobs(status: Optional[str] = Query(None, description="Only list jobs with this status")):
+    return [job.to_dict() for job in job_store.list(status)]
+
+
+@commands_router.get("/jobs/{job_id}", response_model=JobResponseModel)
+async def get_job(job_id: str):
+    return get_job_or_404(job_id).to_dict()
+
+
+@commands_router.get("/jobs/{job_id}/output", response_model=JobOutputResponseModel)
+async def get_job_output(job_id: str,
+                         offset: int = Query(0, ge=0, description="Byte offset to read the output from"),
+                         limit: Optional[int] = Query(None, gt=0, description="Maximum number of bytes to read")):
+    """
+    Output the job has produced so far, from `offset`. Poll again with
+    `offset=next_offset` to read output produced since.
+    """
+    return read_job_output(get_job_or_404(job_id), offset, limit)
+
+
+@commands_router.get("/output/{handle}", response_model=JobOutputResponseModel)
+async def get_command_output(handle: str,
+                             offset: int = Query(0, ge=0, description="Byte offset to read the output from"),
+                             limit: Optional[int] = Query(None, gt=0, description="Maximum number of bytes to read")):
+    """
+    Page through the full output of a command run, using the `output_handle`
+    from its response. Continue from `next_offset` until it equals the
+    output's size.
+    """
+    return read_job_output(get_job_or_404(handle), offset, limit)
+
+
+def read_job_output(job: Job, offset: int, limit: Optional[int]) -> Dict[str, Any]:
+    finished = job.finished
+    data = job.output.read(offset, min(limit or settings.COMMAND_OUTPUT_PAGE_BYTES, settings.COMMAND_OUTPUT_PAGE_BYTES))
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    at_end = finished and offset + len(data) >= job.output.size
+    output_str = decoder.decode(data, final=at_end)
+    # Leave a multi-byte character split by the end of the page to the next read
+    next_offset = offset + len(data) - len(decoder.getstate()[0])
+    return {"id": job.id, "status": job.status, "output_str": output_str, "offset": offset, "next_offset": next_offset}
+
+
+@commands_router.post("/jobs/{job_id}/cancel", response_model=JobResponseModel)
+async def cancel_job(job_id: str):
+    job = get_job_or_404(job_id)
+    if not job.stop(CANCELLED):
+        raise HTTPException(status_code=409, detail=f"Job {job_id} has already finished")
+    return job.to_dict()
+
+
+def get_job_or_404(job_id: str) -> Job:
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+
 commands = load_commands('command_config.yml')
 for command in commands:
     router = create_router_for_command(command)
@@ -1,61 +1,147 @@
-from fastapi import HTTPException, Query, APIRouter
+from fastapi import HTTPException, Query, APIRouter, Header
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+import asyncio
 from pathlib import Path as FilePath
 import fnmatch
+import json
 import os
 import shutil
-from typing import Any, Dict
+from enum import Enum
+from typing import Any, Dict, Iterator, List, Optional
 
 from src.utils import get_filesystem_path
 from src.core.config import settings
-from src.utils import is_llmignored, get_git_diff
+from src.utils import is_llmignored, get_git_diff, walk_directory, format_sse, WalkEntry
+from src.core.tree_index import tree_index
+from src.core.change_feed import change_feed
 
 router = APIRouter()
 
 
-def get_directory_structure(path: str) -> Dict[str, Any]:
-    item = {
+def walk_file_structure(path: str,
+                        max_depth: Optional[int] = None,
+                        include: Optional[List[str]] = None) -> Iterator[WalkEntry]:
+    # Serve from the in-memory tree when it is enabled, otherwise walk the disk
+    if tree_index.covers(path) and tree_index.ensure_ready():
+        return tree_index.walk(path, max_depth=max_depth, include=include)
+    return walk_directory(path, max_depth=max_depth, include=include)
+
+
+def get_directory_structure(path: str,
+                            max_depth: Optional[int] = None,
+                            max_entries: Optional[int] = None,
+                            include: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+    root_path = path[len(str(settings.REPO_ROOT)):]  # Remove the repo root from the path
+    # Ignore any path / files that are in .llmignore or are part of a .git directory
+    if is_llmignored(root_path, is_dir=os.path.isdir(path)) or root_path[-4:] == '.git':
+        return None
+
+    root = {
         "name": os.path.basename(path),
-        "path": path[len(str(settings.REPO_ROOT)):], # Remove the repo root from the path
+        "path": root_path,
         "type": "file" if os.path.isfile(path) else "directory"
     }
+    if root["type"] == "file":
+        root["metadata"] = {"file_size_bytes": os.path.getsize(path)}
+        return root
 
-    try:
-        # Ignore any path / files that are in .llmignore or are part of a .git directory
-        if is_llmignored(item["path"]) or item["path"][-4:] == '.git':
-                return None
-
-        if os.path.isfile(path):
+    root["children"] = []
+    directories = {os.path.normpath(path): root}
+    ordered_directories = [root]
+    entry_count = 0
+    for entry in walk_file_structure(path, max_depth=max_depth, include=include):
+        if max_entries is not None and entry_count >= max_entries:
+            root["truncated"] = True
+            break
+        entry_count += 1
 
-            item["metadata"] = {
-                "file_size_bytes": os.path.getsize(path)
-            }
+        item = {
+            "name": entry.name,
+            "path": entry.path[len(str(settings.REPO_ROOT)):],
+            "type": "directory" if entry.is_dir else "file"
+        }
+        if entry.is_dir:
+            item["children"] = []
+            if max_depth is not None and entry.depth >= max_depth:
+                item["truncated"] = True
+            directories[entry.path] = item
+            ordered_directories.append(item)
         else:
-            children = [
-                get_directory_structure(os.path.join(path, child))
-                for child in os.listdir(path)
+            item["metadata"] = {"file_size_bytes": entry.size}
+        directories[os.path.dirname(entry.path)]["children"].append(item)
+
+    if include:
+        # Drop directories without any matching files. Children are always
+        # created after their parents, so walking backwards visits them first.
+        for directory in reversed(ordered_directories):
+            directory["children"] = [
+                child for child in directory["children"]
+                if child["type"] == "file" or child["children"] or child.get("truncated")
             ]
-            item["children"] = [child for child in children if child is not None]
-
-        return item
-    except FileNotFoundError:
-        # TODO - there are some situations, particularly in python environment, where
-        # the file does seem to exist but we get a FileNotFoundError. This is a hacky
-        # workaround for now. Example of error that has happened:
-        # E.g FileNotFoundError: [Errno 2] No such file or directory: '/repo/venv/bin/python'
-        return None
+
+    return root
+
+
+def iter_file_structure_ndjson(path: str,
+                               max_depth: Optional[int] = None,
+                               max_entries: Optional[int] = None,
+                               include: Optional[List[str]] = None) -> Iterator[str]:
+    """
+    Yield one JSON line per entry of the directory tree as it is walked, so
+    the tree never has to be held in memory.
+    """
+    root_path = path[len(str(settings.REPO_ROOT)):]
+    if is_llmignored(root_path, is_dir=os.path.isdir(path)) or root_path[-4:] == '.git':
+        return
+    if os.path.isfile(path):
+        yield json.dumps({"path": root_path, "type": "file", "size": os.path.getsize(path), "depth": 0}) + "\n"
+        return
+
+    yield json.dumps({"path": root_path, "type": "directory", "size": None, "depth": 0}) + "\n"
+    entry_count = 0
+    for entry in walk_file_structure(path, max_depth=max_depth, include=include):
+        if max_entries is not None and entry_count >= max_entries:
+            yield json.dumps({"truncated": True}) + "\n"
+            return
+        entry_count += 1
+        yield json.dumps({
+            "path": entry.path[len(str(settings.REPO_ROOT)):],
+            "type": "directory" if entry.is_dir else "file",
+            "size": entry.size,
+            "depth": entry.depth,
+        }) + "\n"
+
+
+class FileStructureFormat(str, Enum):
+    json = "json"
+    ndjson = "ndjson"
 
 
 @router.post("/file_structure/{dir_path:path}")
-async def get_file_structure(dir_path: str):
+async def get_file_structure(
+    dir_path: str,
+    max_depth: Optional[int] = Query(None, ge=1, description="Only descend this many directory levels"),
+    max_entries: Optional[int] = Query(None, ge=1, description="Stop after this many files and directories"),
+    include: Optional[List[str]] = Query(None, description="Only include files whose name or path matches one of these glob patterns, e.g. `*.py`"),
+    format: FileStructureFormat = Query(FileStructureFormat.json, description="`ndjson` streams one flat `{path, type, size, depth}` record per line as the tree is walked"),
+):
     """
     Get file structure of given directory and subdirectories. Ignores `.git` directory
     and any file matching `.llmignore` patterns. `.llmignore` must be in the 
     root directory of repo and follow same structure as `.gitignore`.
+    Directories that were not fully listed because of `max_depth` or `max_entries`
+    are marked with `"truncated": true`.
     """
     dir_path = get_filesystem_path(dir_path)
     if not os.path.exists(dir_path):
         raise HTTPException(status_code=404, detail="Directory not found")
-    structure = get_directory_structure(dir_path)
+    if format == FileStructureFormat.ndjson:
+        return StreamingResponse(iter_file_structure_ndjson(dir_path, max_depth, max_entries, include),
+                                 media_type="application/x-ndjson")
+    # Walking the tree (and building the in-memory tree on first use) is
+    # blocking work
+    structure = await run_in_threadpool(get_directory_structure, dir_path, max_depth, max_entries, include)
     return structure
 
 
@@ -72,3 +158,82 @@ async def git_diff():
     return {"diff": diff}
 
 
+SSE_HEARTBEAT_SECONDS = 15
+
+
+def missed_events(since: int) -> bool:
+    """
+    Whether events after `since` have already been dropped from the feed (or
+    `since` comes from before a server restart), so the client must rescan.
+    """
+    oldest_seq = change_feed.oldest_seq
+    if since > change_feed.last_seq:
+        return True
+    return oldest_seq is not None and since + 1 < oldest_seq
+
+
+@router.get("/changes")
+async def stream_changes(
+    since: Optional[int] = Query(None, description="Replay events with a sequence number greater than this first"),
+    timeout: Optional[float] = Query(None, gt=0, description="Close the stream after this many seconds"),
+    last_event_id: Optional[int] = Header(None),
+):
+    """
+    Server-sent event stream of file changes in the repo (`created`, `modified`,
+    `deleted`, `moved`), each with a monotonically increasing `seq`. Use this
+    instead of polling `/context/file_structure` and `/context/git_diff`.
+    Reconnect with `since=<last seq>` (or the `Last-Event-ID` header) to catch
+    up on missed events; a `resync` event means too much was missed and the
+    client should rescan.
+    """
+    # The file watcher is started with the tree index
+    await run_in_threadpool(tree_index.ensure_ready)
+    if since is None:
+        since = last_event_id
+
+    async def event_stream():
+        queue = change_feed.subscribe()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout is not None else None
+        last_sent = since if since is not None else change_feed.last_seq
+        try:
+            if since is not None:
+                if missed_events(since):
+                    yield format_sse("resync", {"last_seq": change_feed.last_seq})
+                for event in change_feed.events_since(since):
+                    yield format_sse("change", event, event["seq"])
+                    last_sent = event["seq"]
+            while True:
+                wait = SSE_HEARTBEAT_SECONDS
+                if deadline is not None:
+                    wait = min(wait, deadline - loop.time())
+                    if wait <= 0:
+                        return
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=wait)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                # Skip events already sent while replaying
+                if event["seq"] > last_sent:
+                    yield format_sse("change", event, event["seq"])
+                    last_sent = event["seq"]
+        finally:
+            change_feed.unsubscribe(queue)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+
+@router.get("/changes/log")
+async def get_changes_log(since: int = Query(0, description="Return events with a sequence number greater than this")):
+    """
+    Non-streaming version of `/context/changes`: the file change events recorded
+    after `since`. `resync` is true if some of them have already been dropped.
+    """
+    await run_in_threadpool(tree_index.ensure_ready)
+    return {
+        "last_seq": change_feed.last_seq,
+        "resync": missed_events(since),
+        "events": change_feed.events_since(since),
+    }
@@ -1,9 +1,12 @@
 from fastapi import APIRouter, HTTPException, Path
+from fastapi.concurrency import run_in_threadpool
 from pathlib import Path as FilePath
 import shutil
 
 from src.schemas import DirectoryRequest
 from src.utils import is_llmignored
+from src.core.file_events import file_changed, CREATED, DELETED
+from src.core.tree_index import tree_index
 
 router = APIRouter()
 
@@ -13,6 +16,11 @@ async def list_directory_contents(dir_path: str):
     target_path = FilePath(dir_path)
     if is_llmignored(str(target_path)):
         raise HTTPException(status_code=404, detail="Directory is ignored in `.llmignore`")
+    if tree_index.covers(str(target_path.absolute())) and await run_in_threadpool(tree_index.ensure_ready):
+        # Served from the in-memory tree, which leaves out `.llmignore`d entries
+        names = tree_index.list_directory(str(target_path.absolute()))
+        if names is not None:
+            return {"contents": [str(target_path / name) for name in names]}
     if target_path.is_dir():
         contents = [str(item) for item in target_path.iterdir()]
         return {"contents": contents}
@@ -30,6 +38,7 @@ async def create_directory(directory_request: DirectoryRequest):
         raise HTTPException(status_code=409, detail="Parent directory does not exist")
     if not target_path.exists():
         target_path.mkdir(parents=True, exist_ok=True)
+        await file_changed(str(target_path.absolute()), CREATED)
         return {"message": "Directory created successfully"}
     else:
         raise HTTPException(status_code=409, detail="Directory already exists")
@@ -42,6 +51,7 @@ async def delete_directory(dir_path: str):
         raise HTTPException(status_code=404, detail="Directory is ignored in `.llmignore`")
     if target_path.is_dir():
         shutil.rmtree(target_path)
+        await file_changed(str(target_path.absolute()), DELETED)
         return {"message": "Directory deleted successfully"}
     else:
         raise HTTPException(status_code=404, detail="Directory not found")
@@ -1,17 +1,176 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Path, status
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, APIRouter, Header, HTTPException, Path, Query, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from pathlib import Path as FilePath
+import mimetypes
 import os
-from typing import Optional
+from typing import Any, Dict, Iterator, Optional, Tuple
 from src.schemas import CreateFileRequest, UpdateEntireFileRequest, UpdateFileLineNumberRequest
 from src.core.config import settings
-from src.utils import get_filesystem_path, is_llmignored
+from src.utils import BINARY_SNIFF_BYTES, get_filesystem_path, is_llmignored, looks_binary
+from src.core.file_events import file_changed, CREATED, DELETED
+from src.core.line_index import line_offset_cache, read_bytes
 
 router = APIRouter()
 
+# Size of the chunks `Range` responses are streamed in
+RANGE_CHUNK_BYTES = 64 * 1024
+
+
+def parse_range_header(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse an HTTP `Range` header for a single byte range, like `bytes=0-99`,
+    `bytes=100-` or `bytes=-100`, into (start, end) offsets with `end`
+    exclusive. Returns None for headers it doesn't support (other units,
+    several ranges), which should be ignored. Raises `ValueError` if the
+    range is unsatisfiable for a file of `size` bytes.
+    """
+    unit, _, byte_range = header.partition("=")
+    first, separator, last = byte_range.strip().partition("-")
+    if unit.strip().lower() != "bytes" or not separator or "," in byte_range:
+        return None
+    if not (first.isdigit() or first == "") or not (last.isdigit() or last == "") or first == last == "":
+        return None
+    if first == "":
+        # The last `last` bytes
+        if int(last) == 0 or size == 0:
+            raise ValueError("Empty suffix range")
+        return max(size - int(last), 0), size
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    end = min(int(last) + 1, size) if last else size
+    if start >= size:
+        raise ValueError("Range starts past the end of the file")
+    return start, end
+
+
+def sniff_file(path: str) -> Tuple[int, str, bool]:
+    """
+    Return the size, content type and whether a file looks binary, judging
+    by its name first and then by its first bytes.
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        binary = looks_binary(f.read(BINARY_SNIFF_BYTES))
+    media_type = mimetypes.guess_type(path)[0]
+    if media_type is None or (binary and media_type.startswith("text/")):
+        media_type = "application/octet-stream" if binary else "text/plain"
+    return size, media_type, binary
+
+
+def read_text(path: str) -> Optional[str]:
+    """
+    Return the content of a UTF-8 text file, or None if it isn't valid UTF-8.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            return file.read()
+    except UnicodeDecodeError:
+        return None
+
+
+def read_range_response(path: str, range_header: str) -> Optional[Response]:
+    size, media_type, _ = sniff_file(path)
+    try:
+        byte_range = parse_range_header(range_header, size)
+    except ValueError:
+        raise HTTPException(status_code=416, detail="Requested range not satisfiable",
+                            headers={"Content-Range": f"bytes */{size}"})
+    if byte_range is None:
+        return None
+    start, end = byte_range
+    return StreamingResponse(
+        iter_file_range(path, start, end),
+        status_code=206,
+        media_type=media_type,
+        headers={"Content-Range": f"bytes {start}-{end - 1}/{size}", "Content-Length": str(end - start),
+                 "Accept-Ranges": "bytes"},
+    )
+
+
+def iter_file_range(path: str, start: int, end: int) -> Iterator[bytes]:
+    """
+    Yield bytes `start` to `end` of a file in chunks of RANGE_CHUNK_BYTES.
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            chunk = f.read(min(RANGE_CHUNK_BYTES, remaining))
+            if not chunk:
+                return
+            remaining -= len(chunk)
+            yield chunk
+
+
+def read_line_window(path: str, start_line: int, end_line: Optional[int]) -> Dict[str, Any]:
+    offsets = line_offset_cache.get(path)
+    if start_line > offsets.line_count:
+        raise HTTPException(status_code=400, detail=f"start_line is past the end of the file ({offsets.line_count} lines)")
+    end_line = min(end_line or offsets.line_count, offsets.line_count)
+    if end_line < start_line:
+        raise HTTPException(status_code=400, detail="end_line is before start_line")
+    start, end = offsets.byte_span(start_line, end_line)
+    truncated = end - start > settings.FILE_JSON_MAX_BYTES
+    if truncated:
+        # Stop at the last whole line that fits, or cut the first line short
+        # if even that doesn't fit
+        end_line = max(start_line, offsets.last_line_ending_by(start + settings.FILE_JSON_MAX_BYTES))
+        start, end = offsets.byte_span(start_line, end_line)
+        end = min(end, start + settings.FILE_JSON_MAX_BYTES)
+    return {
+        "content": read_bytes(path, start, end).decode("utf-8", errors="replace"),
+        "start_line": start_line,
+        "end_line": end_line,
+        "total_lines": offsets.line_count,
+        "truncated": truncated,
+    }
+
+
+def read_byte_window(path: str, start_byte: int, end_byte: Optional[int]) -> Dict[str, Any]:
+    size = os.path.getsize(path)
+    end_byte = min(end_byte if end_byte is not None else size, size)
+    if start_byte > size or end_byte < start_byte:
+        raise HTTPException(status_code=400, detail=f"Invalid byte range for a file of {size} bytes")
+    truncated = end_byte - start_byte > settings.FILE_JSON_MAX_BYTES
+    if truncated:
+        end_byte = start_byte + settings.FILE_JSON_MAX_BYTES
+    return {
+        # Characters split by the range are replaced
+        "content": read_bytes(path, start_byte, end_byte).decode("utf-8", errors="replace"),
+        "start_byte": start_byte,
+        "end_byte": end_byte,
+        "size": size,
+        "truncated": truncated,
+    }
+
 
 @router.get("/{file_path:path}")
-async def read_file(file_path: str):
+async def read_file(
+    file_path: str,
+    start_line: Optional[int] = Query(None, ge=1, description="First line to return, counting from 1"),
+    end_line: Optional[int] = Query(None, ge=1, description="Last line to return (inclusive); defaults to the end of the file"),
+    start_byte: Optional[int] = Query(None, ge=0, description="Offset of the first byte to return"),
+    end_byte: Optional[int] = Query(None, ge=0, description="Offset just past the last byte to return; defaults to the end of the file"),
+    raw: bool = Query(False, description="Stream the file's bytes as they are rather than returning JSON"),
+    range_header: Optional[str] = Header(None, alias="Range"),
+):
+    """
+    Read a file, or only part of it. Text files up to a size limit are
+    returned as JSON `{"content": ...}`; binary files (detected from their
+    first bytes), larger files, files that aren't UTF-8 and reads with `raw`
+    set are streamed as they are, with their content type and length.
+
+    With `start_line`/`end_line` only those lines are read, found through a
+    cached index of line offsets rather than by reading the file up to them;
+    the response also gives the line numbers returned and the file's total
+    line count. `start_byte`/`end_byte` return a byte range the same way.
+    Windows larger than the JSON size limit are cut short, in which case
+    `truncated` is set and `end_line`/`end_byte` give where the content
+    stops. A standard HTTP `Range` header (a single range of bytes) streams
+    the raw bytes with status 206.
+    """
     path = get_filesystem_path(file_path)
 
     if is_llmignored(path):
@@ -20,10 +179,27 @@ async def read_file(file_path: str):
         raise HTTPException(status_code=404, detail="File not found")
 
     if os.path.isfile(path):
+        if (start_line is not None or end_line is not None) and (start_byte is not None or end_byte is not None):
+            raise HTTPException(status_code=400, detail="Give either line numbers or byte offsets, not both")
         try:
-            with open(path, "r") as file:
-                content = file.read()
-            return {"content": content}
+            if range_header is not None:
+                response = await run_in_threadpool(read_range_response, path, range_header)
+                if response is not None:
+                    return response
+            if start_line is not None or end_line is not None:
+                return await run_in_threadpool(read_line_window, path, start_line or 1, end_line)
+            if start_byte is not None or end_byte is not None:
+                return await run_in_threadpool(read_byte_window, path, start_byte or 0, end_byte)
+            size, media_type, binary = await run_in_threadpool(sniff_file, path)
+            if not (raw or binary or size > settings.FILE_JSON_MAX_BYTES):
+                content = await run_in_threadpool(read_text, path)
+                if content is not None:
+                    return {"content": content}
+            return FileResponse(path, media_type=media_type, headers={"Accept-Ranges": "bytes"})
+        except HTTPException:
+            raise
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="File not found")
         except PermissionError:
             raise HTTPException(status_code=403, detail="Permission denied")
         except Exception as e:
@@ -45,6 +221,7 @@ async def create_file(file_request: CreateFileRequest):
     if not os.path.exists(target_path):
         with open(target_path, "w") as file:
             file.write(file_request.content)
+        await file_changed(target_path, CREATED)
         return JSONResponse(content={"message": "File created successfully"}, status_code=status.HTTP_201_CREATED)
     else:
         raise HTTPException(status_code=409, detail="File already exists")
@@ -63,6 +240,7 @@ async def update_entire_file(file_path: str, update_request: UpdateEntireFileReq
         try:
             with open(path, "w") as file:
                 file.write(update_request.content)
+            await file_changed(path)
             return {"message": "File updated successfully"}
         except PermissionError:
             raise HTTPException(status_code=403, detail="Permission denied")
@@ -103,6 +281,7 @@ async def edit_file_by_line_number(file_path: str, edit_request: UpdateFileLineN
 
             with open(path, "w") as file:
                 file.writelines(lines)
+            await file_changed(path)
 
             return {"message": "File updated successfully"}
 
@@ -122,6 +301,7 @@ async def delete_file(file_path: str):
         raise HTTPException(status_code=403, detail="File is ignored in `.llmignore`")
     if os.path.isfile(path):
         os.remove(path)
+        await file_changed(path, DELETED)
         return {"message": "File deleted successfully"}
     else:
         raise HTTPException(status_code=404, detail="File not found")
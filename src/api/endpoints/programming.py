@@ -3,11 +3,18 @@ import ast
 import astunparse
 from enum import Enum
 from fastapi import FastAPI, HTTPException, Query, APIRouter, Body
-from typing import Optional
+from typing import List, Optional
+from fastapi.concurrency import run_in_threadpool
 
-from src.schemas import UpdateFunctionDefinitionRequest, UpdateClassDefinitionRequest, NewFunctionDefinitionRequest, NewClassDefinitionRequest, UpdateFunctionDocstringRequest
-from src.utils import extract_file_summary, get_filesystem_path
+from src.schemas import UpdateFunctionDefinitionRequest, UpdateClassDefinitionRequest, NewFunctionDefinitionRequest, NewClassDefinitionRequest, UpdateFunctionDocstringRequest, SymbolResponseModel, RetrievalResultModel, SimilarCodeRequest, CodeChunkResponseModel
+from src.utils import extract_file_summary_from_path, get_filesystem_path
 from src.core.config import settings
+from src.core.ast_cache import parsed_module_cache
+from src.core.file_events import file_changed
+from src.core.symbol_index import symbol_index
+from src.core.retrieval_index import retrieval_index
+from src.core.vector_index import vector_index
+from src.core.indexer import repo_indexer
 from src.utils import is_llmignored
 
 #TODO:
@@ -35,11 +42,8 @@ async def get_summary(file_path: str, language: Language):
     if not os.path.isfile(full_file_path):
         raise HTTPException(status_code=404, detail="File not found")
 
-    with open(full_file_path, "r") as file:
-        file_content = file.read()
-
     try:
-        summary = extract_file_summary(file_content, language)
+        summary = extract_file_summary_from_path(full_file_path, language)
         return {"summary": summary}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -47,8 +51,9 @@ async def get_summary(file_path: str, language: Language):
         raise HTTPException(status_code=400, detail=f"File {language} syntax is invalid")
 
 
-def extract_python_function_definition(file_content: str, function_name: str):
-    parsed_ast = ast.parse(file_content)
+def extract_python_function_definition(file_content: str, function_name: str, parsed_ast: Optional[ast.Module] = None):
+    if parsed_ast is None:
+        parsed_ast = ast.parse(file_content)
 
     function_node = None
 
@@ -76,20 +81,19 @@ async def get_function_definition(file_path: str,
     if not os.path.isfile(full_file_path):
         raise HTTPException(status_code=404, detail="File not found")
 
-    with open(full_file_path, "r") as file:
-        file_content = file.read()
-
     if language.lower() == Language.python:
         try:
-            return extract_python_function_definition(file_content, function_name)
+            module = parsed_module_cache.get(full_file_path)
+            return extract_python_function_definition(module.source, function_name, module.tree)
         except SyntaxError as e:
             raise HTTPException(status_code=400, detail="Failed to parse the python file")
     else:
         raise HTTPException(status_code=400, detail="Unsupported language")
 
 
-def extract_python_class_definition(file_content: str, class_name: str):
-    parsed_ast = ast.parse(file_content)
+def extract_python_class_definition(file_content: str, class_name: str, parsed_ast: Optional[ast.Module] = None):
+    if parsed_ast is None:
+        parsed_ast = ast.parse(file_content)
 
     class_node = None
 
@@ -115,23 +119,22 @@ async def get_class_definition(language: Language, file_path: str, class_name: s
     if not os.path.isfile(full_file_path):
         raise HTTPException(status_code=404, detail="File not found")
 
-    with open(full_file_path, "r") as file:
-        file_content = file.read()
-
     if language.lower() == Language.python:
         try:
-            return extract_python_class_definition(file_content, class_name)
+            module = parsed_module_cache.get(full_file_path)
+            return extract_python_class_definition(module.source, class_name, module.tree)
         except SyntaxError as e:
             raise HTTPException(status_code=400, detail="Failed to parse the python file")
     else:
         raise HTTPException(status_code=400, detail="Unsupported language")
 
 
-def update_python_function_definition(full_file_path: str, file_content: str, function_name: str, new_function_definition: Optional[str] = None):
-    try:
-        parsed_ast = ast.parse(file_content)
-    except SyntaxError:
-        raise HTTPException(status_code=400, detail="Failed to parse the file")
+def update_python_function_definition(full_file_path: str, file_content: str, function_name: str, new_function_definition: Optional[str] = None, parsed_ast: Optional[ast.Module] = None):
+    if parsed_ast is None:
+        try:
+            parsed_ast = ast.parse(file_content)
+        except SyntaxError:
+            raise HTTPException(status_code=400, detail="Failed to parse the file")
 
     function_node = None
     for node in ast.walk(parsed_ast):
@@ -190,27 +193,29 @@ async def update_function_definition(
     if not os.path.isfile(full_file_path):
         raise HTTPException(status_code=404, detail="File not found")
 
-    with open(full_file_path, "r") as file:
-        file_content = file.read()
-
     if language.lower() == "python":
         try:
-            return update_python_function_definition(full_file_path, 
-                                                     file_content, 
-                                                     function_name, 
-                                                     new_function_definition_request.new_function_definition)
+            module = parsed_module_cache.get(full_file_path)
         except SyntaxError as e:
-            raise HTTPException(status_code=400, detail="Failed to parse the python file")
+            raise HTTPException(status_code=400, detail="Failed to parse the file")
+        result = update_python_function_definition(full_file_path,
+                                                   module.source,
+                                                   function_name,
+                                                   new_function_definition_request.new_function_definition,
+                                                   module.tree)
+        await file_changed(full_file_path)
+        return result
     else:
         raise HTTPException(status_code=400, detail="Unsupported language")
 
 
 
-def update_python_class_definition(full_file_path: str, file_content: str, class_name: str, new_class_definition: Optional[str] = None):
-    try:
-        parsed_ast = ast.parse(file_content)
-    except SyntaxError:
-        raise HTTPException(status_code=400, detail="Failed to parse the file")
+def update_python_class_definition(full_file_path: str, file_content: str, class_name: str, new_class_definition: Optional[str] = None, parsed_ast: Optional[ast.Module] = None):
+    if parsed_ast is None:
+        try:
+            parsed_ast = ast.parse(file_content)
+        except SyntaxError:
+            raise HTTPException(status_code=400, detail="Failed to parse the file")
 
     class_node = None
     for node in ast.walk(parsed_ast):
@@ -266,17 +271,18 @@ async def update_class_definition(
     if not os.path.isfile(full_file_path):
         raise HTTPException(status_code=404, detail="File not found")
 
-    with open(full_file_path, "r") as file:
-        file_content = file.read()
-
     if language.lower() == "python":
         try:
-            return update_python_class_definition(full_file_path, 
-                                                     file_content, 
-                                                     class_name, 
-                                                     new_class_definition_request.new_class_definition)
+            module = parsed_module_cache.get(full_file_path)
         except SyntaxError as e:
-            raise HTTPException(status_code=400, detail="Failed to parse the python file")
+            raise HTTPException(status_code=400, detail="Failed to parse the file")
+        result = update_python_class_definition(full_file_path,
+                                                module.source,
+                                                class_name,
+                                                new_class_definition_request.new_class_definition,
+                                                module.tree)
+        await file_changed(full_file_path)
+        return result
     else:
         raise HTTPException(status_code=400, detail="Unsupported language")
 
@@ -316,6 +322,7 @@ async def insert_new_function_definition(
     if language == Language.python:
         try:
             insert_python_function_definition(full_file_path, file_content, new_function_request.new_function_definition)
+            await file_changed(full_file_path)
         except HTTPException as e:
             raise e
     else:
@@ -358,6 +365,7 @@ async def create_class_definition(
     if language == Language.python:
         try:
             insert_python_class_definition(full_file_path, file_content, new_class_request.new_class_definition)
+            await file_changed(full_file_path)
         except HTTPException as e:
             raise e
         except Exception as e:
@@ -377,13 +385,9 @@ async def get_function_docstring(language: Language, file_path: str, function_na
         if not os.path.isfile(full_file_path):
             raise HTTPException(status_code=404, detail="File not found")
 
-        # Read the content of the file
-        with open(full_file_path, 'r') as file:
-            content = file.read()
-
         if language == Language.python:
-            # Parse the content using the ast module
-            parsed_content = ast.parse(content)
+            # Parse the content using the ast module (cached across requests)
+            parsed_content = parsed_module_cache.get(full_file_path).tree
 
             # Find the specified function and extract its docstring
             for node in parsed_content.body:
@@ -414,16 +418,15 @@ async def update_function_docstring(
         if not os.path.isfile(full_file_path):
             raise HTTPException(status_code=404, detail="File not found")
 
-        with open(full_file_path, 'r') as file:
-            content = file.read()
-
         if language == Language.python:
-            parsed_content = ast.parse(content)
+            # The tree is edited in place, so take a private copy rather than the cached one
+            parsed_content = parsed_module_cache.get(full_file_path).fresh_tree()
             for node in parsed_content.body:
                 if (isinstance(node, ast.FunctionDef) or isinstance(node, ast.AsyncFunctionDef)) and node.name == function_name:
                     node.body[0] = ast.Expr(value=ast.Str(s=update_docstring_request.new_docstring))
                     with open(full_file_path, 'w') as file:
                         file.write(astunparse.unparse(parsed_content))
+                    await file_changed(full_file_path)
                     return {'status': 'success', 'message': 'Function docstring updated'}
             raise HTTPException(status_code=404, detail='Function not found')
         else:
@@ -440,11 +443,8 @@ async def get_class_docstring(language: Language, file_path: str, class_name: st
         if not os.path.isfile(full_file_path):
             raise HTTPException(status_code=404, detail="File not found")
 
-        with open(full_file_path, 'r') as file:
-            content = file.read()
-
         if language == Language.python:
-            parsed_content = ast.parse(content)
+            parsed_content = parsed_module_cache.get(full_file_path).tree
             for node in parsed_content.body:
                 if isinstance(node, ast.ClassDef) and node.name == class_name:
                     docstring = ast.get_docstring(node)
@@ -469,16 +469,14 @@ async def update_class_docstring(
         if not os.path.isfile(full_file_path):
             raise HTTPException(status_code=404, detail="File not found")
 
-        with open(full_file_path, 'r') as file:
-            content = file.read()
-
         if language == Language.python:
-            parsed_content = ast.parse(content)
+            parsed_content = parsed_module_cache.get(full_file_path).fresh_tree()
             for node in parsed_content.body:
                 if isinstance(node, ast.ClassDef) and node.name == class_name:
                     node.body[0] = ast.Expr(value=ast.Str(s=update_docstring_request.new_docstring))
                     with open(full_file_path, 'w') as file:
                         file.write(astunparse.unparse(parsed_content))
+                    await file_changed(full_file_path)
                     return {'status': 'success', 'message': 'Class docstring updated'}
             raise HTTPException(status_code=404, detail='Class not found')
         else:
@@ -495,10 +493,8 @@ async def get_module_docstring(language: Language, file_path: str):
         if not os.path.isfile(full_file_path):
             raise HTTPException(status_code=404, detail="File not found")
 
-        with open(full_file_path, 'r') as file:
-            content = file.read()
         if language == Language.python:
-            parsed_content = ast.parse(content)
+            parsed_content = parsed_module_cache.get(full_file_path).tree
             docstring = ast.get_docstring(parsed_content)
             return {'docstring': docstring}
         else:
@@ -519,16 +515,133 @@ async def update_module_docstring(
         if not os.path.isfile(full_file_path):
             raise HTTPException(status_code=404, detail="File not found")
 
-        with open(full_file_path, 'r') as file:
-            content = file.read()
-
         if language == Language.python:
-            parsed_content = ast.parse(content)
+            parsed_content = parsed_module_cache.get(full_file_path).fresh_tree()
             parsed_content.body.insert(0, ast.Expr(value=ast.Str(s=update_docstring_request.new_docstring)))
             with open(full_file_path, 'w') as file:
                 file.write(astunparse.unparse(parsed_content))
+            await file_changed(full_file_path)
             return {'status': 'success', 'message': 'Module docstring updated'}
         else:
             raise HTTPException(status_code=400, detail="Unsupported language")
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail='File not found')
+
+
+@router.get('/ast_cache/stats')
+async def get_ast_cache_stats():
+    """
+    Hit / miss counters and current size of the parsed module cache shared by
+    the programming endpoints.
+    """
+    return parsed_module_cache.stats()
+
+
+class SymbolKind(str, Enum):
+    class_ = "class"
+    function = "function"
+    method = "method"
+
+
+@router.get("/symbols/search", response_model=List[SymbolResponseModel])
+async def search_symbols(
+    q: str = Query(..., description="Case-insensitive prefix of a symbol name, or of a qualified name like `module.Class.method`"),
+    kind: Optional[SymbolKind] = Query(None, description="Only return symbols of this kind"),
+    limit: int = Query(50, ge=1, le=1000),
+):
+    """
+    Find python classes, functions and methods anywhere in the repo by name,
+    without knowing which file they are defined in.
+    """
+    if not symbol_index.is_built:
+        await run_in_threadpool(symbol_index.ensure_built)
+    symbols = symbol_index.search(q, kind.value if kind is not None else None, limit)
+    return [symbol._asdict() for symbol in symbols]
+
+
+@router.get("/symbols/{qualname}", response_model=SymbolResponseModel)
+async def get_symbol(qualname: str):
+    """
+    Look up a python symbol by its fully qualified name (e.g. `package.module.Class.method`)
+    and return the file and line span where it is defined.
+    """
+    if not symbol_index.is_built:
+        await run_in_threadpool(symbol_index.ensure_built)
+    symbol = symbol_index.get(qualname)
+    if symbol is None:
+        raise HTTPException(status_code=404, detail="Symbol not found")
+    return symbol._asdict()
+
+
+@router.get("/retrieve", response_model=List[RetrievalResultModel])
+async def retrieve_symbols(
+    q: str = Query(..., min_length=1, description="What to look for in words or identifiers, e.g. `where are http retries handled`"),
+    kind: Optional[SymbolKind] = Query(None, description="Only return symbols of this kind"),
+    limit: int = Query(10, ge=1, le=100),
+):
+    """
+    Rank python classes, functions and methods by how well their names,
+    module paths, parameters and docstrings match `q` (BM25), and return the
+    best with the file and line span where they are defined. Identifiers are
+    split on underscores and camelCase, so `user id` finds `get_user_id` and
+    `getUserId`.
+    """
+    if not retrieval_index.is_built:
+        await run_in_threadpool(retrieval_index.ensure_built)
+    results = retrieval_index.search(q, kind.value if kind is not None else None, limit)
+    return [{**result.symbol._asdict(), "docstring": result.docstring, "score": result.score} for result in results]
+
+
+class ChunkKind(str, Enum):
+    module = "module"
+    class_ = "class"
+    function = "function"
+
+
+@router.post("/similar", response_model=List[CodeChunkResponseModel])
+async def find_similar_code(
+    request: SimilarCodeRequest,
+    kind: Optional[ChunkKind] = Query(None, description="Only return chunks of this kind"),
+    limit: int = Query(10, ge=1, le=100),
+):
+    """
+    Find the python code most similar to a snippet. Files are split into
+    chunks at function and class boundaries (module and class level code
+    between definitions forms chunks of its own), and chunks are compared
+    with the snippet by the identifiers, words and token pairs they share.
+    Returns the file and line span of each chunk with its cosine similarity.
+    """
+    if not vector_index.is_built:
+        await run_in_threadpool(vector_index.ensure_built)
+    results = await run_in_threadpool(vector_index.search, request.snippet, limit,
+                                      kind.value if kind is not None else None)
+    return [{**chunk._asdict(), "score": score} for chunk, score in results]
+
+
+@router.get("/similar/stats")
+async def get_vector_index_stats():
+    """
+    Number of files and chunks in the index used by `/programming/similar`,
+    and whether it is memory-mapped from disk.
+    """
+    return vector_index.stats()
+
+
+@router.get("/index/progress")
+async def get_index_progress():
+    """
+    Progress of the background job that parses every python file in the repo
+    to build the symbol index.
+    """
+    return repo_indexer.progress()
+
+
+@router.post("/index/rebuild")
+async def rebuild_index():
+    """
+    Re-index every python file in the repo in the background. Use
+    `/programming/index/progress` to follow the rebuild.
+    """
+    if not repo_indexer.start():
+        raise HTTPException(status_code=409, detail="Indexing is already in progress")
+    return repo_indexer.progress()
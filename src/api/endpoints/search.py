@@ -0,0 +1,93 @@
+import json
+import os
+import re
+from typing import Iterator, List, Optional
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+
+from src.schemas import SearchResponseModel
+from src.core.regex_scan import ScanMatch, compile_scan_pattern, regex_scanner
+from src.core.search_index import search_index
+from src.utils import get_filesystem_path, is_llmignored
+
+router = APIRouter()
+
+
+@router.get("/", response_model=SearchResponseModel)
+async def search(
+    q: str = Query(..., min_length=1, description="Text to search for, or a python regular expression if `regex` is set"),
+    regex: bool = Query(False, description="Treat `q` as a regular expression"),
+    ignore_case: bool = Query(False, description="Ignore case distinctions"),
+    include: Optional[List[str]] = Query(None, description="Only search files whose name or path matches one of these globs, e.g. `*.py` or `src/**`"),
+    context_lines: int = Query(0, ge=0, le=50, description="Lines of context to return before and after each match"),
+    max_results: int = Query(100, ge=1, le=10000, description="Maximum number of matching lines to return"),
+):
+    """
+    Search the text files in the repo for lines matching `q`. Served from an
+    in-memory trigram index, so only files that can contain a match are read.
+    The index is rebuilt first if `.llmignore` changed.
+    Files ignored in `.llmignore`, binary files and very large files are not
+    searched.
+    """
+    if not search_index.is_current:
+        # Not built yet, or `.llmignore` changed since it was
+        await run_in_threadpool(search_index.ensure_built)
+    try:
+        result = await run_in_threadpool(search_index.search, q, regex, ignore_case, include, context_lines, max_results)
+    except re.error as e:
+        raise HTTPException(status_code=400, detail=f"Invalid regular expression: {e}")
+    return {
+        "matches": [match._asdict() for match in result.matches],
+        "candidate_files": result.candidate_files,
+        "files_with_matches": result.files_with_matches,
+        "truncated": result.truncated,
+    }
+
+
+def iter_scan_ndjson(root: str,
+                     pattern: "re.Pattern[bytes]",
+                     include: Optional[List[str]],
+                     max_results: int) -> Iterator[str]:
+    for event in regex_scanner.scan(root, pattern, include, max_results):
+        if isinstance(event, ScanMatch):
+            yield json.dumps(event._asdict()) + "\n"
+        else:
+            yield json.dumps({"done": True, **event._asdict()}) + "\n"
+
+
+@router.get("/scan")
+async def scan(
+    q: str = Query(..., min_length=1, description="Python regular expression to search for"),
+    path: str = Query("", description="Only search files in this directory"),
+    ignore_case: bool = Query(False, description="Ignore case distinctions"),
+    include: Optional[List[str]] = Query(None, description="Only search files whose name or path matches one of these globs, e.g. `*.py` or `src/**`"),
+    max_results: int = Query(100, ge=1, le=10000, description="Stop after this many matching lines"),
+):
+    """
+    Search for lines matching the regular expression `q` by scanning every
+    file rather than using the index, for patterns the index can't narrow
+    down. Streams one `{path, line_number, column, line}` JSON line per match
+    as files are scanned, then a `{done, files_scanned, matches, truncated,
+    timed_out}` line; `timed_out` is set if scanning some files took too
+    long, e.g. because of catastrophic backtracking. Files ignored in `.llmignore` and binary files are not searched.
+    Patterns match bytes, so `\\w` and `ignore_case` only cover ASCII.
+    """
+    try:
+        pattern = compile_scan_pattern(q, ignore_case)
+    except re.error as e:
+        raise HTTPException(status_code=400, detail=f"Invalid regular expression: {e}")
+    root = get_filesystem_path(path)
+    if not os.path.isdir(root) or is_llmignored(root, is_dir=True):
+        raise HTTPException(status_code=404, detail="Directory not found")
+    return StreamingResponse(iter_scan_ndjson(root, pattern, include, max_results),
+                             media_type="application/x-ndjson")
+
+
+@router.get("/stats")
+async def get_search_index_stats():
+    """
+    Number of files and distinct trigrams in the search index.
+    """
+    return search_index.stats()
@@ -4,6 +4,7 @@ import shutil
 
 from src.schemas import MoveRequest
 from src.utils import is_llmignored
+from src.core.file_events import notify_file_moved
 
 router = APIRouter()
 
@@ -16,6 +17,7 @@ async def move_file_or_directory(move_request: MoveRequest):
         raise HTTPException(status_code=404, detail="File is ignored in `.llmignore`")
     if src_path.exists():
         shutil.move(src_path, dest_path)
+        notify_file_moved(str(src_path.absolute()), str(dest_path.absolute()))
         return {"message": "Moved successfully"}
     else:
         raise HTTPException(status_code=404, detail="Source not found")
@@ -0,0 +1,124 @@
+import ast
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from src.core.config import settings
+from src.core.file_events import register_file_change_listener
+
+
+class ParsedModule:
+    """
+    A parsed source file together with the stat key it was parsed from.
+    `derived` holds values computed from the tree (e.g. the file summary) so
+    they are only computed once per version of the file.
+
+    The tree is shared between requests and must not be mutated. Callers that
+    need to edit the AST should use `fresh_tree()`.
+    """
+
+    def __init__(self, path: str, key: Tuple[int, int], source: str, tree: ast.Module):
+        self.path = path
+        self.key = key
+        self.source = source
+        self.tree = tree
+        self.derived: Dict[str, Any] = {}
+
+    @property
+    def size_bytes(self) -> int:
+        # The stat size of the source is used as the cost of an entry. The AST
+        # itself is several times larger, but scales linearly with the source.
+        return self.key[1]
+
+    def fresh_tree(self) -> ast.Module:
+        return ast.parse(self.source)
+
+
+class ParsedModuleCache:
+    """
+    Bounded LRU cache of parsed python modules keyed by filesystem path and
+    invalidated whenever the file's (st_mtime_ns, st_size) changes.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, ParsedModule]" = OrderedDict()
+        self._current_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, filesystem_path: str) -> ParsedModule:
+        """
+        Return the parsed module for `filesystem_path`, parsing it if the file
+        is not cached or has changed on disk. Raises `FileNotFoundError` and
+        `SyntaxError` like reading and parsing the file directly would.
+        """
+        stat = os.stat(filesystem_path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(filesystem_path)
+            if entry is not None and entry.key == key:
+                self._entries.move_to_end(filesystem_path)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        with open(filesystem_path, "r") as file:
+            stat = os.fstat(file.fileno())
+            source = file.read()
+        tree = ast.parse(source)
+        entry = ParsedModule(filesystem_path, (stat.st_mtime_ns, stat.st_size), source, tree)
+
+        with self._lock:
+            self._remove(filesystem_path)
+            if entry.size_bytes <= self.max_bytes:
+                self._entries[filesystem_path] = entry
+                self._current_bytes += entry.size_bytes
+                while self._current_bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._current_bytes -= evicted.size_bytes
+                    self.evictions += 1
+        return entry
+
+    def get_derived(self, filesystem_path: str, name: str, compute: Callable[[ParsedModule], Any]) -> Any:
+        """
+        Return a value derived from the parsed module, computing it with
+        `compute` the first time it is requested for the current file version.
+        """
+        entry = self.get(filesystem_path)
+        if name not in entry.derived:
+            entry.derived[name] = compute(entry)
+        return entry.derived[name]
+
+    def invalidate(self, filesystem_path: str) -> None:
+        with self._lock:
+            self._remove(filesystem_path)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._current_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "current_bytes": self._current_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _remove(self, filesystem_path: str) -> Optional[ParsedModule]:
+        entry = self._entries.pop(filesystem_path, None)
+        if entry is not None:
+            self._current_bytes -= entry.size_bytes
+        return entry
+
+
+parsed_module_cache = ParsedModuleCache(settings.AST_CACHE_MAX_BYTES)
+register_file_change_listener(parsed_module_cache.invalidate)
@@ -0,0 +1,123 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+from src.core.config import settings
+from src.core.file_events import register_file_event_listener, CREATED, MODIFIED, DELETED
+from src.core.llmignore import relative_to_repo_root
+
+
+# (mtime in ns, size) of a path, or None if it doesn't exist
+FileState = Optional[Tuple[int, int]]
+
+
+def _file_state(filesystem_path: str) -> FileState:
+    try:
+        st = os.lstat(filesystem_path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class ChangeFeed:
+    """
+    Ordered log of changes to files in the target repo. Every event gets a
+    monotonically increasing sequence number, the most recent `max_events`
+    are kept so clients can catch up with `since=<seq>` after reconnecting,
+    and subscribers are pushed new events as they happen.
+
+    The same change is often reported twice, once by the endpoint that made
+    it and again by the filesystem watcher. A repeat of an event for the same
+    path within `coalesce_seconds` is dropped as such an echo only if the
+    path's mtime and size are the same as when the first was recorded, so
+    separate writes in quick succession are all reported.
+    """
+
+    def __init__(self, root: str, max_events: int, coalesce_seconds: float):
+        self.root = root.rstrip("/")
+        self.coalesce_seconds = coalesce_seconds
+        self._events: Deque[Dict[str, Any]] = deque(maxlen=max_events)
+        self._last_seq = 0
+        # path -> (change, time, file state) of its last event
+        self._recent: Dict[str, Tuple[str, float, FileState]] = {}
+        self._subscribers: Set[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]] = set()
+        self._lock = threading.Lock()
+
+    @property
+    def last_seq(self) -> int:
+        return self._last_seq
+
+    @property
+    def oldest_seq(self) -> Optional[int]:
+        """
+        Sequence number of the oldest event still held. Clients whose last seen
+        event is older than this have missed events and should rescan.
+        """
+        with self._lock:
+            return self._events[0]["seq"] if self._events else None
+
+    def record(self, filesystem_path: str, change: str, dest_path: Optional[str] = None) -> None:
+        if not self._in_repo(filesystem_path) and not (dest_path and self._in_repo(dest_path)):
+            return
+        now = time.time()
+        path = relative_to_repo_root(filesystem_path)
+        state = _file_state(filesystem_path)
+        with self._lock:
+            last_change, last_time, last_state = self._recent.get(path, (None, 0.0, None))
+            if now - last_time < self.coalesce_seconds and state == last_state and (
+                last_change == change or (last_change == CREATED and change == MODIFIED)
+            ):
+                return
+            self._recent[path] = (change, now, state)
+            if len(self._recent) > 4 * (self._events.maxlen or 1):
+                self._recent = {p: v for p, v in self._recent.items() if now - v[1] < self.coalesce_seconds}
+
+            self._last_seq += 1
+            event = {"seq": self._last_seq, "type": change, "path": path, "time": now}
+            if dest_path is not None:
+                event["dest_path"] = relative_to_repo_root(dest_path)
+            self._events.append(event)
+            if dest_path is not None:
+                # The watcher sees a move as a delete and a create
+                self._recent[path] = (DELETED, now, None)
+                self._recent[event["dest_path"]] = (CREATED, now, _file_state(dest_path))
+            subscribers = list(self._subscribers)
+
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                # The subscriber's event loop has been closed
+                self.unsubscribe(queue)
+
+    def events_since(self, since: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [event for event in self._events if event["seq"] > since]
+
+    def subscribe(self) -> asyncio.Queue:
+        """
+        Return a queue that receives every event recorded from now on. Must be
+        called from the event loop that will read the queue.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        with self._lock:
+            self._subscribers.add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        with self._lock:
+            self._subscribers = {subscriber for subscriber in self._subscribers if subscriber[1] is not queue}
+
+    def _in_repo(self, filesystem_path: str) -> bool:
+        return filesystem_path == self.root or filesystem_path.startswith(self.root + "/")
+
+
+change_feed = ChangeFeed(
+    settings.REPO_ROOT,
+    max_events=settings.CHANGE_FEED_MAX_EVENTS,
+    coalesce_seconds=settings.CHANGE_FEED_COALESCE_MS / 1000,
+)
+register_file_event_listener(change_feed.record)
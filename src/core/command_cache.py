@@ -0,0 +1,177 @@
+import hashlib
+import os
+import stat
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional
+
+from src.core.config import settings
+from src.core.file_events import register_file_change_listener
+from src.core.llmignore import LLMIgnoreMatcher, get_llmignore_matcher, relative_to_repo_root
+from src.core.tree_index import tree_index
+
+
+class RepoFingerprinter:
+    """
+    Cheap fingerprint of the contents of files and directories: a Merkle hash
+    over the names, sizes and mtimes of everything inside them, without
+    reading any file contents. Entries whose name is in `ignored_names` (VCS
+    metadata and caches that commands like pytest write on every run) are
+    skipped, and `.llmignore`d directories are pruned like `walk_directory`
+    does. Changes there, e.g. to an installed virtualenv, are covered by
+    `dependency_files` (repo-relative lock files and the like), which are
+    part of every fingerprint.
+
+    Directory hashes are memoized and dropped for a directory and its
+    parents whenever a file change is reported. Changes made outside the API
+    are only reported for paths the tree index's filesystem watcher covers
+    while it is running, so nothing else is memoized.
+    """
+
+    def __init__(self, ignored_names: Iterable[str], dependency_files: Iterable[str] = ()):
+        self.ignored_names = frozenset(ignored_names)
+        self.dependency_files = list(dependency_files)
+        self._directories: Dict[str, str] = {}
+        # Bumped on every change, so hashes computed while one happened
+        # aren't memoized
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def fingerprint_inputs(self, filesystem_paths: Iterable[str]) -> str:
+        """
+        Fingerprint of the given files and directories and of the dependency
+        files.
+        """
+        digest = hashlib.sha1()
+        paths = list(filesystem_paths) + [os.path.join(settings.REPO_ROOT, path) for path in self.dependency_files]
+        for path in paths:
+            digest.update(f"{path}\0{self.fingerprint(path)}\n".encode("utf-8", "surrogateescape"))
+        return digest.hexdigest()
+
+    def fingerprint(self, filesystem_path: str) -> str:
+        path = os.path.normpath(filesystem_path)
+        try:
+            st = os.lstat(path)
+        except OSError:
+            return "missing"
+        if stat.S_ISDIR(st.st_mode):
+            with self._lock:
+                generation = self._generation
+            # Only paths the watcher covers get change notifications
+            memoize = tree_index.watching and tree_index.covers(path)
+            return self._hash_directory(path, get_llmignore_matcher(), generation, memoize)
+        return self._hash_file_stat(st)
+
+    def invalidate(self, filesystem_path: str) -> None:
+        path = os.path.normpath(filesystem_path)
+        if path == os.path.normpath(str(settings.LLMIGNORE_PATH)):
+            # Which directories are pruned changed
+            self.clear()
+            return
+        prefix = path + "/"
+        with self._lock:
+            self._generation += 1
+            if not self._directories:
+                return
+            # The path's own subtree (e.g. a deleted or moved directory) and
+            # every directory containing it
+            for directory in [d for d in self._directories if d == path or d.startswith(prefix)]:
+                del self._directories[directory]
+            while True:
+                self._directories.pop(path, None)
+                parent = os.path.dirname(path)
+                if parent == path:
+                    break
+                path = parent
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._directories.clear()
+
+    @staticmethod
+    def _hash_file_stat(st: os.stat_result) -> str:
+        return f"{st.st_mtime_ns}:{st.st_size}"
+
+    def _hash_directory(self, path: str, matcher: LLMIgnoreMatcher, generation: int, memoize: bool) -> str:
+        if memoize:
+            with self._lock:
+                memoized = self._directories.get(path)
+            if memoized is not None:
+                return memoized
+        digest = hashlib.sha1()
+        try:
+            with os.scandir(path) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            return "missing"
+        for entry in entries:
+            if entry.name in self.ignored_names:
+                continue
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+                if matcher and matcher.match(relative_to_repo_root(entry.path), is_dir):
+                    continue
+                if is_dir:
+                    child = "d" + self._hash_directory(entry.path, matcher, generation, memoize)
+                else:
+                    child = "f" + self._hash_file_stat(entry.stat(follow_symlinks=False))
+            except FileNotFoundError:
+                continue
+            digest.update(f"{entry.name}\0{child}\n".encode("utf-8", "surrogateescape"))
+        result = digest.hexdigest()
+        if memoize:
+            with self._lock:
+                if self._generation == generation:
+                    self._directories[path] = result
+        return result
+
+
+class CommandResultCache:
+    """
+    LRU cache of command results, for commands marked `cacheable` in
+    `command_config.yml`.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
+
+
+repo_fingerprinter = RepoFingerprinter(settings.COMMAND_CACHE_IGNORED_NAMES, settings.COMMAND_CACHE_DEPENDENCY_FILES)
+register_file_change_listener(repo_fingerprinter.invalidate)
+
+command_result_cache = CommandResultCache(settings.COMMAND_CACHE_MAX_ENTRIES)
@@ -0,0 +1,292 @@
+import asyncio
+import itertools
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from src.core.config import settings
+from src.core.container_pool import CommandStream
+
+
+_DONE = object()
+
+
+class CommandState:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.queued = 0
+        # Jobs handed to the thread pool, whether or not a thread has picked them up yet
+        self.active = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+
+class PendingJob(NamedTuple):
+    priority: int
+    seq: int
+    state: CommandState
+    future: Future
+    fn: Callable[..., Any]
+    args: Tuple[Any, ...]
+    queued_at: float
+
+
+class CommandExecutor:
+    """
+    Runs blocking command executions (which wait on Docker) on a bounded pool
+    of `max_workers` threads so they never block the event loop, and so a
+    burst of long commands can't starve the threads FastAPI uses for other
+    endpoints.
+
+    Each command name also has its own concurrency limit, capped at one less
+    than `max_workers`, so one busy command (e.g. the shards of a sharded
+    test run) can't occupy every worker. Jobs wait in a single queue and whenever a
+    worker is free the highest priority job (oldest first among equals)
+    whose command is under its limit is started.
+    """
+
+    def __init__(self, max_workers: int, default_limit: int):
+        self.max_workers = max_workers
+        self.default_limit = default_limit
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._commands: Dict[str, CommandState] = {}
+        self._pending: List[PendingJob] = []
+        self._active = 0
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def set_limit(self, name: str, limit: Optional[int]) -> None:
+        """
+        Set how many runs of the command `name` may execute at once, or reset
+        it to the default if `limit` is None.
+        """
+        with self._lock:
+            self._state(name).limit = self._cap(limit or self.default_limit)
+            self._dispatch()
+
+    def submit(self, name: str, fn: Callable[..., Any], *args: Any, priority: int = 0) -> Future:
+        """
+        Queue `fn(*args)` as a run of the command `name`; higher `priority`
+        runs first. The returned future can be cancelled until the job starts
+        running.
+        """
+        future: Future = Future()
+        with self._lock:
+            state = self._state(name)
+            state.queued += 1
+            self._pending.append(PendingJob(-priority, next(self._seq), state, future, fn, args, time.monotonic()))
+            self._dispatch()
+        return future
+
+    async def run(self, name: str, fn: Callable[..., Any], *args: Any) -> Any:
+        """
+        Run `fn(*args)` as a run of the command `name` and wait for its result
+        without blocking the event loop. If the awaiting task is cancelled
+        (e.g. the client disconnected) before the job starts, it is dropped
+        from the queue.
+        """
+        return await asyncio.wrap_future(self.submit(name, fn, *args))
+
+    async def stream(self,
+                     name: str,
+                     open_stream: Callable[[], CommandStream],
+                     max_buffered_chunks: int = 64,
+                     timeout_seconds: Optional[float] = None,
+                     on_finish: Optional[Callable[[Dict[str, Optional[float]]], None]] = None
+                     ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Run the command started by `open_stream()` as a run of the command
+        `name`, yielding ("output", bytes) for each chunk of output as it is
+        produced and finally ("exit", exit_code), or ("timeout",
+        timeout_seconds) if the command was killed for running longer than
+        `timeout_seconds`.
+
+        At most `max_buffered_chunks` chunks are held waiting for the consumer.
+        If the consumer stops iterating early (e.g. the client disconnected)
+        the command is cancelled.
+
+        If the command started, `on_finish` is called on the executor thread
+        with the resources it used, in the same form as `Job.usage()`.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        credits = threading.Semaphore(max_buffered_chunks)
+        cancelled = threading.Event()
+        timed_out = threading.Event()
+        opened: List[CommandStream] = []
+
+        def put(item: Any) -> None:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                # The consumer's event loop has been closed
+                cancelled.set()
+
+        def pump() -> Optional[int]:
+            if cancelled.is_set():
+                return None
+            start = time.monotonic()
+            command_stream = open_stream()
+            started = time.monotonic()
+            opened.append(command_stream)
+            if cancelled.is_set():
+                command_stream.cancel()
+
+            def expire() -> None:
+                timed_out.set()
+                command_stream.cancel()
+
+            timer = threading.Timer(timeout_seconds, expire) if timeout_seconds is not None else None
+            if timer is not None:
+                timer.daemon = True
+                timer.start()
+            output_bytes = 0
+            try:
+                for chunk in command_stream:
+                    output_bytes += len(chunk)
+                    while not credits.acquire(timeout=0.5):
+                        if cancelled.is_set():
+                            command_stream.cancel()
+                            break
+                    put(chunk)
+            finally:
+                if timer is not None:
+                    timer.cancel()
+                if on_finish is not None:
+                    on_finish({
+                        "queue_wait_seconds": start - submitted_at,
+                        "start_latency_seconds": started - start,
+                        "wall_seconds": time.monotonic() - started,
+                        "cpu_seconds": command_stream.resource_usage.cpu_seconds,
+                        "peak_memory_bytes": command_stream.resource_usage.peak_memory_bytes,
+                        "output_bytes": output_bytes,
+                    })
+            return command_stream.exit_code
+
+        submitted_at = time.monotonic()
+
+        future = self.submit(name, pump)
+        future.add_done_callback(lambda _: put(_DONE))
+        try:
+            while True:
+                item = await queue.get()
+                if item is _DONE:
+                    break
+                credits.release()
+                yield "output", item
+            exit_code = future.result()
+            if timed_out.is_set():
+                yield "timeout", timeout_seconds
+            else:
+                yield "exit", exit_code
+        finally:
+            if not future.done():
+                cancelled.set()
+                future.cancel()
+                if opened:
+                    # Killing the command blocks on Docker, so don't wait for it
+                    loop.run_in_executor(None, opened[0].cancel)
+
+    def _state(self, name: str) -> CommandState:
+        state = self._commands.get(name)
+        if state is None:
+            state = self._commands[name] = CommandState(self._cap(self.default_limit))
+        return state
+
+    def _cap(self, limit: int) -> int:
+        # Leave a worker for other commands
+        return max(1, min(limit, self.max_workers - 1))
+
+    def _dispatch(self) -> None:
+        # Must be called with the lock held
+        while self._active < self.max_workers:
+            eligible = [job for job in self._pending if job.state.active < job.state.limit or job.future.cancelled()]
+            if not eligible:
+                return
+            job = min(eligible)
+            self._pending.remove(job)
+            job.state.queued -= 1
+            if job.future.cancelled():
+                job.state.cancelled += 1
+                continue
+            self._active += 1
+            job.state.active += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="command")
+            self._executor.submit(self._run_job, job)
+
+    def _run_job(self, job: PendingJob) -> None:
+        state, future = job.state, job.future
+        if not future.set_running_or_notify_cancel():
+            with self._lock:
+                self._active -= 1
+                state.active -= 1
+                state.cancelled += 1
+                self._dispatch()
+            return
+
+        wait_seconds = time.monotonic() - job.queued_at
+        with self._lock:
+            state.running += 1
+            state.total_wait_seconds += wait_seconds
+            state.max_wait_seconds = max(state.max_wait_seconds, wait_seconds)
+        try:
+            result = job.fn(*job.args)
+        except BaseException as e:
+            future.set_exception(e)
+            failed = True
+        else:
+            future.set_result(result)
+            failed = False
+        finally:
+            with self._lock:
+                self._active -= 1
+                state.active -= 1
+                state.running -= 1
+                state.completed += 1
+                state.failed += failed
+                self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            commands = {}
+            for name, state in self._commands.items():
+                started = state.completed + state.running
+                commands[name] = {
+                    "limit": state.limit,
+                    "running": state.running,
+                    # Waiting for a free slot for the command or for a free worker thread
+                    "queued": state.queued + state.active - state.running,
+                    "completed": state.completed,
+                    "failed": state.failed,
+                    "cancelled": state.cancelled,
+                    "mean_wait_seconds": state.total_wait_seconds / started if started else 0.0,
+                    "max_wait_seconds": state.max_wait_seconds,
+                }
+        return {
+            "max_workers": self.max_workers,
+            "running": sum(command["running"] for command in commands.values()),
+            "queued": sum(command["queued"] for command in commands.values()),
+            "commands": commands,
+        }
+
+    def shutdown(self) -> None:
+        """
+        Stop the worker threads once running jobs finish. Jobs submitted
+        afterwards start a new pool of threads.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+command_executor = CommandExecutor(
+    max_workers=settings.COMMAND_WORKERS,
+    default_limit=settings.COMMAND_MAX_CONCURRENCY,
+)
@@ -0,0 +1,142 @@
+import codecs
+import os
+import tempfile
+import threading
+from typing import IO, Iterator, Optional
+
+
+class CommandOutput:
+    """
+    Output of a command, captured with bounded memory. Output is kept in
+    memory until it exceeds `memory_limit` bytes, after which it is moved to
+    an anonymous temporary file in `spill_dir` and appended there. The first
+    `head_bytes` and last `tail_bytes` are always kept in memory for
+    `summary()`, so memory use stays bounded however much a command prints.
+    """
+
+    def __init__(self, memory_limit: int, head_bytes: int, tail_bytes: int, spill_dir: Optional[str] = None):
+        self.memory_limit = memory_limit
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.spill_dir = spill_dir
+        self.size = 0
+        self._buffer: Optional[bytearray] = bytearray()
+        self._file: Optional[IO[bytes]] = None
+        self._head = bytearray()
+        self._tail = bytearray()
+        self._closed = False
+        self._lock = threading.Lock()
+
+    @property
+    def spilled(self) -> bool:
+        return self._buffer is None
+
+    @property
+    def memory_bytes(self) -> int:
+        """
+        Bytes of output held in memory that `spill()` would move to disk,
+        besides the bounded head and tail.
+        """
+        with self._lock:
+            return len(self._buffer) if self._buffer is not None else 0
+
+    def spill(self) -> None:
+        """
+        Move output held in memory to the temporary file now, e.g. once the
+        command has finished and its output is kept for later reads. Only
+        the head and tail stay in memory.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            if self._buffer is not None and self.size:
+                self._spill()
+            del self._tail[:-self.tail_bytes]
+
+    def append(self, chunk: bytes) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            if len(self._head) < self.head_bytes:
+                self._head += chunk[:self.head_bytes - len(self._head)]
+            self._tail += chunk
+            # Trim the ring buffer in bulk rather than on every chunk
+            if len(self._tail) > 2 * self.tail_bytes:
+                del self._tail[:-self.tail_bytes]
+
+            if self._buffer is not None and self.size + len(chunk) > self.memory_limit:
+                self._spill()
+            if self._buffer is not None:
+                self._buffer += chunk
+            else:
+                os.pwrite(self._file.fileno(), chunk, self.size)
+            self.size += len(chunk)
+
+    def _spill(self) -> None:
+        self._file = tempfile.TemporaryFile(prefix="command-output-", dir=self.spill_dir)
+        os.pwrite(self._file.fileno(), self._buffer, 0)
+        self._buffer = None
+
+    def read(self, offset: int = 0, limit: Optional[int] = None) -> bytes:
+        """
+        Read up to `limit` bytes of output starting at byte `offset`.
+        """
+        with self._lock:
+            end = self.size if limit is None else min(self.size, offset + limit)
+            if offset >= end or self._closed:
+                return b""
+            if self._buffer is not None:
+                return bytes(self._buffer[offset:end])
+            return os.pread(self._file.fileno(), end - offset, offset)
+
+    def iter_lines(self, page_bytes: int = 1024 * 1024) -> Iterator[str]:
+        """
+        Yield the output's lines (without line endings), reading it a page at
+        a time so spilled output is never loaded into memory at once.
+        """
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        pending = ""
+        offset = 0
+        while True:
+            data = self.read(offset, page_bytes)
+            if not data:
+                break
+            offset += len(data)
+            lines = (pending + decoder.decode(data)).split("\n")
+            pending = lines.pop()
+            yield from lines
+        pending += decoder.decode(b"", final=True)
+        if pending:
+            yield pending
+
+    def summary(self) -> str:
+        """
+        The whole output if it fits in `head_bytes + tail_bytes`, otherwise
+        the head and tail with a marker saying how much was left out.
+        """
+        with self._lock:
+            if self.size <= self.head_bytes + self.tail_bytes:
+                rest = self.size - len(self._head)
+                data = bytes(self._head) + (bytes(self._tail[-rest:]) if rest else b"")
+                return data.decode("utf-8", errors="replace")
+            head = bytes(self._head).decode("utf-8", errors="replace")
+            tail = bytes(self._tail[-self.tail_bytes:]).decode("utf-8", errors="replace")
+            omitted = self.size - len(self._head) - self.tail_bytes
+        return f"{head}\n... [{omitted} bytes omitted] ...\n{tail}"
+
+    @property
+    def truncated(self) -> bool:
+        return self.size > self.head_bytes + self.tail_bytes
+
+    def close(self) -> None:
+        """
+        Discard the output and delete the temporary file, if any.
+        """
+        with self._lock:
+            self._closed = True
+            self._buffer = bytearray()
+            self._head = bytearray()
+            self._tail = bytearray()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,72 @@
+import math
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+
+# What is recorded for each command run, see `Job.usage()`
+USAGE_METRICS = (
+    "queue_wait_seconds",
+    "start_latency_seconds",
+    "wall_seconds",
+    "cpu_seconds",
+    "peak_memory_bytes",
+    "output_bytes",
+)
+
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """
+    Nearest-rank percentile of a non-empty sorted list.
+    """
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class CommandUsageStats:
+    """
+    Resource usage of the most recent `max_samples` runs of each command,
+    summarized as percentiles for capacity planning and choosing timeouts.
+    """
+
+    def __init__(self, max_samples: int):
+        self.max_samples = max_samples
+        self._samples: Dict[str, Deque[Dict[str, Optional[float]]]] = {}
+        self._runs: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, command_name: str, usage: Dict[str, Optional[float]]) -> None:
+        with self._lock:
+            samples = self._samples.get(command_name)
+            if samples is None:
+                samples = self._samples[command_name] = deque(maxlen=self.max_samples)
+            samples.append(usage)
+            self._runs[command_name] = self._runs.get(command_name, 0) + 1
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            snapshot = {name: list(samples) for name, samples in self._samples.items()}
+            runs = dict(self._runs)
+
+        stats = {}
+        for name, samples in snapshot.items():
+            command_stats: Dict[str, Any] = {"runs": runs[name], "samples": len(samples)}
+            for metric in USAGE_METRICS:
+                values = sorted(sample[metric] for sample in samples if sample.get(metric) is not None)
+                if not values:
+                    command_stats[metric] = None
+                    continue
+                command_stats[metric] = {
+                    **{f"p{p}": percentile(values, p) for p in PERCENTILES},
+                    "max": values[-1],
+                    "mean": sum(values) / len(values),
+                }
+            stats[name] = command_stats
+        return stats
+
+    def clear(self) -> None:
+        with self._lock:
+            self._samples.clear()
+            self._runs.clear()
@@ -33,6 +33,151 @@ class Settings(BaseSettings):
 
     TARGET_REPO_PATH: str
 
+    # Upper bound on the total source size of python files kept parsed in memory
+    AST_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+
+    # Upper bound on the memory used by the line offsets of files kept for
+    # reading line windows without reading whole files (8 bytes per line)
+    LINE_INDEX_CACHE_MAX_BYTES: int = 16 * 1024 * 1024
+
+    # Whole-file reads return text files up to this size as JSON; larger and
+    # binary files are streamed as they are
+    FILE_JSON_MAX_BYTES: int = 1024 * 1024
+
+    # Build the repo-wide python symbol index when the app starts rather than
+    # on the first symbol lookup
+    SYMBOL_INDEX_ON_STARTUP: bool = True
+
+    # Number of processes used to parse files when indexing the repo
+    # (defaults to the number of CPUs) and files sent to a process at a time
+    INDEXER_WORKERS: Optional[int] = None
+    INDEXER_BATCH_SIZE: int = 64
+
+    # Build the trigram index used by `/search` when the app starts rather
+    # than on the first search. Files larger than SEARCH_INDEX_MAX_FILE_BYTES
+    # are not indexed, and so not searched.
+    SEARCH_INDEX_ON_STARTUP: bool = True
+    SEARCH_INDEX_MAX_FILE_BYTES: int = 1024 * 1024
+
+    # Number of processes used by `/search/scan` to scan files (defaults to
+    # the number of CPUs) and files sent to a process at a time. A batch
+    # still running after SEARCH_SCAN_BATCH_TIMEOUT_SECONDS (e.g. a regex
+    # with catastrophic backtracking) is interrupted and ends the scan.
+    SEARCH_SCAN_WORKERS: Optional[int] = None
+    SEARCH_SCAN_BATCH_SIZE: int = 32
+    SEARCH_SCAN_BATCH_TIMEOUT_SECONDS: float = 30
+
+    # Build the index of python code chunks used by `/programming/similar`
+    # when the app starts. Chunks are embedded as VECTOR_INDEX_DIMENSIONS
+    # hashed features. The index is saved to VECTOR_INDEX_DIR, if set, and
+    # memory-mapped from there on the next start, then only changed files
+    # are re-embedded. Only kept in memory if unset.
+    VECTOR_INDEX_ON_STARTUP: bool = True
+    VECTOR_INDEX_DIMENSIONS: int = 1024
+    VECTOR_INDEX_DIR: Optional[str] = None
+
+    # When to build the in-memory file tree used for directory listings and
+    # file structure requests: "eager" (at startup), "lazy" (on first use) or
+    # "off" (always read from disk). Once built it is kept current by a
+    # filesystem watcher that batches changes over FILE_WATCHER_DEBOUNCE_MS.
+    TREE_INDEX_BUILD: str = "lazy"
+    FILE_WATCHER_DEBOUNCE_MS: int = 50
+
+    # Number of recent file change events kept for clients catching up with
+    # `/context/changes?since=<seq>`, and the window within which the
+    # watcher's report of a change already recorded (same mtime and size) is
+    # dropped
+    CHANGE_FEED_MAX_EVENTS: int = 10000
+    CHANGE_FEED_COALESCE_MS: int = 1000
+
+    # How commands from `command_config.yml` are run, unless the command sets
+    # its own `backend`: "docker" starts a new container per command,
+    # "docker-pool" execs commands in a pool of up to CONTAINER_POOL_SIZE
+    # long-lived containers, each replaced after CONTAINER_POOL_MAX_USES
+    # commands, and "local" runs them as subprocesses of the server in
+    # REPO_ROOT. Pooled containers are kept running with `tail -f /dev/null`
+    # in place of the image's entrypoint, so the image must have `tail`; the
+    # entrypoint is run as part of each exec'd command instead, and anything
+    # it does once at container start happens on every command.
+    COMMAND_BACKEND: str = "docker"
+    CONTAINER_POOL_SIZE: int = 2
+    CONTAINER_POOL_MAX_USES: int = 50
+    # Measure the CPU time of commands run in pooled containers from the
+    # container's stats, at the cost of two Docker API calls per command
+    COMMAND_CONTAINER_STATS: bool = True
+
+    # Resource limits of commands run with the "local" backend: CPU time,
+    # address space, and bytes of output (and of any file they write) before
+    # they are killed
+    LOCAL_COMMAND_CPU_SECONDS: int = 60
+    LOCAL_COMMAND_MEMORY_BYTES: int = 2 * 1024 * 1024 * 1024
+    LOCAL_COMMAND_MAX_OUTPUT_BYTES: int = 64 * 1024 * 1024
+
+    # Commands run on a pool of COMMAND_WORKERS threads, with at most
+    # COMMAND_MAX_CONCURRENCY runs of the same command at once unless the
+    # command sets `max_concurrency` in `command_config.yml`. Either way a
+    # command never gets more than COMMAND_WORKERS - 1 workers.
+    COMMAND_WORKERS: int = 4
+    COMMAND_MAX_CONCURRENCY: int = 2
+
+    # Commands are killed if they run for longer than this, unless the command
+    # sets `timeout_seconds` or a job is submitted with its own timeout. Finished jobs are kept for
+    # JOB_RESULT_TTL_SECONDS, and at most JOB_STORE_MAX_JOBS jobs are kept.
+    # Once finished jobs hold more than JOB_STORE_MAX_OUTPUT_MEMORY_BYTES of
+    # output in memory, the oldest ones' output is moved to temporary files.
+    # The first and last bytes of each job's output stay in memory either way.
+    COMMAND_TIMEOUT_SECONDS: int = 600
+    JOB_RESULT_TTL_SECONDS: int = 3600
+    JOB_STORE_MAX_JOBS: int = 1000
+    JOB_STORE_MAX_OUTPUT_MEMORY_BYTES: int = 64 * 1024 * 1024
+    # Resource usage of the last COMMAND_USAGE_SAMPLES runs of each command is
+    # kept for `/commands/usage/stats`
+    COMMAND_USAGE_SAMPLES: int = 1000
+
+    # Command output past COMMAND_OUTPUT_MEMORY_LIMIT bytes is moved to a
+    # temporary file (in COMMAND_OUTPUT_SPILL_DIR, or the system default).
+    # Responses include the first and last bytes of the output, and the rest
+    # is read in pages of at most COMMAND_OUTPUT_PAGE_BYTES.
+    COMMAND_OUTPUT_MEMORY_LIMIT: int = 1024 * 1024
+    COMMAND_OUTPUT_HEAD_BYTES: int = 16 * 1024
+    COMMAND_OUTPUT_TAIL_BYTES: int = 48 * 1024
+    COMMAND_OUTPUT_PAGE_BYTES: int = 1024 * 1024
+    COMMAND_OUTPUT_SPILL_DIR: Optional[str] = None
+
+    # Results of commands marked `cacheable` are kept for the most recent
+    # COMMAND_CACHE_MAX_ENTRIES command lines. Files and directories with these
+    # names don't count as changes to the repo when deciding whether a cached
+    # result is still valid, while changes to the dependency files (relative
+    # to the repo root) invalidate every cached result.
+    COMMAND_CACHE_MAX_ENTRIES: int = 256
+    COMMAND_CACHE_IGNORED_NAMES: List[str] = [".git", "__pycache__", ".pytest_cache", ".mypy_cache", ".ruff_cache"]
+    COMMAND_CACHE_DEPENDENCY_FILES: List[str] = [
+        "requirements.txt", "requirements-dev.txt", "pyproject.toml", "setup.py", "setup.cfg",
+        "poetry.lock", "Pipfile.lock", "uv.lock", "package-lock.json", "yarn.lock",
+    ]
+
+    # File names of test modules, for selecting the tests affected by changes
+    TEST_FILE_PATTERNS: List[str] = ["test_*.py", "*_test.py"]
+
+    # File the durations of tests are saved to, for balancing sharded test
+    # runs across restarts. Durations are only kept in memory if unset.
+    TEST_DURATIONS_PATH: Optional[str] = None
+    # File the tests that failed on their last run are saved to, for
+    # rerunning only those. Only kept in memory if unset.
+    LAST_FAILED_PATH: Optional[str] = None
+
+    @validator("COMMAND_BACKEND")
+    def validate_command_backend(cls, v: str) -> str:
+        if v not in ("docker", "docker-pool", "local"):
+            raise ValueError("COMMAND_BACKEND must be one of 'docker', 'docker-pool' or 'local'")
+        return v
+
+    @validator("TREE_INDEX_BUILD")
+    def validate_tree_index_build(cls, v: str) -> str:
+        if v not in ("eager", "lazy", "off"):
+            raise ValueError("TREE_INDEX_BUILD must be one of 'eager', 'lazy' or 'off'")
+        return v
+
     class Config:
         env_file = ".env"
         case_sensitive = True
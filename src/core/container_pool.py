@@ -0,0 +1,299 @@
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import docker
+
+from src.core.config import settings
+
+
+_docker_client = None
+_docker_client_lock = threading.Lock()
+
+
+def get_docker_client() -> Any:
+    """
+    Return a Docker client shared by all command executions, created on first
+    use.
+    """
+    global _docker_client
+    with _docker_client_lock:
+        if _docker_client is None:
+            _docker_client = docker.from_env()
+        return _docker_client
+
+
+class ResourceUsage(NamedTuple):
+    # None where the backend can't measure it
+    cpu_seconds: Optional[float] = None
+    peak_memory_bytes: Optional[int] = None
+
+
+class CommandStream:
+    """
+    Output of a running command, read incrementally by iterating over it.
+    Once the output is exhausted `exit_code` is set and the command's
+    resources are released with `close(healthy)`. Backends that can measure
+    what the command used set `resource_usage` by then.
+
+    `cancel()` may be called from any thread to stop the command early, in
+    which case iteration ends without an exit code.
+    """
+
+    def __init__(self,
+                 chunks: Iterable[bytes],
+                 wait: Callable[[], int],
+                 kill: Callable[[], None],
+                 close: Callable[[bool], None]):
+        self._chunks = chunks
+        self._wait = wait
+        self._kill = kill
+        self._close = close
+        self.exit_code: Optional[int] = None
+        self.resource_usage = ResourceUsage()
+        self.cancelled = False
+        self._failed = False
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def __iter__(self) -> Iterator[bytes]:
+        try:
+            for chunk in self._chunks:
+                if self.cancelled:
+                    break
+                yield chunk
+            if not self.cancelled:
+                self.exit_code = self._wait()
+        except Exception:
+            self._failed = True
+            # Killing the command usually breaks the output stream
+            if not self.cancelled:
+                raise
+        finally:
+            self._finish()
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self.cancelled or self._closed:
+                return
+            self.cancelled = True
+        try:
+            self._kill()
+        except Exception:
+            # The command may have exited in the meantime
+            pass
+
+    def _finish(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            healthy = not self.cancelled and not self._failed
+        self._close(healthy)
+
+
+class PooledContainer:
+    def __init__(self, container: Any, entrypoint: List[str]):
+        self.container = container
+        # The image's entrypoint, which exec'd commands are run through
+        self.entrypoint = entrypoint
+        self.uses = 0
+
+
+class ContainerPool:
+    """
+    Pool of long-lived containers of the target repo's image, each with the
+    repo mounted, that commands are run in with `exec_run`. This avoids paying
+    for creating, starting and removing a container on every command.
+
+    Containers are kept running with `tail -f /dev/null` (so the image must
+    have `tail`) rather than the image's entrypoint, and the entrypoint is
+    prepended to each exec'd command instead, as `docker run` would.
+
+    A container runs one command at a time. Containers are health checked
+    before each use, replaced if they have stopped, and recycled after
+    `max_uses` commands so state left behind by commands doesn't accumulate.
+
+    With `collect_stats` the container's CPU usage is read before and after
+    each streamed command, so the command's CPU time is the difference.
+    """
+
+    def __init__(self,
+                 client_factory: Callable[[], Any],
+                 image_name: str,
+                 size: int,
+                 max_uses: int,
+                 volumes: Dict[str, Dict[str, str]],
+                 collect_stats: bool = False):
+        self.client_factory = client_factory
+        self.image_name = image_name
+        self.size = size
+        self.max_uses = max_uses
+        self.volumes = volumes
+        self.collect_stats = collect_stats
+        self._idle: "queue.LifoQueue[PooledContainer]" = queue.LifoQueue()
+        # Limits the number of containers (idle or in use) to `size`
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._all: List[PooledContainer] = []
+        self.containers_created = 0
+        self.containers_recycled = 0
+        self.containers_unhealthy = 0
+
+    def run(self, command: List[str]) -> Tuple[int, str]:
+        """
+        Run `command` in a pooled container, blocking until a container is
+        free. Returns the exit code and the combined stdout/stderr.
+        """
+        pooled = self._acquire()
+        healthy = False
+        try:
+            result = pooled.container.exec_run(pooled.entrypoint + command)
+            healthy = True
+        finally:
+            pooled.uses += 1
+            self._release(pooled, healthy)
+        return result.exit_code, result.output.decode("utf-8")
+
+    def stream(self, command: List[str]) -> CommandStream:
+        """
+        Start `command` in a pooled container, blocking until a container is
+        free, and return a stream of its combined stdout/stderr. The container
+        goes back to the pool once the stream is exhausted; if the stream is
+        cancelled the container is removed, which kills the command.
+        """
+        pooled = self._acquire()
+        try:
+            api = self.client_factory().api
+            cpu_before = self._cpu_usage_ns(api, pooled) if self.collect_stats else None
+            exec_id = api.exec_create(pooled.container.id, pooled.entrypoint + command)["Id"]
+            chunks = api.exec_start(exec_id, stream=True)
+        except BaseException:
+            self._release(pooled, healthy=False)
+            raise
+
+        def wait() -> int:
+            exit_code = api.exec_inspect(exec_id)["ExitCode"]
+            if cpu_before is not None:
+                cpu_after = self._cpu_usage_ns(api, pooled)
+                if cpu_after is not None:
+                    stream.resource_usage = ResourceUsage(cpu_seconds=(cpu_after - cpu_before) / 1e9)
+            return exit_code
+
+        def close(healthy: bool) -> None:
+            pooled.uses += 1
+            self._release(pooled, healthy)
+
+        stream = CommandStream(chunks, wait=wait, kill=lambda: self._discard(pooled), close=close)
+        return stream
+
+    @staticmethod
+    def _cpu_usage_ns(api: Any, pooled: PooledContainer) -> Optional[int]:
+        # Total CPU time used by everything in the container so far
+        try:
+            stats = api.stats(pooled.container.id, stream=False, one_shot=True)
+            return int(stats["cpu_stats"]["cpu_usage"]["total_usage"])
+        except (docker.errors.APIError, KeyError, TypeError, ValueError):
+            return None
+
+    def _acquire(self) -> PooledContainer:
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    pooled = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._create()
+                if self._is_healthy(pooled):
+                    return pooled
+                self.containers_unhealthy += 1
+                self._discard(pooled)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _release(self, pooled: PooledContainer, healthy: bool) -> None:
+        try:
+            if not healthy or pooled.uses >= self.max_uses:
+                if healthy:
+                    self.containers_recycled += 1
+                self._discard(pooled)
+            else:
+                self._idle.put(pooled)
+        finally:
+            self._slots.release()
+
+    def _create(self) -> PooledContainer:
+        client = self.client_factory()
+        container = client.containers.run(
+            image=self.image_name,
+            # Keep the container alive doing nothing; commands are exec'd in it
+            entrypoint=["tail", "-f", "/dev/null"],
+            detach=True,
+            volumes=self.volumes,
+        )
+        pooled = PooledContainer(container, self._image_entrypoint(client))
+        with self._lock:
+            self._all.append(pooled)
+            self.containers_created += 1
+        return pooled
+
+    def _image_entrypoint(self, client: Any) -> List[str]:
+        try:
+            entrypoint = client.images.get(self.image_name).attrs["Config"].get("Entrypoint")
+        except (docker.errors.APIError, KeyError):
+            return []
+        if isinstance(entrypoint, str):
+            return ["/bin/sh", "-c", entrypoint]
+        return list(entrypoint or [])
+
+    def _is_healthy(self, pooled: PooledContainer) -> bool:
+        try:
+            pooled.container.reload()
+            return pooled.container.status == "running"
+        except docker.errors.APIError:
+            return False
+
+    def _discard(self, pooled: PooledContainer) -> None:
+        with self._lock:
+            if pooled in self._all:
+                self._all.remove(pooled)
+        try:
+            pooled.container.remove(force=True)
+        except docker.errors.APIError:
+            pass
+
+    def close(self) -> None:
+        """
+        Remove every container in the pool, including ones currently in use.
+        """
+        with self._lock:
+            containers = list(self._all)
+        for pooled in containers:
+            self._discard(pooled)
+        while not self._idle.empty():
+            self._idle.get_nowait()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            total = len(self._all)
+        idle = self._idle.qsize()
+        return {
+            "size": self.size,
+            "containers": total,
+            "idle": idle,
+            "in_use": total - idle,
+            "created": self.containers_created,
+            "recycled": self.containers_recycled,
+            "unhealthy": self.containers_unhealthy,
+        }
+
+
+container_pool = ContainerPool(
+    get_docker_client,
+    image_name=settings.TARGET_REPO_DOCKER_IMAGE_NAME,
+    size=settings.CONTAINER_POOL_SIZE,
+    max_uses=settings.CONTAINER_POOL_MAX_USES,
+    volumes={settings.TARGET_REPO_PATH: {"bind": settings.REPO_ROOT, "mode": "rw"}},
+    collect_stats=settings.COMMAND_CONTAINER_STATS,
+)
@@ -0,0 +1,78 @@
+import asyncio
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+
+CREATED = "created"
+MODIFIED = "modified"
+DELETED = "deleted"
+MOVED = "moved"
+
+FileChangeListener = Callable[[str], None]
+FileEventListener = Callable[[str, str, Optional[str]], None]
+
+logger = logging.getLogger(__name__)
+
+_listeners: List[FileChangeListener] = []
+_event_listeners: List[FileEventListener] = []
+# Listeners run on one thread, so changes are applied in the order they were
+# reported and never on the event loop
+_dispatcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="file-events")
+
+
+def register_file_change_listener(listener: FileChangeListener) -> None:
+    """
+    Register a callback that is invoked with the filesystem path of every file
+    or directory the API creates, modifies, moves or deletes in the target repo.
+    For moves it is called for both the source and the destination.
+    """
+    _listeners.append(listener)
+
+
+def register_file_event_listener(listener: FileEventListener) -> None:
+    """
+    Register a callback that is invoked with (path, change, dest_path) for
+    every change, where `change` is one of CREATED, MODIFIED, DELETED or MOVED
+    and `dest_path` is only set for moves.
+    """
+    _event_listeners.append(listener)
+
+
+def notify_file_changed(filesystem_path: str, change: str = MODIFIED) -> Future:
+    """
+    Tell in-memory caches and indexes that `filesystem_path` changed on disk.
+    The path may no longer exist (deletes and moves) or may be a directory.
+
+    Listeners run in the background; the returned future is done once they
+    all have. A listener that raises is logged and doesn't stop the others.
+    """
+    return _dispatcher.submit(_dispatch, filesystem_path, change, None)
+
+
+def notify_file_moved(src_path: str, dest_path: str) -> Future:
+    return _dispatcher.submit(_dispatch, src_path, MOVED, dest_path)
+
+
+async def file_changed(filesystem_path: str, change: str = MODIFIED) -> None:
+    """
+    `notify_file_changed` for endpoints: waits for the listeners without
+    blocking the event loop, so later requests see the change.
+    """
+    await asyncio.wrap_future(notify_file_changed(filesystem_path, change))
+
+
+def _dispatch(filesystem_path: str, change: str, dest_path: Optional[str]) -> None:
+    paths = [filesystem_path] if dest_path is None else [filesystem_path, dest_path]
+    for listener in _listeners:
+        for path in paths:
+            _call_listener(listener, path)
+    for event_listener in _event_listeners:
+        _call_listener(event_listener, filesystem_path, change, dest_path)
+
+
+def _call_listener(listener: Callable[..., None], *args: Optional[str]) -> None:
+    try:
+        listener(*args)
+    except Exception:
+        logger.exception("File change listener %r failed for %s", listener, args[0])
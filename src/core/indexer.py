@@ -0,0 +1,179 @@
+import ast
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from src.core.config import settings
+from src.core.retrieval_index import RetrievalIndex, SymbolDocument, extract_symbol_documents, retrieval_index
+from src.core.symbol_index import SymbolIndex, iter_python_files, symbol_index
+from src.utils import get_endpoint_path
+
+
+# (filesystem path, symbol documents or None if the file could not be parsed,
+# error message)
+FileRecord = Tuple[str, Optional[List[SymbolDocument]], Optional[str]]
+
+
+def index_python_files(batch: List[Tuple[str, str]]) -> List[FileRecord]:
+    """
+    Parse a batch of (filesystem path, endpoint path) pairs and return one
+    record per file. Runs in worker processes, so it only returns plain tuples
+    that are cheap to pickle rather than AST objects. Each file is parsed
+    once for both the symbol and the retrieval index; the symbols are part
+    of the retrieval documents.
+    """
+    records: List[FileRecord] = []
+    for file_path, endpoint_path in batch:
+        try:
+            with open(file_path, "r") as file:
+                parsed_ast = ast.parse(file.read())
+            records.append((file_path, extract_symbol_documents(parsed_ast, endpoint_path), None))
+        except (OSError, SyntaxError, UnicodeDecodeError, ValueError) as e:
+            records.append((file_path, None, f"{type(e).__name__}: {e}"))
+    return records
+
+
+class RepoIndexer:
+    """
+    Background pipeline that walks the repo (pruning `.llmignore`d
+    directories), fans parsing out to a process pool in batches and loads the
+    results into the symbol index and, if given, the retrieval index.
+    """
+
+    def __init__(self,
+                 index: SymbolIndex,
+                 workers: int,
+                 batch_size: int,
+                 retrieval_index: Optional[RetrievalIndex] = None):
+        self.index = index
+        self.retrieval_index = retrieval_index
+        self.workers = workers
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._reset_progress()
+
+    def _reset_progress(self) -> None:
+        self.status = "idle"
+        self.files_discovered = 0
+        self.files_indexed = 0
+        self.files_failed = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.error: Optional[str] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> bool:
+        """
+        Start indexing in a background thread. Returns False if a run is
+        already in progress.
+        """
+        with self._lock:
+            if self.is_running:
+                return False
+            self._reset_progress()
+            self.status = "running"
+            self.started_at = time.time()
+            self.index.begin_build(rebuild=True)
+            if self.retrieval_index is not None:
+                self.retrieval_index.begin_build(rebuild=True)
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+            return True
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def progress(self) -> Dict[str, Any]:
+        finished_at = self.finished_at or time.time()
+        return {
+            "status": self.status,
+            "workers": self.workers,
+            "files_discovered": self.files_discovered,
+            "files_indexed": self.files_indexed,
+            "files_failed": self.files_failed,
+            "elapsed_seconds": round(finished_at - self.started_at, 3) if self.started_at else None,
+            "error": self.error,
+        }
+
+    def _run(self) -> None:
+        documents_by_file: Dict[str, List[SymbolDocument]] = {}
+        try:
+            if self.workers > 1:
+                self._run_in_pool(documents_by_file)
+            else:
+                for batch in self._iter_batches():
+                    self._collect(index_python_files(batch), documents_by_file)
+        except Exception as e:
+            # Partial results would look like a complete index, so keep the
+            # previous contents (or let the next lookup build it) instead
+            self.status = "failed"
+            self.error = f"{type(e).__name__}: {e}"
+            self.index.abort_build()
+            if self.retrieval_index is not None:
+                self.retrieval_index.abort_build()
+        else:
+            self.index.load({
+                file_path: [document.symbol for document in documents]
+                for file_path, documents in documents_by_file.items()
+            })
+            if self.retrieval_index is not None:
+                self.retrieval_index.load(documents_by_file)
+            self.status = "done"
+        finally:
+            self.finished_at = time.time()
+
+    def _run_in_pool(self, documents_by_file: Dict[str, List[SymbolDocument]]) -> None:
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures: List[Future] = []
+            # Batches are submitted as the walk discovers files so parsing
+            # overlaps with the directory walk
+            for batch in self._iter_batches():
+                futures.append(executor.submit(index_python_files, batch))
+                futures = self._collect_done(futures, documents_by_file)
+            for future in futures:
+                self._collect(future.result(), documents_by_file)
+
+    def _collect_done(self,
+                      futures: List[Future],
+                      documents_by_file: Dict[str, List[SymbolDocument]]) -> List[Future]:
+        pending = []
+        for future in futures:
+            if future.done():
+                self._collect(future.result(), documents_by_file)
+            else:
+                pending.append(future)
+        return pending
+
+    def _collect(self, records: List[FileRecord], documents_by_file: Dict[str, List[SymbolDocument]]) -> None:
+        for file_path, documents, error in records:
+            if error is not None:
+                self.files_failed += 1
+            elif documents:
+                documents_by_file[file_path] = documents
+            self.files_indexed += 1
+
+    def _iter_batches(self) -> Iterator[List[Tuple[str, str]]]:
+        batch: List[Tuple[str, str]] = []
+        for file_path in iter_python_files(self.index.root):
+            self.files_discovered += 1
+            batch.append((file_path, get_endpoint_path(file_path)))
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+repo_indexer = RepoIndexer(
+    symbol_index,
+    workers=settings.INDEXER_WORKERS or os.cpu_count() or 1,
+    batch_size=settings.INDEXER_BATCH_SIZE,
+    retrieval_index=retrieval_index,
+)
@@ -0,0 +1,254 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+from src.core.command_executor import CommandExecutor, command_executor
+from src.core.command_output import CommandOutput
+from src.core.command_usage import CommandUsageStats
+from src.core.config import settings
+from src.core.container_pool import CommandStream, ResourceUsage
+
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TIMED_OUT = "timed_out"
+
+FINISHED_STATUSES = (COMPLETED, FAILED, CANCELLED, TIMED_OUT)
+
+
+class Job:
+    """
+    One run of a configured command. `status` is COMPLETED once the command
+    has exited, whatever its exit code; FAILED means it could not be run.
+    The job's ID is also the handle for paging through its output.
+    """
+
+    def __init__(self,
+                 command_name: str,
+                 command_line: List[str],
+                 priority: int,
+                 timeout_seconds: float,
+                 on_finish: Optional[Callable[["Job"], None]] = None):
+        self.id = uuid.uuid4().hex
+        self.command_name = command_name
+        self.command_line = command_line
+        self.priority = priority
+        self.timeout_seconds = timeout_seconds
+        self.status = QUEUED
+        self.exit_code: Optional[int] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # How long starting the command took, and how long it then ran for
+        self.start_latency_seconds: Optional[float] = None
+        self.wall_seconds: Optional[float] = None
+        self.resource_usage = ResourceUsage()
+        self.future: Optional[Future] = None
+        # Called on the executor thread once the command has exited
+        self.on_finish = on_finish
+        # Parsed test results, for commands that report them
+        self.test_results: Optional[Any] = None
+        self.output = CommandOutput(settings.COMMAND_OUTPUT_MEMORY_LIMIT,
+                                    head_bytes=settings.COMMAND_OUTPUT_HEAD_BYTES,
+                                    tail_bytes=settings.COMMAND_OUTPUT_TAIL_BYTES,
+                                    spill_dir=settings.COMMAND_OUTPUT_SPILL_DIR)
+        self._stream: Optional[CommandStream] = None
+        self._stop_reason: Optional[str] = None
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "command": ' '.join(self.command_line),
+            "status": self.status,
+            "priority": self.priority,
+            "timeout_seconds": self.timeout_seconds,
+            "exit_code": self.exit_code,
+            "error": self.error,
+            "output_size": self.output.size,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "usage": self.usage(),
+        }
+
+    def usage(self) -> Dict[str, Optional[float]]:
+        """
+        Resources used by the run, with None for what wasn't measured.
+        """
+        return {
+            "queue_wait_seconds": self.started_at - self.created_at if self.started_at is not None else None,
+            "start_latency_seconds": self.start_latency_seconds,
+            "wall_seconds": self.wall_seconds,
+            "cpu_seconds": self.resource_usage.cpu_seconds,
+            "peak_memory_bytes": self.resource_usage.peak_memory_bytes,
+            "output_bytes": self.output.size,
+        }
+
+    def stop(self, reason: str) -> bool:
+        """
+        Stop the job with status `reason` (CANCELLED or TIMED_OUT): a queued
+        job is dropped, a running job's command is killed. Returns False if
+        the job had already finished.
+        """
+        with self._lock:
+            if self.finished or self._stop_reason is not None:
+                return False
+            self._stop_reason = reason
+            stream = self._stream
+        # Cancelling the future only works while the job is queued (its done
+        # callback then records the status), otherwise kill the command
+        if (self.future is None or not self.future.cancel()) and stream is not None:
+            stream.cancel()
+        return True
+
+    def run(self, open_stream: Callable[[], CommandStream]) -> Optional[int]:
+        """
+        Run the command, collecting its output. Called on an executor thread.
+        """
+        self.status = RUNNING
+        self.started_at = time.time()
+        start = time.monotonic()
+        stream = open_stream()
+        started = time.monotonic()
+        self.start_latency_seconds = started - start
+        with self._lock:
+            self._stream = stream
+            stopped = self._stop_reason is not None
+        if stopped:
+            stream.cancel()
+
+        timer = threading.Timer(self.timeout_seconds, self.stop, args=(TIMED_OUT,))
+        timer.daemon = True
+        timer.start()
+        try:
+            for chunk in stream:
+                self.output.append(chunk)
+        finally:
+            timer.cancel()
+            self.wall_seconds = time.monotonic() - started
+            self.resource_usage = stream.resource_usage
+            if self.on_finish is not None:
+                self.on_finish(self)
+        return stream.exit_code
+
+    def _finish(self, status: str, exit_code: Optional[int] = None, error: Optional[str] = None) -> None:
+        with self._lock:
+            if self.finished:
+                return
+            self.exit_code = exit_code
+            self.error = error
+            self.finished_at = time.time()
+            self.status = status
+
+    def _on_done(self, future: Future) -> None:
+        if future.cancelled():
+            self._finish(self._stop_reason or CANCELLED)
+        elif future.exception() is not None:
+            self._finish(FAILED, error=str(future.exception()) or type(future.exception()).__name__)
+        elif self._stop_reason is not None:
+            self._finish(self._stop_reason)
+        else:
+            self._finish(COMPLETED, exit_code=future.result())
+
+
+class JobStore:
+    """
+    Submits command runs as jobs to the command executor and keeps them so
+    their status and output can be fetched later. Finished jobs are dropped
+    `ttl_seconds` after they finish, and the oldest finished jobs are dropped
+    early if more than `max_jobs` are kept. Once finished jobs hold more
+    than `max_output_memory` bytes of output in memory, the oldest ones'
+    output is moved to disk. The resource usage of each job that ran is
+    recorded in `usage_stats`, if given.
+    """
+
+    def __init__(self,
+                 executor: CommandExecutor,
+                 max_jobs: int,
+                 ttl_seconds: float,
+                 usage_stats: Optional[CommandUsageStats] = None,
+                 max_output_memory: Optional[int] = None):
+        self.executor = executor
+        self.max_jobs = max_jobs
+        self.ttl_seconds = ttl_seconds
+        self.usage_stats = usage_stats
+        self.max_output_memory = max_output_memory
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self,
+               command_name: str,
+               command_line: List[str],
+               open_stream: Callable[[], CommandStream],
+               priority: int = 0,
+               timeout_seconds: Optional[float] = None,
+               on_finish: Optional[Callable[[Job], None]] = None) -> Job:
+        job = Job(command_name, command_line, priority, timeout_seconds or settings.COMMAND_TIMEOUT_SECONDS, on_finish)
+        with self._lock:
+            self._evict(room=1)
+            self._jobs[job.id] = job
+        job.future = self.executor.submit(command_name, job.run, open_stream, priority=priority)
+        job.future.add_done_callback(job._on_done)
+        job.future.add_done_callback(lambda future: self._record_usage(job))
+        job.future.add_done_callback(lambda future: self._limit_output_memory())
+        return job
+
+    def _record_usage(self, job: Job) -> None:
+        if self.usage_stats is not None and job.started_at is not None:
+            self.usage_stats.record(job.command_name, job.usage())
+
+    def _limit_output_memory(self) -> None:
+        if self.max_output_memory is None:
+            return
+        with self._lock:
+            finished = sorted((job for job in self._jobs.values() if job.finished), key=lambda job: job.finished_at)
+            held = {job.id: job.output.memory_bytes for job in finished}
+            total = sum(held.values())
+            for job in finished:
+                if total <= self.max_output_memory:
+                    break
+                if not job.output.spilled:
+                    job.output.spill()
+                    total -= held[job.id] - job.output.memory_bytes
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            self._evict()
+            return self._jobs.get(job_id)
+
+    def list(self, status: Optional[str] = None) -> List[Job]:
+        with self._lock:
+            self._evict()
+            return [job for job in self._jobs.values() if status is None or job.status == status]
+
+    def _evict(self, room: int = 0) -> None:
+        # Must be called with the lock held
+        expire_before = time.time() - self.ttl_seconds
+        finished = sorted((job for job in self._jobs.values() if job.finished), key=lambda job: job.finished_at)
+        excess = len(self._jobs) + room - self.max_jobs
+        for job in finished:
+            if job.finished_at < expire_before or excess > 0:
+                del self._jobs[job.id]
+                job.output.close()
+                excess -= 1
+
+
+job_store = JobStore(
+    command_executor,
+    max_jobs=settings.JOB_STORE_MAX_JOBS,
+    ttl_seconds=settings.JOB_RESULT_TTL_SECONDS,
+    usage_stats=CommandUsageStats(settings.COMMAND_USAGE_SAMPLES),
+    max_output_memory=settings.JOB_STORE_MAX_OUTPUT_MEMORY_BYTES,
+)
@@ -0,0 +1,161 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from src.core.config import settings
+from src.core.file_events import register_file_change_listener
+
+
+READ_BLOCK_BYTES = 1024 * 1024
+
+
+class LineOffsets:
+    """
+    Byte offset of the start of each line of a file, together with the stat
+    key it was computed from, so any range of lines can be read with one
+    seek. Lines are numbered from 1.
+    """
+
+    def __init__(self, path: str, key: Tuple[int, int], starts: np.ndarray):
+        self.path = path
+        self.key = key
+        self.starts = starts
+
+    @property
+    def size(self) -> int:
+        return self.key[1]
+
+    @property
+    def line_count(self) -> int:
+        return len(self.starts)
+
+    @property
+    def size_bytes(self) -> int:
+        return self.starts.nbytes
+
+    def byte_span(self, start_line: int, end_line: int) -> Tuple[int, int]:
+        """
+        The (start, end) byte offsets of lines `start_line` to `end_line`
+        inclusive, including the final newline.
+        """
+        start = int(self.starts[start_line - 1])
+        end = int(self.starts[end_line]) if end_line < self.line_count else self.size
+        return start, end
+
+    def last_line_ending_by(self, offset: int) -> int:
+        """
+        The number of the last line that ends (including its newline) at or
+        before byte `offset`, or 0 if none does.
+        """
+        if offset >= self.size:
+            return self.line_count
+        # Line n ends where line n + 1 starts
+        return max(int(np.searchsorted(self.starts, offset, side="right")) - 1, 0)
+
+
+def compute_line_offsets(filesystem_path: str) -> LineOffsets:
+    """
+    Scan a file for newlines, a block at a time, without decoding it.
+    """
+    newlines = []
+    with open(filesystem_path, "rb") as f:
+        stat = os.fstat(f.fileno())
+        position = 0
+        while True:
+            block = f.read(READ_BLOCK_BYTES)
+            if not block:
+                break
+            newlines.append(np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == ord("\n")) + position + 1)
+            position += len(block)
+    starts = np.concatenate([np.zeros(1, dtype=np.int64)] + newlines) if position else np.zeros(0, dtype=np.int64)
+    # A final newline doesn't start another line
+    if len(starts) and starts[-1] == position:
+        starts = starts[:-1]
+    return LineOffsets(filesystem_path, (stat.st_mtime_ns, position), starts.astype(np.int64))
+
+
+class LineOffsetCache:
+    """
+    Bounded LRU cache of line offsets keyed by filesystem path and
+    invalidated whenever the file's (st_mtime_ns, st_size) changes.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, LineOffsets]" = OrderedDict()
+        self._current_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, filesystem_path: str) -> LineOffsets:
+        """
+        Return the line offsets of `filesystem_path`, scanning the file if it
+        is not cached or has changed on disk. Raises `FileNotFoundError` like
+        opening the file would.
+        """
+        stat = os.stat(filesystem_path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(filesystem_path)
+            if entry is not None and entry.key == key:
+                self._entries.move_to_end(filesystem_path)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        entry = compute_line_offsets(filesystem_path)
+
+        with self._lock:
+            self._remove(filesystem_path)
+            if entry.size_bytes <= self.max_bytes:
+                self._entries[filesystem_path] = entry
+                self._current_bytes += entry.size_bytes
+                while self._current_bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._current_bytes -= evicted.size_bytes
+                    self.evictions += 1
+        return entry
+
+    def invalidate(self, filesystem_path: str) -> None:
+        with self._lock:
+            self._remove(filesystem_path)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._current_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "current_bytes": self._current_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _remove(self, filesystem_path: str) -> Optional[LineOffsets]:
+        entry = self._entries.pop(filesystem_path, None)
+        if entry is not None:
+            self._current_bytes -= entry.size_bytes
+        return entry
+
+
+def read_bytes(filesystem_path: str, start: int, end: int) -> bytes:
+    """
+    Read bytes `start` up to (not including) `end` of a file.
+    """
+    with open(filesystem_path, "rb") as f:
+        f.seek(start)
+        return f.read(max(end - start, 0))
+
+
+line_offset_cache = LineOffsetCache(settings.LINE_INDEX_CACHE_MAX_BYTES)
+register_file_change_listener(line_offset_cache.invalidate)
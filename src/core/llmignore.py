@@ -0,0 +1,236 @@
+import os
+import re
+import threading
+import time
+from typing import Callable, List, Optional, Pattern, Tuple
+
+from src.core.config import settings
+
+
+def translate_pattern(pattern: str) -> Tuple[str, bool, bool]:
+    """
+    Translate one `.gitignore` style pattern into a regular expression that is
+    matched against a path relative to the repo root, without the trailing
+    part that distinguishes files from directories.
+    Returns (regex, is_negated, is_directory_only).
+    """
+    negated = pattern.startswith("!")
+    if negated:
+        pattern = pattern[1:]
+    elif pattern.startswith("\\!") or pattern.startswith("\\#"):
+        pattern = pattern[1:]
+
+    directory_only = pattern.endswith("/")
+    pattern = pattern.rstrip("/")
+    # A slash at the start or in the middle anchors the pattern to the repo
+    # root, otherwise it can match at any depth
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+
+    regex = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i) and (i == 0 or pattern[i - 1] == "/"):
+            regex.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i) and (i == 0 or pattern[i - 1] == "/") and i + 2 == len(pattern):
+            # A trailing `/**` matches everything inside a directory but not the directory itself
+            regex.append(".+")
+            i += 2
+        elif pattern[i] == "*":
+            regex.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            regex.append("[^/]")
+            i += 1
+        elif pattern[i] == "[":
+            end = pattern.find("]", i + 2 if pattern.startswith("[!", i) or pattern.startswith("[]", i) else i + 1)
+            if end == -1:
+                regex.append(re.escape(pattern[i]))
+                i += 1
+            else:
+                char_class = pattern[i + 1:end]
+                if char_class.startswith("!"):
+                    char_class = "^" + char_class[1:]
+                regex.append("[" + char_class.replace("\\", "\\\\") + "]")
+                i = end + 1
+        elif pattern[i] == "\\" and i + 1 < len(pattern):
+            regex.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            regex.append(re.escape(pattern[i]))
+            i += 1
+
+    prefix = "" if anchored else "(?:.*/)?"
+    return prefix + "".join(regex), negated, directory_only
+
+
+class LLMIgnoreMatcher:
+    """
+    `.llmignore` patterns compiled with `.gitignore` semantics: patterns are
+    matched relative to the repo root, later patterns override earlier ones,
+    `!` negates, a trailing `/` only matches directories and a path inside an
+    ignored directory is always ignored.
+
+    Consecutive patterns with the same sign are combined into a single regex,
+    so a check costs one regex search per sign change in the file rather than
+    several `fnmatch` calls per pattern. A path and all of its parent
+    directories are first checked against the non-negated patterns with a
+    single search, so paths that are not ignored (the common case) cost one
+    regex match even when the file contains negations.
+    """
+
+    def __init__(self, patterns: List[str]):
+        self.patterns = patterns
+        # (compiled alternation, is_negated) blocks in file order
+        self._blocks: List[Tuple[Pattern, bool]] = []
+        # Matches a path if it or any parent directory matches a non-negated pattern
+        self._self_or_parent: Optional[Pattern] = None
+        self._has_negations = False
+        self.has_directory_only_patterns = False
+
+        exact: List[str] = []
+        self_or_parent: List[str] = []
+        current_negated: Optional[bool] = None
+        for pattern in patterns:
+            regex, negated, directory_only = translate_pattern(pattern)
+            self.has_directory_only_patterns |= directory_only
+            if exact and negated != current_negated:
+                self._blocks.append((self._compile(exact), bool(current_negated)))
+                exact = []
+            exact.append(regex + ("/" if directory_only else "/?"))
+            if negated:
+                self._has_negations = True
+            else:
+                self_or_parent.append(regex + ("/.*" if directory_only else "(?:/.*)?"))
+            current_negated = negated
+        if exact:
+            self._blocks.append((self._compile(exact), bool(current_negated)))
+        if self_or_parent:
+            self._self_or_parent = self._compile(self_or_parent)
+
+    @staticmethod
+    def _compile(alternatives: List[str]) -> Pattern:
+        return re.compile("(?:" + "|".join(alternatives) + r")\Z", re.DOTALL)
+
+    def __bool__(self) -> bool:
+        return bool(self._blocks)
+
+    def match(self, relative_path: str, is_dir: bool = False) -> bool:
+        """
+        Whether the patterns ignore `relative_path` itself, without looking at
+        its parent directories. Suitable for walkers that never descend into
+        ignored directories.
+        """
+        if not self._blocks or not relative_path:
+            return False
+        subject = relative_path + "/" if is_dir else relative_path
+        for regex, negated in reversed(self._blocks):
+            if regex.match(subject):
+                return not negated
+        return False
+
+    def is_ignored(self, relative_path: str, is_dir: bool = False) -> bool:
+        """
+        Whether `relative_path` or any of its parent directories is ignored.
+        """
+        relative_path = relative_path.strip("/")
+        if self._self_or_parent is None or not relative_path:
+            return False
+        if self._self_or_parent.match(relative_path + "/" if is_dir else relative_path) is None:
+            return False
+        if not self._has_negations:
+            return True
+        # A negation may re-include the path, so work out which pattern
+        # matches last for each parent directory and then the path itself
+        parts = relative_path.split("/")
+        for depth in range(1, len(parts)):
+            if self.match("/".join(parts[:depth]), is_dir=True):
+                return True
+        return self.match(relative_path, is_dir)
+
+
+_EMPTY_MATCHER = LLMIgnoreMatcher([])
+_cached: Tuple[Optional[Tuple[int, int]], LLMIgnoreMatcher] = (None, _EMPTY_MATCHER)
+_cache_lock = threading.Lock()
+
+
+def read_llmignore_patterns(llmignore_path: str) -> List[str]:
+    with open(llmignore_path, "r") as f:
+        return [line.strip() for line in f.readlines() if line.strip() and not line.startswith("#")]
+
+
+def get_llmignore_matcher() -> LLMIgnoreMatcher:
+    """
+    Return the compiled matcher for the repo's `.llmignore`. The file is only
+    re-read and re-compiled when its mtime or size changes.
+    """
+    global _cached
+    try:
+        stat = os.stat(settings.LLMIGNORE_PATH)
+    except (OSError, TypeError):
+        return _EMPTY_MATCHER
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached_key, matcher = _cached
+    if cached_key == key:
+        return matcher
+    with _cache_lock:
+        try:
+            matcher = LLMIgnoreMatcher(read_llmignore_patterns(settings.LLMIGNORE_PATH))
+        except OSError:
+            return _EMPTY_MATCHER
+        _cached = (key, matcher)
+    return matcher
+
+
+def relative_to_repo_root(path: str) -> str:
+    repo_root = str(settings.REPO_ROOT).rstrip("/")
+    if path == repo_root:
+        return ""
+    if path.startswith(repo_root + "/"):
+        path = path[len(repo_root):]
+    return path.strip("/")
+
+
+def benchmark(paths: List[str], patterns: List[str], repeat: int = 5) -> None:
+    """
+    Compare the compiled matcher with matching each pattern with `fnmatch`
+    against every path, which is how `.llmignore` used to be checked.
+    """
+    import fnmatch
+    from pathlib import Path
+
+    def fnmatch_is_ignored(path: str) -> bool:
+        path_obj = Path(path)
+        for pattern in patterns:
+            if fnmatch.fnmatch(path_obj.name, pattern):
+                return True
+            if fnmatch.fnmatch(str(path_obj), pattern):
+                return True
+        return False
+
+    matcher = LLMIgnoreMatcher(patterns)
+    for name, check in (("fnmatch", fnmatch_is_ignored), ("compiled", matcher.is_ignored)):
+        best = min(_time_checks(check, paths) for _ in range(repeat))
+        print(f"{name:>9}: {best / len(paths) * 1e6:.2f} us/path ({len(paths)} paths, {len(patterns)} patterns)")
+
+
+def _time_checks(check: Callable[[str], bool], paths: List[str]) -> float:
+    start = time.perf_counter()
+    for path in paths:
+        check(path)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    import sys
+
+    root = sys.argv[1] if len(sys.argv) > 1 else str(settings.REPO_ROOT)
+    sample_paths: List[str] = []
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names[:] = [name for name in dir_names if name != ".git"]
+        sample_paths.extend(os.path.relpath(os.path.join(dir_path, name), root) for name in file_names)
+    sample_patterns = read_llmignore_patterns(os.path.join(root, ".llmignore")) \
+        if os.path.exists(os.path.join(root, ".llmignore")) \
+        else ["*.pyc", "__pycache__/", "node_modules/", "venv*", "build/", "dist/", "*.log", "!important.log"]
+    benchmark(sample_paths or ["src/main.py"], sample_patterns)
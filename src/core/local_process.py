@@ -0,0 +1,113 @@
+import os
+import shutil
+import signal
+import subprocess
+import sys
+from typing import Dict, Iterator, List
+
+from src.core.container_pool import CommandStream, ResourceUsage
+
+
+# Variables passed on to local commands, so the server's own configuration
+# and credentials aren't visible to them
+PASSED_ENVIRONMENT_VARIABLES = ("PATH", "HOME", "LANG", "LC_ALL", "TMPDIR", "VIRTUAL_ENV")
+
+READ_SIZE = 64 * 1024
+
+# Run as `python -c` in front of the command to set its resource limits and
+# then exec it, so the limits apply from its first instruction. The soft CPU
+# limit sends SIGXCPU, the hard limit SIGKILL.
+_EXEC_WITH_LIMITS = """
+import os, resource, sys
+cpu_seconds, memory_bytes, max_output_bytes = map(int, sys.argv[1:4])
+resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+resource.setrlimit(resource.RLIMIT_FSIZE, (max_output_bytes, max_output_bytes))
+os.execvp(sys.argv[4], sys.argv[4:])
+"""
+
+
+def local_environment() -> Dict[str, str]:
+    return {name: os.environ[name] for name in PASSED_ENVIRONMENT_VARIABLES if name in os.environ}
+
+
+def stream_local_command(command_line: List[str],
+                         cwd: str,
+                         cpu_seconds: int,
+                         memory_bytes: int,
+                         max_output_bytes: int) -> CommandStream:
+    """
+    Start the command as a subprocess of the server in `cwd` and return a
+    stream of its output (standard output and standard error). The command
+    is limited to `cpu_seconds` of CPU time and `memory_bytes` of address
+    space, and is killed once it has printed `max_output_bytes`, which also
+    caps the size of files it writes. It runs in its own process group so
+    killing it also kills anything it started. Its CPU time and peak memory,
+    including that of the processes it waited for, are reported in the
+    stream's `resource_usage`.
+    """
+    env = local_environment()
+    # The wrapper can only report a missing command through its exit code,
+    # so check first, the way Popen would have
+    executable = command_line[0]
+    if os.sep in executable:
+        found = os.access(os.path.join(cwd, executable), os.X_OK)
+    else:
+        found = shutil.which(executable, path=env.get("PATH", os.defpath)) is not None
+    if not found:
+        raise FileNotFoundError(f"No such command: {executable!r}")
+
+    # Limits are set by a wrapper that execs the command rather than in
+    # preexec_fn, which isn't safe to use from a multi-threaded process
+    process = subprocess.Popen([sys.executable, "-I", "-S", "-c", _EXEC_WITH_LIMITS,
+                                str(cpu_seconds), str(memory_bytes), str(max_output_bytes)] + command_line,
+                               cwd=cwd,
+                               env=env,
+                               stdin=subprocess.DEVNULL,
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT,
+                               start_new_session=True)
+
+    def chunks() -> Iterator[bytes]:
+        remaining = max_output_bytes
+        while True:
+            chunk = process.stdout.read1(READ_SIZE)
+            if not chunk:
+                return
+            if len(chunk) > remaining:
+                yield chunk[:remaining]
+                yield f"\n... [output limit of {max_output_bytes} bytes reached, command killed] ...\n".encode("utf-8")
+                _kill_process_group(process)
+                return
+            remaining -= len(chunk)
+            yield chunk
+
+    def reap() -> int:
+        # Wait with wait4 rather than Popen.wait to get the command's rusage
+        if process.returncode is None:
+            _, status, rusage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            stream.resource_usage = ResourceUsage(cpu_seconds=rusage.ru_utime + rusage.ru_stime,
+                                                  peak_memory_bytes=rusage.ru_maxrss * 1024)
+        return process.returncode
+
+    def wait() -> int:
+        returncode = reap()
+        # Report commands killed by a signal the way a shell (and docker) does
+        return 128 - returncode if returncode < 0 else returncode
+
+    def close(healthy: bool) -> None:
+        if process.returncode is None:
+            _kill_process_group(process)
+        reap()
+        process.stdout.close()
+
+    stream = CommandStream(chunks(), wait=wait, kill=lambda: _kill_process_group(process), close=close)
+    return stream
+
+
+def _kill_process_group(process: subprocess.Popen) -> None:
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
@@ -0,0 +1,202 @@
+import json
+import os
+import threading
+import uuid
+import xml.etree.ElementTree as ET
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set
+
+from src.core.config import settings
+from src.core.sharding import DurationHistory, duration_history
+
+
+PASSED = "passed"
+FAILED = "failed"
+ERROR = "error"
+SKIPPED = "skipped"
+
+# Longest failure message kept per test, the full traceback is in the output
+MAX_MESSAGE_LENGTH = 500
+
+
+class CaseResult(NamedTuple):
+    node_id: str
+    outcome: str
+    duration: float
+    message: Optional[str]
+
+
+class PytestResults:
+    """
+    Per-test results of one or more pytest runs, parsed from their JUnit XML
+    reports.
+    """
+
+    def __init__(self, cases: Optional[List[CaseResult]] = None):
+        self.cases: List[CaseResult] = cases or []
+
+    @classmethod
+    def merge(cls, results: Iterable[Optional["PytestResults"]]) -> "PytestResults":
+        return cls([case for result in results if result is not None for case in result.cases])
+
+    def counts(self) -> Dict[str, int]:
+        counts = {PASSED: 0, FAILED: 0, ERROR: 0, SKIPPED: 0}
+        for case in self.cases:
+            counts[case.outcome] += 1
+        return counts
+
+    @property
+    def failures(self) -> List[CaseResult]:
+        return [case for case in self.cases if case.outcome in (FAILED, ERROR)]
+
+    def summary(self, max_failures: int = 100) -> Dict[str, Any]:
+        """
+        Counts by outcome and the first `max_failures` failed tests.
+        """
+        counts = self.counts()
+        failures = self.failures
+        return {
+            "passed": counts[PASSED],
+            "failed": counts[FAILED],
+            "errors": counts[ERROR],
+            "skipped": counts[SKIPPED],
+            "duration_seconds": sum(case.duration for case in self.cases),
+            "failures": [case_to_dict(case) for case in failures[:max_failures]],
+            "failures_truncated": len(failures) > max_failures,
+        }
+
+
+def case_to_dict(case: CaseResult) -> Dict[str, Any]:
+    return {"node_id": case.node_id, "outcome": case.outcome,
+            "duration_seconds": case.duration, "message": case.message}
+
+
+def node_id_from_junit(classname: str, name: str, root: str) -> str:
+    """
+    Rebuild a pytest node ID from a JUnit test case. Pytest writes the
+    module path and class names as one dotted `classname`, so the longest
+    prefix naming a file under `root` is taken as the module.
+    """
+    parts = classname.split(".") if classname else []
+    for i in range(len(parts), 0, -1):
+        relative_path = "/".join(parts[:i]) + ".py"
+        if os.path.isfile(os.path.join(root, relative_path)):
+            return "::".join([relative_path] + parts[i:] + [name])
+    if not parts:
+        return name
+    # The file was deleted since, assume there are no test classes
+    return "::".join(["/".join(parts) + ".py", name])
+
+
+def parse_junit_xml(filesystem_path: str, root: str) -> PytestResults:
+    """
+    Parse a JUnit XML report written by `pytest --junitxml`. The report is
+    read incrementally so large test suites don't build the whole tree.
+    """
+    cases = []
+    for _, element in ET.iterparse(filesystem_path, events=("end",)):
+        if element.tag != "testcase":
+            continue
+        outcome, message = PASSED, None
+        for child in element:
+            if child.tag in ("failure", "error", "skipped"):
+                outcome = {"failure": FAILED, "error": ERROR, "skipped": SKIPPED}[child.tag]
+                message = child.get("message") or (child.text or "").strip().split("\n")[-1] or None
+                # A test can fail and then error in teardown, the failure counts
+                if outcome == FAILED:
+                    break
+        if message is not None and len(message) > MAX_MESSAGE_LENGTH:
+            message = message[:MAX_MESSAGE_LENGTH] + "..."
+        cases.append(CaseResult(
+            node_id_from_junit(element.get("classname", ""), element.get("name", ""), root),
+            outcome,
+            float(element.get("time") or 0.0),
+            message,
+        ))
+        element.clear()
+    return PytestResults(cases)
+
+
+class LastFailed:
+    """
+    Node IDs of the tests that failed the last time they ran, like pytest's
+    `--last-failed` cache but kept by the server so it covers every run,
+    including sharded ones. Saved as JSON at `path`, if set.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._node_ids: Set[str] = set()
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    self._node_ids = {str(node_id) for node_id in json.load(f)}
+            except (OSError, ValueError, TypeError):
+                self._node_ids = set()
+
+    def node_ids(self) -> List[str]:
+        with self._lock:
+            return sorted(self._node_ids)
+
+    def update(self, results: PytestResults) -> None:
+        """
+        Add the tests that failed in `results` and drop those that passed or
+        were skipped. Tests that didn't run are left as they were.
+        """
+        if not results.cases:
+            return
+        with self._lock:
+            for case in results.cases:
+                if case.outcome in (FAILED, ERROR):
+                    self._node_ids.add(case.node_id)
+                else:
+                    self._node_ids.discard(case.node_id)
+            snapshot = sorted(self._node_ids)
+        self._save(snapshot)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._node_ids.clear()
+        self._save([])
+
+    def _save(self, node_ids: List[str]) -> None:
+        if self.path:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(node_ids, f)
+            os.replace(tmp_path, self.path)
+
+
+def junit_xml_path() -> str:
+    """
+    A new path to have pytest write its JUnit XML report to. It is inside
+    the repo so it is visible both to the container running pytest and to
+    the server, in `.pytest_cache` so it doesn't show up as a change.
+    """
+    return os.path.join(settings.REPO_ROOT, ".pytest_cache", "llm-repo-assistant", f"junit-{uuid.uuid4().hex}.xml")
+
+
+def record_test_results(report_path: str,
+                        root: str,
+                        last_failed: "LastFailed",
+                        durations: DurationHistory) -> Optional[PytestResults]:
+    """
+    Parse and delete the JUnit XML report at `report_path`, recording which
+    tests failed and how long each took. Returns None if pytest didn't write
+    a report, e.g. because it was killed.
+    """
+    try:
+        results = parse_junit_xml(report_path, root)
+    except (OSError, ET.ParseError):
+        return None
+    finally:
+        try:
+            os.remove(report_path)
+        except OSError:
+            pass
+    last_failed.update(results)
+    durations.update({case.node_id: case.duration for case in results.cases if case.outcome != SKIPPED})
+    return results
+
+
+last_failed = LastFailed(settings.LAST_FAILED_PATH)
@@ -0,0 +1,246 @@
+import mmap
+import os
+import re
+import signal
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Iterator, List, NamedTuple, Optional, Set, Tuple, Union
+
+from src.core.config import settings
+from src.core.llmignore import relative_to_repo_root
+from src.utils import BINARY_SNIFF_BYTES, MAX_LINE_CHARS, looks_binary, walk_directory
+
+
+# (filesystem path, line number, column, line)
+RawMatch = Tuple[str, int, int, str]
+
+# (matches, files scanned, whether the batch ran out of time)
+BatchResult = Tuple[List[RawMatch], int, bool]
+
+
+class ScanMatch(NamedTuple):
+    path: str  # endpoint path, relative to the repo root
+    line_number: int
+    column: int
+    line: str
+
+
+class ScanSummary(NamedTuple):
+    files_scanned: int
+    matches: int
+    truncated: bool
+    # Stopped because a batch of files took too long to scan
+    timed_out: bool = False
+
+
+def compile_scan_pattern(pattern: str, ignore_case: bool) -> "re.Pattern[bytes]":
+    """
+    Compile a python regular expression to match against the raw bytes of
+    files. Raises `re.error` if it is invalid.
+    """
+    return re.compile(pattern.encode("utf-8"), re.MULTILINE | (re.IGNORECASE if ignore_case else 0))
+
+
+def scan_file(filesystem_path: str, regex: "re.Pattern[bytes]", limit: int) -> List[RawMatch]:
+    """
+    Find up to `limit` lines of a file matching `regex`, one match per line
+    like grep. The file is memory-mapped rather than read, and binary files
+    (judged by their first bytes) are skipped.
+    """
+    try:
+        with open(filesystem_path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return []
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if looks_binary(mm[:BINARY_SNIFF_BYTES]):
+                    return []
+                return _scan_buffer(filesystem_path, mm, regex, limit)
+    except (OSError, ValueError):
+        return []
+
+
+def _scan_buffer(filesystem_path: str, mm: mmap.mmap, regex: "re.Pattern[bytes]", limit: int) -> List[RawMatch]:
+    matches: List[RawMatch] = []
+    line_number = 1
+    counted_to = 0
+    last_line_start = -1
+    for match in regex.finditer(mm):
+        start = match.start()
+        line_start = mm.rfind(b"\n", 0, start) + 1
+        if line_start == last_line_start:
+            continue
+        last_line_start = line_start
+        line_number += mm[counted_to:line_start].count(b"\n")
+        counted_to = line_start
+        line_end = mm.find(b"\n", start)
+        line = mm[line_start:line_end if line_end != -1 else len(mm)]
+        matches.append((
+            filesystem_path,
+            line_number,
+            len(line[:start - line_start].decode("utf-8", errors="replace")) + 1,
+            line.decode("utf-8", errors="replace").rstrip("\r")[:MAX_LINE_CHARS],
+        ))
+        if len(matches) >= limit:
+            break
+    return matches
+
+
+class _BatchTimedOut(Exception):
+    pass
+
+
+# Whether the running batch's timer may still interrupt it
+_deadline_armed = False
+
+
+def _interrupt_batch(signum: int, frame: Any) -> None:
+    if _deadline_armed:
+        raise _BatchTimedOut()
+
+
+def scan_files(batch: List[str],
+               pattern: bytes,
+               flags: int,
+               limit: int,
+               timeout_seconds: Optional[float] = None) -> BatchResult:
+    """
+    Scan a batch of files for up to `limit` matches in total. Runs in worker
+    processes, so it takes the pattern rather than a compiled regex.
+
+    If `timeout_seconds` is set the batch is interrupted once it has run
+    that long (the regex engine checks for signals while matching, so this
+    also stops catastrophic backtracking) and the matches found so far are
+    returned. The timer uses SIGALRM, so it only applies on the main thread,
+    which is where pool processes run their tasks.
+    """
+    global _deadline_armed
+    regex = re.compile(pattern, flags)
+    matches: List[RawMatch] = []
+    files_scanned = 0
+    timed = timeout_seconds is not None and threading.current_thread() is threading.main_thread()
+    if timed:
+        previous_handler = signal.signal(signal.SIGALRM, _interrupt_batch)
+        _deadline_armed = True
+        signal.setitimer(signal.ITIMER_REAL, timeout_seconds)
+    try:
+        for path in batch:
+            matches.extend(scan_file(path, regex, limit - len(matches)))
+            files_scanned += 1
+            if len(matches) >= limit:
+                break
+    except _BatchTimedOut:
+        return matches, files_scanned, True
+    finally:
+        if timed:
+            _deadline_armed = False
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_handler)
+    return matches, files_scanned, False
+
+
+class RegexScanner:
+    """
+    Searches files by scanning them all, for regular expressions the trigram
+    index can't narrow down. Files are found with the same walk as the rest
+    of the API (so `.git` and `.llmignore`d paths are skipped) and scanned
+    `batch_size` at a time on a pool of `workers` processes, kept between
+    searches. Matches are yielded as each batch finishes, so callers can
+    stream them.
+
+    A batch that runs for longer than `batch_timeout_seconds` (e.g. because
+    of catastrophic backtracking) is interrupted by its worker, which stays
+    in the pool, and ends the scan. Batches scanned inline (`workers` <= 1)
+    off the main thread have no deadline.
+    """
+
+    def __init__(self, workers: int, batch_size: int, batch_timeout_seconds: Optional[float] = None):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_timeout_seconds = batch_timeout_seconds
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def scan(self,
+             root: str,
+             regex: "re.Pattern[bytes]",
+             include: Optional[List[str]] = None,
+             max_results: int = 100) -> Iterator[Union[ScanMatch, ScanSummary]]:
+        """
+        Yield the lines under `root` matching `regex` (from
+        `compile_scan_pattern`), in files whose name or repo-relative path
+        matches one of the `include` globs, then a summary. Scanning stops
+        once `max_results` matches have been found, or when a batch of files
+        takes longer than `batch_timeout_seconds` to scan.
+        """
+        files_scanned = 0
+        found = 0
+        for batch_matches, batch_files_scanned, timed_out in self._scan_batches(root, regex, include, max_results):
+            files_scanned += batch_files_scanned
+            for path, line_number, column, line in batch_matches[:max_results - found]:
+                found += 1
+                yield ScanMatch(relative_to_repo_root(path), line_number, column, line)
+            if found >= max_results or timed_out:
+                yield ScanSummary(files_scanned, found, truncated=True, timed_out=timed_out and found < max_results)
+                return
+        yield ScanSummary(files_scanned, found, truncated=False)
+
+    def _iter_batches(self, root: str, include: Optional[List[str]]) -> Iterator[List[str]]:
+        batch: List[str] = []
+        for entry in walk_directory(root, include=include):
+            if not entry.is_dir:
+                batch.append(entry.path)
+                if len(batch) >= self.batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def _scan_batches(self,
+                      root: str,
+                      regex: "re.Pattern[bytes]",
+                      include: Optional[List[str]],
+                      max_results: int) -> Iterator[BatchResult]:
+        args = (regex.pattern, regex.flags, max_results, self.batch_timeout_seconds)
+        if self.workers <= 1:
+            for batch in self._iter_batches(root, include):
+                yield scan_files(batch, *args)
+            return
+
+        executor = self._get_executor()
+        pending: Set[Future] = set()
+        try:
+            # Batches are submitted as the walk finds files, with a few
+            # queued per worker so workers never wait for the walk
+            for batch in self._iter_batches(root, include):
+                pending.add(executor.submit(scan_files, batch, *args))
+                if len(pending) >= 2 * self.workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        finally:
+            # Stop early, e.g. once enough matches were found
+            for future in pending:
+                future.cancel()
+
+
+regex_scanner = RegexScanner(
+    workers=settings.SEARCH_SCAN_WORKERS or os.cpu_count() or 1,
+    batch_size=settings.SEARCH_SCAN_BATCH_SIZE,
+    batch_timeout_seconds=settings.SEARCH_SCAN_BATCH_TIMEOUT_SECONDS,
+)
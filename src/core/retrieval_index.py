@@ -0,0 +1,298 @@
+import ast
+import heapq
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, List, NamedTuple, Optional, Set
+
+from src.core.config import settings
+from src.core.ast_cache import parsed_module_cache
+from src.core.file_events import register_file_change_listener
+from src.core.symbol_index import Symbol, iter_python_files, iter_symbol_nodes
+from src.utils import get_endpoint_path, is_llmignored
+
+
+# BM25 term frequency saturation and document length normalisation
+K1 = 1.2
+B = 0.75
+# Terms from a symbol's own name count this many times as terms from its
+# path, parameters and docstring
+NAME_WEIGHT = 3
+MAX_DOCSTRING_CHARS = 300
+
+WORD_RE = re.compile(r"[A-Za-z0-9]+")
+# Splits camelCase and PascalCase words, keeping acronyms together:
+# "parseHTTPResponse2" -> "parse", "HTTP", "Response", "2"
+WORD_PART_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lowercase terms, breaking identifiers on underscores and
+    camelCase, so `get_user_id` and `getUserId` both give `get user id`.
+    Single characters are dropped.
+    """
+    return [
+        part.lower()
+        for word in WORD_RE.findall(text)
+        for part in WORD_PART_RE.findall(word)
+        if len(part) > 1
+    ]
+
+
+class SymbolDocument(NamedTuple):
+    symbol: Symbol
+    # First paragraph of the docstring
+    docstring: Optional[str]
+    term_counts: Dict[str, int]
+    length: int
+
+
+class RetrievalResult(NamedTuple):
+    symbol: Symbol
+    docstring: Optional[str]
+    score: float
+
+
+def _docstring_summary(docstring: Optional[str]) -> Optional[str]:
+    if not docstring:
+        return None
+    return " ".join(docstring.split("\n\n")[0].split())[:MAX_DOCSTRING_CHARS]
+
+
+def extract_symbol_documents(parsed_ast: ast.Module, endpoint_path: str) -> List[SymbolDocument]:
+    """
+    Turn each class, function and method in a module into a document of the
+    terms in its name, qualified name (which includes the module path),
+    parameter names and docstring.
+    """
+    documents = []
+    for node, symbol in iter_symbol_nodes(parsed_ast, endpoint_path):
+        docstring = ast.get_docstring(node)
+        terms = tokenize(symbol.name) * NAME_WEIGHT + tokenize(symbol.qualname) + tokenize(docstring or "")
+        if not isinstance(node, ast.ClassDef):
+            arguments = node.args.posonlyargs + node.args.args + node.args.kwonlyargs
+            terms += tokenize(" ".join(arg.arg for arg in arguments if arg.arg not in ("self", "cls")))
+        documents.append(SymbolDocument(symbol, _docstring_summary(docstring), dict(Counter(terms)), len(terms)))
+    return documents
+
+
+class RetrievalIndex:
+    """
+    Inverted index from terms to the python symbols whose names, paths and
+    docstrings contain them, ranked with BM25. Built from the same parse of
+    each file as the symbol index, and kept current as files change.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._lock = threading.RLock()
+        self._documents: Dict[int, SymbolDocument] = {}
+        self._document_ids_by_file: Dict[str, List[int]] = {}
+        # term -> {document id: term frequency}
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._total_length = 0
+        self._next_id = 0
+        self._built = threading.Event()
+        self._build_started = False
+        # Set when a build finishes, whether or not it succeeded
+        self._build_finished = threading.Event()
+        # Paths changed while a build is running, applied once it finishes
+        self._building = False
+        self._pending_paths: Set[str] = set()
+
+    @property
+    def is_built(self) -> bool:
+        return self._built.is_set()
+
+    def build(self) -> None:
+        """
+        Index every python file under the repo root, replacing any previous
+        contents of the index.
+        """
+        documents_by_file: Dict[str, List[SymbolDocument]] = {}
+        try:
+            for file_path in iter_python_files(self.root):
+                documents = self._parse_file(file_path)
+                if documents:
+                    documents_by_file[file_path] = documents
+        except BaseException:
+            self.abort_build()
+            raise
+        self.load(documents_by_file)
+
+    def load(self, documents_by_file: Dict[str, List[SymbolDocument]]) -> None:
+        """
+        Replace the contents of the index with already extracted documents.
+        """
+        with self._lock:
+            self._documents = {}
+            self._document_ids_by_file = {}
+            self._postings = {}
+            self._total_length = 0
+            for file_path, documents in documents_by_file.items():
+                self._add_file(file_path, documents)
+            self._built.set()
+        self._finish_build()
+
+    def begin_build(self, rebuild: bool = False) -> bool:
+        """
+        Claim the initial build of the index, or with `rebuild` a fresh build
+        of an index that is already built. Returns False if a build has
+        already been started elsewhere. Paths changed until the build is
+        loaded (or aborted) are applied after it.
+        """
+        with self._lock:
+            if self._building or (self._build_started and not rebuild):
+                return False
+            self._build_started = True
+            self._building = True
+            self._build_finished.clear()
+        return True
+
+    def abort_build(self) -> None:
+        """
+        Give up on a claimed build, keeping the current contents of the
+        index. If it was never built, the next `ensure_built` builds it.
+        """
+        with self._lock:
+            if not self.is_built:
+                self._build_started = False
+        self._finish_build()
+
+    def _finish_build(self) -> None:
+        with self._lock:
+            self._building = False
+            pending, self._pending_paths = self._pending_paths, set()
+            self._build_finished.set()
+        if self.is_built:
+            for path in sorted(pending):
+                self.update_path(path)
+
+    def ensure_built(self) -> None:
+        while not self.is_built:
+            if self.begin_build():
+                self.build()
+            else:
+                self._build_finished.wait()
+
+    def update_path(self, filesystem_path: str) -> None:
+        """
+        Bring the index up to date for a file or directory that was created,
+        modified or deleted.
+        """
+        with self._lock:
+            if self._building:
+                self._pending_paths.add(filesystem_path)
+                return
+        if not self.is_built:
+            return
+        with self._lock:
+            if filesystem_path.endswith(".py") or filesystem_path in self._document_ids_by_file:
+                stale_files = [filesystem_path]
+            else:
+                # A directory was created, moved or deleted
+                stale_files = [
+                    file_path for file_path in self._document_ids_by_file
+                    if file_path.startswith(filesystem_path.rstrip("/") + "/")
+                ]
+            for file_path in stale_files:
+                self._remove_file(file_path)
+
+            if os.path.isdir(filesystem_path):
+                if is_llmignored(filesystem_path, is_dir=True):
+                    return
+                for file_path in iter_python_files(filesystem_path):
+                    self._add_file(file_path, self._parse_file(file_path, use_cache=True))
+            elif filesystem_path.endswith(".py") and os.path.isfile(filesystem_path) \
+                    and not is_llmignored(filesystem_path):
+                self._add_file(filesystem_path, self._parse_file(filesystem_path, use_cache=True))
+
+    def search(self, query: str, kind: Optional[str] = None, limit: int = 10) -> List[RetrievalResult]:
+        """
+        Return the `limit` symbols that best match the terms of `query` by
+        BM25 score, best first. Symbols matching none of the terms are not
+        returned.
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            if not terms or not self._documents:
+                return []
+            document_count = len(self._documents)
+            average_length = self._total_length / document_count
+            scores: Dict[int, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (document_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for document_id, frequency in postings.items():
+                    length_ratio = self._documents[document_id].length / average_length
+                    scores[document_id] = scores.get(document_id, 0.0) + idf * frequency * (K1 + 1) / (
+                        frequency + K1 * (1 - B + B * length_ratio))
+            if kind is not None:
+                scores = {
+                    document_id: score for document_id, score in scores.items()
+                    if self._documents[document_id].symbol.kind == kind
+                }
+            # Ties go to the symbol indexed first
+            best = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+            return [
+                RetrievalResult(self._documents[document_id].symbol, self._documents[document_id].docstring,
+                                round(score, 4))
+                for document_id, score in best
+            ]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "files": len(self._document_ids_by_file),
+            "symbols": len(self._documents),
+            "terms": len(self._postings),
+            "built": self.is_built,
+        }
+
+    def _parse_file(self, file_path: str, use_cache: bool = False) -> List[SymbolDocument]:
+        endpoint_path = get_endpoint_path(file_path)
+        try:
+            if use_cache:
+                # Shares the parse (and its invalidation) with file summaries
+                return parsed_module_cache.get_derived(
+                    file_path,
+                    "retrieval_documents",
+                    lambda module: extract_symbol_documents(module.tree, endpoint_path),
+                )
+            with open(file_path, "r") as file:
+                parsed_ast = ast.parse(file.read())
+        except (OSError, SyntaxError, UnicodeDecodeError, ValueError):
+            return []
+        return extract_symbol_documents(parsed_ast, endpoint_path)
+
+    def _add_file(self, file_path: str, documents: List[SymbolDocument]) -> None:
+        if not documents:
+            return
+        document_ids = []
+        for document in documents:
+            document_id = self._next_id
+            self._next_id += 1
+            self._documents[document_id] = document
+            self._total_length += document.length
+            for term, frequency in document.term_counts.items():
+                self._postings.setdefault(term, {})[document_id] = frequency
+            document_ids.append(document_id)
+        self._document_ids_by_file[file_path] = document_ids
+
+    def _remove_file(self, file_path: str) -> None:
+        for document_id in self._document_ids_by_file.pop(file_path, []):
+            document = self._documents.pop(document_id)
+            self._total_length -= document.length
+            for term in document.term_counts:
+                postings = self._postings[term]
+                del postings[document_id]
+                if not postings:
+                    del self._postings[term]
+
+
+retrieval_index = RetrievalIndex(settings.REPO_ROOT)
+register_file_change_listener(retrieval_index.update_path)
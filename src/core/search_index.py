@@ -0,0 +1,442 @@
+import bisect
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from src.core.config import settings
+from src.core.file_events import register_file_change_listener
+from src.core.llmignore import LLMIgnoreMatcher, get_llmignore_matcher, relative_to_repo_root
+from src.core.tree_index import tree_index
+from src.utils import BINARY_SNIFF_BYTES, MAX_LINE_CHARS, glob_matches, is_llmignored, looks_binary, walk_directory
+
+try:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+
+# Regexes whose trigram query would have more alternatives than this are
+# only partly used for prefiltering
+MAX_QUERY_ALTERNATIVES = 16
+
+
+def trigrams(data: bytes) -> Set[bytes]:
+    """
+    Distinct trigrams of lowercased (ASCII only) `data`, which serve both
+    case-sensitive and case-insensitive queries.
+    """
+    data = data.lower()
+    return {data[i:i + 3] for i in range(len(data) - 2)}
+
+
+def file_trigrams(filesystem_path: str, max_file_bytes: int) -> Optional[bytes]:
+    """
+    The distinct trigrams of a text file, sorted and concatenated into one
+    compact bytes object, or None if the file is binary, too large or can't
+    be read.
+    """
+    try:
+        with open(filesystem_path, "rb") as f:
+            data = f.read(max_file_bytes + 1)
+    except OSError:
+        return None
+    if len(data) > max_file_bytes or looks_binary(data[:BINARY_SNIFF_BYTES]):
+        return None
+    return b"".join(sorted(trigrams(data)))
+
+
+def index_text_files(batch: List[str], max_file_bytes: int) -> List[Tuple[str, Optional[bytes]]]:
+    """
+    Extract the trigrams of a batch of files. Runs in worker processes when
+    building the index.
+    """
+    return [(path, file_trigrams(path, max_file_bytes)) for path in batch]
+
+
+class TrigramQuery:
+    """
+    Which trigrams a file must contain to possibly match a pattern, as a list
+    of alternatives any one of which must be fully contained. An alternative
+    with no trigrams matches every file.
+    """
+
+    def __init__(self, alternatives: List[Set[bytes]]):
+        self.alternatives = alternatives
+
+    @classmethod
+    def match_all(cls) -> "TrigramQuery":
+        return cls([set()])
+
+    @property
+    def matches_all(self) -> bool:
+        return any(not alternative for alternative in self.alternatives)
+
+    def and_(self, other: "TrigramQuery") -> "TrigramQuery":
+        if len(self.alternatives) * len(other.alternatives) > MAX_QUERY_ALTERNATIVES:
+            # Keep whichever side is more selective rather than multiplying out
+            return min(self, other, key=lambda query: (query.matches_all, len(query.alternatives)))
+        return TrigramQuery([a | b for a in self.alternatives for b in other.alternatives])
+
+    def or_(self, other: "TrigramQuery") -> "TrigramQuery":
+        if self.matches_all or other.matches_all:
+            return TrigramQuery.match_all()
+        return TrigramQuery(self.alternatives + other.alternatives)
+
+
+def literal_query(literal: str, ignore_case: bool) -> TrigramQuery:
+    data = literal.encode("utf-8")
+    required = trigrams(data)
+    if ignore_case:
+        # Only ASCII is lowercased in the index, so other case-folded
+        # trigrams can't be looked up
+        required = {trigram for trigram in required if trigram.isascii()}
+    return TrigramQuery([required])
+
+
+def regex_query(pattern: str, ignore_case: bool) -> TrigramQuery:
+    """
+    Derive the trigrams any match of `pattern` must contain from the literal
+    runs in it. This is conservative: anything it doesn't understand (e.g.
+    character classes) is treated as matching anything.
+    """
+    flags = re.IGNORECASE if ignore_case else 0
+    return _sequence_query(sre_parse.parse(pattern, flags), ignore_case)
+
+
+def _sequence_query(items: Iterable[Any], ignore_case: bool) -> TrigramQuery:
+    query = TrigramQuery.match_all()
+    literal: List[str] = []
+
+    def flush() -> None:
+        nonlocal query
+        if len(literal) >= 3:
+            query = query.and_(literal_query("".join(literal), ignore_case))
+        literal.clear()
+
+    for op, value in items:
+        if op is sre_constants.LITERAL:
+            literal.append(chr(value))
+            continue
+        flush()
+        if op is sre_constants.SUBPATTERN:
+            query = query.and_(_sequence_query(value[-1], ignore_case))
+        elif op is sre_constants.BRANCH:
+            branches = [_sequence_query(branch, ignore_case) for branch in value[1]]
+            combined = branches[0]
+            for branch in branches[1:]:
+                combined = combined.or_(branch)
+            query = query.and_(combined)
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and value[0] >= 1:
+            # The repeated part occurs at least once
+            query = query.and_(_sequence_query(value[2], ignore_case))
+    flush()
+    return query
+
+
+class SearchMatch(NamedTuple):
+    path: str  # endpoint path, relative to the repo root
+    line_number: int
+    column: int
+    line: str
+    before: List[str]
+    after: List[str]
+
+
+class SearchResult(NamedTuple):
+    matches: List[SearchMatch]
+    candidate_files: int
+    files_with_matches: int
+    truncated: bool
+
+
+class _TrigramPostings:
+    """
+    The contents of a `TrigramIndex`, kept apart so a rebuild can fill a new
+    one while searches keep reading the old one.
+    """
+
+    def __init__(self) -> None:
+        self.file_ids: Dict[str, int] = {}
+        self.paths: Dict[int, str] = {}
+        # Concatenated trigrams of each indexed file, used to remove it again
+        self.file_trigrams: Dict[int, bytes] = {}
+        # trigram -> IDs of the files containing it
+        self.postings: Dict[bytes, Set[int]] = {}
+        self.next_id = 0
+
+    def add_records(self, records: List[Tuple[str, Optional[bytes]]]) -> None:
+        for filesystem_path, concatenated in records:
+            if filesystem_path in self.file_ids:
+                self.remove_file(filesystem_path)
+            if concatenated is None:
+                continue
+            file_id = self.next_id
+            self.next_id += 1
+            self.file_ids[filesystem_path] = file_id
+            self.paths[file_id] = filesystem_path
+            self.file_trigrams[file_id] = concatenated
+            for i in range(0, len(concatenated), 3):
+                trigram = concatenated[i:i + 3]
+                postings = self.postings.get(trigram)
+                if postings is None:
+                    self.postings[trigram] = {file_id}
+                else:
+                    postings.add(file_id)
+
+    def remove_file(self, filesystem_path: str) -> None:
+        file_id = self.file_ids.pop(filesystem_path)
+        del self.paths[file_id]
+        concatenated = self.file_trigrams.pop(file_id)
+        for i in range(0, len(concatenated), 3):
+            trigram = concatenated[i:i + 3]
+            postings = self.postings[trigram]
+            postings.discard(file_id)
+            if not postings:
+                del self.postings[trigram]
+
+
+class TrigramIndex:
+    """
+    Index of the trigrams in every text file under the repo root (minus `.git`
+    and `.llmignore`d paths), for finding the few files that can match a
+    search before reading them. Only trigrams are kept in memory; candidate
+    files are read from disk to find the actual matches.
+
+    Built with files read and split into trigrams by `workers` processes
+    `batch_size` files at a time, then kept current from file change
+    notifications, and rebuilt when `.llmignore` changes. Files larger than
+    `max_file_bytes` and binary files are not indexed, so they are never
+    searched.
+    """
+
+    def __init__(self, root: str, max_file_bytes: int, workers: int = 1, batch_size: int = 64):
+        self.root = os.path.normpath(root)
+        self.max_file_bytes = max_file_bytes
+        self.workers = workers
+        self.batch_size = batch_size
+        self._lock = threading.RLock()
+        self._data = _TrigramPostings()
+        self._matcher: Optional[LLMIgnoreMatcher] = None
+        self._built = threading.Event()
+        self._build_started = False
+        self._rebuild_lock = threading.Lock()
+        # Paths changed while a build is running, applied once it finishes
+        self._building = False
+        self._pending_paths: Set[str] = set()
+
+    @property
+    def is_built(self) -> bool:
+        return self._built.is_set()
+
+    @property
+    def is_current(self) -> bool:
+        """
+        Whether the index is built for the current `.llmignore`.
+        """
+        return self.is_built and self._matcher is get_llmignore_matcher()
+
+    def begin_build(self) -> bool:
+        """
+        Claim the initial build of the index. Returns False if a build has
+        already been started elsewhere.
+        """
+        with self._lock:
+            start_build = not self._build_started
+            self._build_started = True
+        return start_build
+
+    def ensure_built(self) -> None:
+        if self.begin_build():
+            self.build()
+        else:
+            self._built.wait()
+        if self._matcher is not get_llmignore_matcher():
+            # `.llmignore` changed, so different files should be indexed
+            with self._rebuild_lock:
+                if self._matcher is not get_llmignore_matcher():
+                    self.build()
+
+    def build(self) -> None:
+        """
+        Index every text file under the repo root, replacing any previous
+        contents of the index. Searches keep using the previous contents
+        until the new ones are complete.
+        """
+        matcher = get_llmignore_matcher()
+        data = _TrigramPostings()
+        with self._lock:
+            self._building = True
+        try:
+            paths = [entry.path for entry in walk_directory(self.root)
+                     if not entry.is_dir and entry.size is not None and entry.size <= self.max_file_bytes]
+            batches = [paths[i:i + self.batch_size] for i in range(0, len(paths), self.batch_size)]
+            if self.workers > 1 and len(batches) > 1:
+                with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                    for records in executor.map(index_text_files, batches, [self.max_file_bytes] * len(batches)):
+                        data.add_records(records)
+            else:
+                for batch in batches:
+                    data.add_records(index_text_files(batch, self.max_file_bytes))
+            with self._lock:
+                self._data = data
+                self._matcher = matcher
+        finally:
+            with self._lock:
+                self._building = False
+                pending, self._pending_paths = self._pending_paths, set()
+            self._built.set()
+        for path in sorted(pending):
+            self.update_path(path)
+        # Changes made by commands run in the repo only reach the index
+        # through the watcher
+        if tree_index.enabled:
+            tree_index.start_watching()
+
+    def update_path(self, filesystem_path: str) -> None:
+        """
+        Bring the index up to date for a file or directory that was created,
+        modified or deleted.
+        """
+        path = os.path.normpath(filesystem_path)
+        with self._lock:
+            if self._building:
+                self._pending_paths.add(path)
+                return
+        if not self.is_built:
+            return
+        if path != self.root and not path.startswith(self.root + "/"):
+            return
+        if "/.git/" in path + "/" or is_llmignored(path):
+            paths = []
+        elif os.path.isdir(path):
+            paths = [entry.path for entry in walk_directory(path) if not entry.is_dir]
+        else:
+            paths = [path]
+
+        # Files still there are replaced when they are re-added, so searches
+        # never miss them in between
+        with self._lock:
+            data = self._data
+            if path in data.file_ids:
+                stale = [] if paths == [path] else [path]
+            else:
+                # A directory was moved, deleted or newly ignored
+                prefix = path + "/"
+                keep = set(paths)
+                stale = [file_path for file_path in data.file_ids if file_path.startswith(prefix) and file_path not in keep]
+            for file_path in stale:
+                data.remove_file(file_path)
+        records = index_text_files(paths, self.max_file_bytes)
+        with self._lock:
+            self._data.add_records(records)
+
+    def candidates(self, query: TrigramQuery) -> List[str]:
+        """
+        Filesystem paths of the indexed files that can match `query`, sorted.
+        """
+        with self._lock:
+            data = self._data
+            file_ids: Set[int] = set()
+            for alternative in query.alternatives:
+                if not alternative:
+                    return sorted(data.file_ids)
+                postings = sorted((data.postings.get(trigram, set()) for trigram in alternative), key=len)
+                matching = set(postings[0])
+                for other in postings[1:]:
+                    if not matching:
+                        break
+                    matching &= other
+                file_ids |= matching
+            return sorted(data.paths[file_id] for file_id in file_ids)
+
+    def search(self,
+               pattern: str,
+               is_regex: bool = False,
+               ignore_case: bool = False,
+               include: Optional[List[str]] = None,
+               context_lines: int = 0,
+               max_results: int = 100) -> SearchResult:
+        """
+        Find the lines matching `pattern` (a literal string, or a python
+        regular expression if `is_regex`) in the indexed files whose name or
+        repo-relative path matches one of the `include` globs. Raises
+        `re.error` for invalid regular expressions.
+        """
+        flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+        if is_regex:
+            regex = re.compile(pattern, flags)
+            query = regex_query(pattern, ignore_case)
+        else:
+            regex = re.compile(re.escape(pattern), flags)
+            query = literal_query(pattern, ignore_case)
+
+        # Also checked here for files ignored since the index was built
+        candidates = [path for path in self.candidates(query) if not is_llmignored(path)]
+        if include:
+            candidates = [path for path in candidates
+                          if glob_matches(os.path.basename(path), relative_to_repo_root(path), include)]
+        matches: List[SearchMatch] = []
+        files_with_matches = 0
+        truncated = False
+        for path in candidates:
+            file_matches = list(self._search_file(path, regex, context_lines, max_results - len(matches) + 1))
+            if file_matches:
+                files_with_matches += 1
+            matches.extend(file_matches)
+            if len(matches) > max_results:
+                del matches[max_results:]
+                truncated = True
+                break
+        return SearchResult(matches, len(candidates), files_with_matches, truncated)
+
+    def _search_file(self, filesystem_path: str, regex: re.Pattern, context_lines: int, limit: int) -> Iterator[SearchMatch]:
+        try:
+            with open(filesystem_path, "rb") as f:
+                text = f.read().decode("utf-8", errors="replace")
+        except OSError:
+            return
+        line_starts: Optional[List[int]] = None
+        endpoint_path = relative_to_repo_root(filesystem_path)
+        last_line = -1
+        found = 0
+        for match in regex.finditer(text):
+            if line_starts is None:
+                line_starts = [0] + [m.end() for m in re.finditer("\n", text)]
+            line_index = bisect.bisect_right(line_starts, match.start()) - 1
+            # One result per line, like grep
+            if line_index == last_line:
+                continue
+            last_line = line_index
+            first = max(0, line_index - context_lines)
+            last = min(len(line_starts) - 1, line_index + context_lines)
+            end = line_starts[last + 1] - 1 if last + 1 < len(line_starts) else len(text)
+            lines = [line[:MAX_LINE_CHARS] for line in text[line_starts[first]:end].split("\n")]
+            offset = line_index - first
+            yield SearchMatch(
+                path=endpoint_path,
+                line_number=line_index + 1,
+                column=match.start() - line_starts[line_index] + 1,
+                line=lines[offset],
+                before=lines[:offset],
+                after=lines[offset + 1:],
+            )
+            found += 1
+            if found >= limit:
+                return
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"files": len(self._data.file_ids), "trigrams": len(self._data.postings), "built": self.is_built}
+
+
+search_index = TrigramIndex(
+    settings.REPO_ROOT,
+    max_file_bytes=settings.SEARCH_INDEX_MAX_FILE_BYTES,
+    workers=settings.INDEXER_WORKERS or os.cpu_count() or 1,
+    batch_size=settings.INDEXER_BATCH_SIZE,
+)
+register_file_change_listener(search_index.update_path)
@@ -0,0 +1,213 @@
+import asyncio
+import heapq
+import json
+import os
+import re
+import threading
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from src.core.config import settings
+from src.core.jobs import Job, CANCELLED, COMPLETED
+
+
+# e.g. "0.52s call     tests/test_api.py::test_get[1]"
+_DURATION_LINE = re.compile(r"^\s*(\d+(?:\.\d+)?)s (setup|call|teardown)\s+(\S.*?)\s*$")
+
+# Pytest's exit code when no tests were collected
+NO_TESTS_COLLECTED = 5
+
+
+class DurationHistory:
+    """
+    How long each test took on its most recent run, used to balance shards.
+    Kept in memory and, if `path` is set, saved as JSON so it survives
+    restarts.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._durations: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    self._durations = {str(k): float(v) for k, v in json.load(f).items()}
+            except (OSError, ValueError, AttributeError):
+                self._durations = {}
+
+    def get(self, node_id: str) -> Optional[float]:
+        with self._lock:
+            return self._durations.get(node_id)
+
+    def update(self, durations: Dict[str, float]) -> None:
+        if not durations:
+            return
+        with self._lock:
+            self._durations.update(durations)
+            snapshot = dict(self._durations) if self.path else None
+        if snapshot is not None:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self.path)
+
+    def estimate(self, node_ids: Iterable[str]) -> Dict[str, float]:
+        """
+        Durations for `node_ids`, using the median known duration for tests
+        that haven't been timed yet.
+        """
+        with self._lock:
+            known = {node_id: self._durations[node_id] for node_id in node_ids if node_id in self._durations}
+        if known:
+            values = sorted(known.values())
+            default = values[len(values) // 2]
+        else:
+            default = 1.0
+        return {node_id: known.get(node_id, default) for node_id in node_ids}
+
+
+def parse_collected_node_ids(lines: Iterable[str]) -> List[str]:
+    """
+    Test node IDs from the output of `pytest --collect-only -q`.
+    """
+    node_ids = []
+    for line in lines:
+        line = line.rstrip()
+        if not line:
+            # The IDs are followed by a blank line and a summary
+            if node_ids:
+                break
+            continue
+        if "::" in line and not line.startswith((" ", "=", "<")):
+            node_ids.append(line)
+    return node_ids
+
+
+def parse_durations(lines: Iterable[str]) -> Dict[str, float]:
+    """
+    Total setup, call and teardown time per test from pytest's
+    `--durations=0` report.
+    """
+    durations: Dict[str, float] = {}
+    for line in lines:
+        match = _DURATION_LINE.match(line)
+        if match:
+            seconds, _, node_id = match.groups()
+            durations[node_id] = durations.get(node_id, 0.0) + float(seconds)
+    return durations
+
+
+def partition_tests(durations: Dict[str, float], shards: int) -> List[List[str]]:
+    """
+    Split tests into at most `shards` groups with similar total durations,
+    assigning the longest tests first to the least loaded shard. Tests keep
+    their collection order within a shard.
+    """
+    order = {node_id: i for i, node_id in enumerate(durations)}
+    loads = [(0.0, i) for i in range(min(shards, len(durations)))]
+    groups: List[List[str]] = [[] for _ in loads]
+    for node_id in sorted(durations, key=lambda node_id: (-durations[node_id], order[node_id])):
+        load, i = heapq.heappop(loads)
+        groups[i].append(node_id)
+        heapq.heappush(loads, (load + durations[node_id], i))
+    return [sorted(group, key=order.__getitem__) for group in groups]
+
+
+def compact_node_ids(group: List[str], all_node_ids: List[str]) -> List[str]:
+    """
+    Replace the node IDs of files whose tests all ended up in `group` with
+    the file's path, to keep command lines short.
+    """
+    tests_per_file: Dict[str, int] = {}
+    for node_id in all_node_ids:
+        path = node_id.split("::", 1)[0]
+        tests_per_file[path] = tests_per_file.get(path, 0) + 1
+    in_group: Dict[str, int] = {}
+    for node_id in group:
+        path = node_id.split("::", 1)[0]
+        in_group[path] = in_group.get(path, 0) + 1
+
+    compacted = []
+    for node_id in group:
+        path = node_id.split("::", 1)[0]
+        if in_group[path] == tests_per_file[path]:
+            if path not in compacted:
+                compacted.append(path)
+        else:
+            compacted.append(node_id)
+    return compacted
+
+
+def merge_exit_codes(exit_codes: List[Optional[int]]) -> int:
+    """
+    Overall pytest exit code for a run split into shards: the most severe
+    shard exit code, where shards with no tests don't count.
+    """
+    codes = [code if code is not None else 1 for code in exit_codes]
+    ran = [code for code in codes if code != NO_TESTS_COLLECTED]
+    return max(ran) if ran else NO_TESTS_COLLECTED
+
+
+class ShardedRun(NamedTuple):
+    collect_job: Job
+    shard_jobs: List[Job]
+    shard_tests: List[int]
+
+
+async def run_sharded_tests(submit_job: Callable[[List[str]], Job],
+                            collect_command_line: List[str],
+                            shard_command_line: List[str],
+                            shards: int,
+                            durations: DurationHistory,
+                            rootdir: str) -> ShardedRun:
+    """
+    Collect the tests selected by `collect_command_line`, split them into
+    `shards` groups balanced by their last known durations, and run each
+    group as its own job (started with `submit_job(command_line)`) by
+    appending its tests to `shard_command_line`. Durations reported by the
+    shards are recorded for next time.
+
+    Every run uses `rootdir` as pytest's rootdir, so node IDs are relative
+    to it whatever paths were collected; they are passed to the shards as
+    absolute paths, which don't depend on the directory the shards run in.
+    """
+    rootdir_option = f"--rootdir={rootdir}"
+    collect_job = submit_job(collect_command_line + [rootdir_option, "--collect-only", "-q"])
+    await _wait_for_jobs([collect_job])
+    # Output may have been spilled to disk, and the history is saved to it,
+    # so both are handled off the event loop
+    node_ids = await run_in_threadpool(parse_collected_node_ids, collect_job.output.iter_lines()) \
+        if collect_job.status == COMPLETED and collect_job.exit_code == 0 else []
+    if not node_ids:
+        return ShardedRun(collect_job, [], [])
+
+    groups = partition_tests(durations.estimate(node_ids), shards)
+    shard_jobs = []
+    for group in groups:
+        tests = [os.path.join(rootdir, node_id) for node_id in compact_node_ids(group, node_ids)]
+        shard_jobs.append(submit_job(shard_command_line + [rootdir_option, "--durations=0"] + tests))
+    await _wait_for_jobs(shard_jobs)
+
+    for job in shard_jobs:
+        if job.status == COMPLETED:
+            await run_in_threadpool(_record_durations, durations, job)
+    return ShardedRun(collect_job, shard_jobs, [len(group) for group in groups])
+
+
+def _record_durations(durations: DurationHistory, job: Job) -> None:
+    durations.update(parse_durations(job.output.iter_lines()))
+
+
+async def _wait_for_jobs(jobs: List[Job]) -> None:
+    try:
+        await asyncio.gather(*(asyncio.wrap_future(job.future) for job in jobs), return_exceptions=True)
+    except asyncio.CancelledError:
+        # The client disconnected
+        for job in jobs:
+            job.stop(CANCELLED)
+        raise
+
+
+duration_history = DurationHistory(settings.TEST_DURATIONS_PATH)
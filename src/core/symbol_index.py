@@ -0,0 +1,301 @@
+import ast
+import bisect
+import os
+import threading
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from src.core.config import settings
+from src.core.ast_cache import parsed_module_cache
+from src.core.file_events import register_file_change_listener
+from src.utils import is_llmignored, get_endpoint_path, walk_directory
+
+
+class Symbol(NamedTuple):
+    qualname: str
+    name: str
+    kind: str  # "class", "function" or "method"
+    file_path: str  # endpoint path, relative to the repo root
+    start_line: int
+    end_line: int
+    signature: str
+
+
+def module_name_for_path(endpoint_path: str) -> str:
+    module_path = endpoint_path[:-len(".py")] if endpoint_path.endswith(".py") else endpoint_path
+    parts = [part for part in module_path.split("/") if part]
+    if parts and parts[-1] == "__init__":
+        parts.pop()
+    return ".".join(parts)
+
+
+def _function_signature(node: ast.AST) -> str:
+    prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+    signature = f"{prefix} {node.name}({ast.unparse(node.args)})"
+    if node.returns is not None:
+        signature += f" -> {ast.unparse(node.returns)}"
+    return signature
+
+
+def _class_signature(node: ast.ClassDef) -> str:
+    bases = [ast.unparse(base) for base in node.bases] + [ast.unparse(keyword) for keyword in node.keywords]
+    return f"class {node.name}({', '.join(bases)})" if bases else f"class {node.name}"
+
+
+def _iter_symbol_nodes(body: List[ast.stmt],
+                       prefix: str,
+                       file_path: str,
+                       in_class: bool) -> Iterator[Tuple[ast.AST, Symbol]]:
+    for node in body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            start_line = min([node.lineno] + [dec.lineno for dec in node.decorator_list])
+            yield node, Symbol(
+                qualname=f"{prefix}.{node.name}" if prefix else node.name,
+                name=node.name,
+                kind="method" if in_class else "function",
+                file_path=file_path,
+                start_line=start_line,
+                end_line=node.end_lineno,
+                signature=_function_signature(node),
+            )
+        elif isinstance(node, ast.ClassDef):
+            qualname = f"{prefix}.{node.name}" if prefix else node.name
+            start_line = min([node.lineno] + [dec.lineno for dec in node.decorator_list])
+            yield node, Symbol(
+                qualname=qualname,
+                name=node.name,
+                kind="class",
+                file_path=file_path,
+                start_line=start_line,
+                end_line=node.end_lineno,
+                signature=_class_signature(node),
+            )
+            yield from _iter_symbol_nodes(node.body, qualname, file_path, in_class=True)
+
+
+def iter_symbol_nodes(parsed_ast: ast.Module, endpoint_path: str) -> Iterator[Tuple[ast.AST, Symbol]]:
+    """
+    Yield each class, function and method defined in a module with its AST
+    node, for indexes that need more of the definition than its `Symbol`.
+    """
+    return _iter_symbol_nodes(parsed_ast.body, module_name_for_path(endpoint_path), endpoint_path, in_class=False)
+
+
+def extract_python_symbols(parsed_ast: ast.Module, endpoint_path: str) -> List[Symbol]:
+    """
+    Return the classes, functions and methods defined in a module (including
+    nested classes), qualified by the module's dotted name.
+    """
+    return [symbol for _, symbol in iter_symbol_nodes(parsed_ast, endpoint_path)]
+
+
+def iter_python_files(root: str) -> Iterator[str]:
+    """
+    Yield the filesystem paths of python files under `root`, skipping `.git`
+    and anything ignored in `.llmignore`.
+    """
+    for entry in walk_directory(root):
+        if not entry.is_dir and entry.name.endswith(".py"):
+            yield entry.path
+
+
+class SymbolIndex:
+    """
+    In-memory table of python symbols in the target repo. Lookups by qualified
+    name are a dict access and searches are a binary search over sorted keys,
+    so neither touches the filesystem.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._lock = threading.RLock()
+        self._symbols: Dict[str, Symbol] = {}
+        self._symbols_by_file: Dict[str, List[str]] = {}
+        # Sorted (lowercase key, qualname) pairs used for prefix search by
+        # short name and by qualified name
+        self._by_name: List[Tuple[str, str]] = []
+        self._by_qualname: List[Tuple[str, str]] = []
+        self._built = threading.Event()
+        self._build_started = False
+        # Set when a build finishes, whether or not it succeeded
+        self._build_finished = threading.Event()
+        # Paths changed while a build is running, applied once it finishes
+        self._building = False
+        self._pending_paths: Set[str] = set()
+
+    @property
+    def is_built(self) -> bool:
+        return self._built.is_set()
+
+    def build(self) -> None:
+        """
+        Index every python file under the repo root, replacing any previous
+        contents of the index.
+        """
+        symbols_by_file: Dict[str, List[Symbol]] = {}
+        try:
+            for file_path in iter_python_files(self.root):
+                symbols = self._parse_file(file_path)
+                if symbols:
+                    symbols_by_file[file_path] = symbols
+        except BaseException:
+            self.abort_build()
+            raise
+        self.load(symbols_by_file)
+
+    def load(self, symbols_by_file: Dict[str, List[Symbol]]) -> None:
+        """
+        Replace the contents of the index with already extracted symbols.
+        """
+        with self._lock:
+            self._symbols = {}
+            self._symbols_by_file = {}
+            for file_path, symbols in symbols_by_file.items():
+                self._symbols_by_file[file_path] = list(dict.fromkeys(symbol.qualname for symbol in symbols))
+                for symbol in symbols:
+                    self._symbols[symbol.qualname] = symbol
+            self._by_name = sorted((symbol.name.lower(), qualname) for qualname, symbol in self._symbols.items())
+            self._by_qualname = sorted((qualname.lower(), qualname) for qualname in self._symbols)
+            self._built.set()
+        self._finish_build()
+
+    def begin_build(self, rebuild: bool = False) -> bool:
+        """
+        Claim the initial build of the index, or with `rebuild` a fresh build
+        of an index that is already built. Returns False if a build has
+        already been started elsewhere. Paths changed until the build is
+        loaded (or aborted) are applied after it.
+        """
+        with self._lock:
+            if self._building or (self._build_started and not rebuild):
+                return False
+            self._build_started = True
+            self._building = True
+            self._build_finished.clear()
+        return True
+
+    def abort_build(self) -> None:
+        """
+        Give up on a claimed build, keeping the current contents of the
+        index. If it was never built, the next `ensure_built` builds it.
+        """
+        with self._lock:
+            if not self.is_built:
+                self._build_started = False
+        self._finish_build()
+
+    def _finish_build(self) -> None:
+        with self._lock:
+            self._building = False
+            pending, self._pending_paths = self._pending_paths, set()
+            self._build_finished.set()
+        if self.is_built:
+            for path in sorted(pending):
+                self.update_path(path)
+
+    def ensure_built(self) -> None:
+        while not self.is_built:
+            if self.begin_build():
+                self.build()
+            else:
+                self._build_finished.wait()
+
+    def update_path(self, filesystem_path: str) -> None:
+        """
+        Bring the index up to date for a file or directory that was created,
+        modified or deleted.
+        """
+        with self._lock:
+            if self._building:
+                self._pending_paths.add(filesystem_path)
+                return
+        if not self.is_built:
+            return
+        with self._lock:
+            if filesystem_path.endswith(".py") or filesystem_path in self._symbols_by_file:
+                stale_files = [filesystem_path]
+            else:
+                # A directory was created, moved or deleted
+                stale_files = [
+                    file_path for file_path in self._symbols_by_file
+                    if file_path.startswith(filesystem_path.rstrip("/") + "/")
+                ]
+            for file_path in stale_files:
+                self._remove_file(file_path)
+
+            if os.path.isdir(filesystem_path):
+                if is_llmignored(filesystem_path, is_dir=True):
+                    return
+                for file_path in iter_python_files(filesystem_path):
+                    self._add_file(file_path, self._parse_file(file_path, use_cache=True))
+            elif filesystem_path.endswith(".py") and os.path.isfile(filesystem_path) \
+                    and not is_llmignored(filesystem_path):
+                self._add_file(filesystem_path, self._parse_file(filesystem_path, use_cache=True))
+
+    def get(self, qualname: str) -> Optional[Symbol]:
+        return self._symbols.get(qualname)
+
+    def search(self, query: str, kind: Optional[str] = None, limit: int = 50) -> List[Symbol]:
+        """
+        Case-insensitive prefix search. Queries containing a `.` match against
+        qualified names, otherwise against the symbol's own name.
+        """
+        query = query.lower()
+        results: List[Symbol] = []
+        seen: Set[str] = set()
+        with self._lock:
+            keys = self._by_qualname if "." in query else self._by_name
+            position = bisect.bisect_left(keys, (query, ""))
+            while position < len(keys) and len(results) < limit:
+                key, qualname = keys[position]
+                position += 1
+                if not key.startswith(query):
+                    break
+                symbol = self._symbols.get(qualname)
+                if symbol is None or qualname in seen or (kind is not None and symbol.kind != kind):
+                    continue
+                seen.add(qualname)
+                results.append(symbol)
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {"files": len(self._symbols_by_file), "symbols": len(self._symbols), "built": self.is_built}
+
+    def _parse_file(self, file_path: str, use_cache: bool = False) -> List[Symbol]:
+        try:
+            if use_cache:
+                parsed_ast = parsed_module_cache.get(file_path).tree
+            else:
+                with open(file_path, "r") as file:
+                    parsed_ast = ast.parse(file.read())
+        except (OSError, SyntaxError, UnicodeDecodeError, ValueError):
+            return []
+        return extract_python_symbols(parsed_ast, get_endpoint_path(file_path))
+
+    def _add_file(self, file_path: str, symbols: List[Symbol]) -> None:
+        if not symbols:
+            return
+        # A name defined more than once in a file (e.g. a property's getter
+        # and setter) is indexed once, as its last definition, so it has one
+        # key to remove
+        symbols_by_qualname = {symbol.qualname: symbol for symbol in symbols}
+        self._symbols_by_file[file_path] = list(symbols_by_qualname)
+        for qualname, symbol in symbols_by_qualname.items():
+            if qualname not in self._symbols:
+                bisect.insort(self._by_name, (symbol.name.lower(), qualname))
+                bisect.insort(self._by_qualname, (qualname.lower(), qualname))
+            self._symbols[qualname] = symbol
+
+    def _remove_file(self, file_path: str) -> None:
+        for qualname in self._symbols_by_file.pop(file_path, []):
+            symbol = self._symbols.get(qualname)
+            if symbol is None or symbol.file_path != get_endpoint_path(file_path):
+                continue
+            del self._symbols[qualname]
+            for keys, key in ((self._by_name, symbol.name.lower()), (self._by_qualname, qualname.lower())):
+                position = bisect.bisect_left(keys, (key, qualname))
+                if position < len(keys) and keys[position] == (key, qualname):
+                    del keys[position]
+
+
+symbol_index = SymbolIndex(settings.REPO_ROOT)
+register_file_change_listener(symbol_index.update_path)
@@ -0,0 +1,190 @@
+import ast
+import fnmatch
+import os
+from collections import deque
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
+
+from src.core.ast_cache import ParsedModule, parsed_module_cache
+from src.core.config import settings
+from src.core.symbol_index import iter_python_files
+
+
+# Changes to these files at the repo root can affect any test
+TEST_CONFIGURATION_FILES = ("conftest.py", "pytest.ini", "tox.ini", "setup.cfg", "pyproject.toml", "setup.py")
+
+
+def is_test_file(filesystem_path: str) -> bool:
+    name = os.path.basename(filesystem_path)
+    return any(fnmatch.fnmatch(name, pattern) for pattern in settings.TEST_FILE_PATTERNS)
+
+
+def module_names_for_file(filesystem_path: str, root: str) -> List[str]:
+    """
+    Names a python file can be imported as: its dotted path relative to the
+    repo root, and relative to the directory its top-level package lives in
+    (the nearest ancestor without an `__init__.py`), which is what a `src/`
+    layout or pytest's rootdir handling puts on `sys.path`.
+    """
+    relative_path = os.path.relpath(filesystem_path, root)[:-len(".py")]
+    parts = relative_path.split(os.sep)
+    is_package = parts[-1] == "__init__"
+    if is_package:
+        parts.pop()
+
+    package_depth = 0
+    directory = os.path.dirname(filesystem_path)
+    while directory != root and os.path.exists(os.path.join(directory, "__init__.py")):
+        package_depth += 1
+        directory = os.path.dirname(directory)
+    local_parts = parts[-package_depth:] if is_package else parts[-(package_depth + 1):]
+    if is_package and not package_depth:
+        local_parts = []
+
+    names = [".".join(parts), ".".join(local_parts)]
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def extract_imports(parsed_ast: ast.AST, package: str) -> Set[str]:
+    """
+    Dotted names of the modules a module imports. For `from x import y`
+    both `x` and `x.y` are included, as `y` may be a submodule. `package` is
+    the module's package, used to resolve relative imports.
+    """
+    imported = set()
+    for node in ast.walk(parsed_ast):
+        if isinstance(node, ast.Import):
+            imported.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                base_parts = package.split(".") if package else []
+                if node.level > 1:
+                    base_parts = base_parts[:-(node.level - 1)]
+                base = ".".join(base_parts + ([node.module] if node.module else []))
+            else:
+                base = node.module or ""
+            if base:
+                imported.add(base)
+            imported.update(f"{base}.{alias.name}" if base else alias.name
+                            for alias in node.names if alias.name != "*")
+    return imported
+
+
+class ImpactedTests(NamedTuple):
+    # Filesystem paths of the test files to run, or None to run every test
+    test_files: Optional[List[str]]
+    changed_files: List[str]
+    reason: str
+
+
+class ImportGraph:
+    """
+    Which python files in the repo import which, built from the same cached
+    ASTs as the rest of the API so rebuilding it only re-parses files that
+    changed. Imports are resolved to repo files by module name; imports of
+    anything outside the repo are dropped.
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.normpath(root)
+        # module name -> filesystem paths of the files importable by that name
+        self.files_by_module: Dict[str, Set[str]] = {}
+        # imported module name -> filesystem paths of the files importing it
+        self.files_importing: Dict[str, Set[str]] = {}
+        # filesystem path -> filesystem paths of the repo files importing it
+        self.importers: Dict[str, Set[str]] = {}
+
+    def build(self, python_files: Optional[Iterable[str]] = None) -> "ImportGraph":
+        python_files = list(iter_python_files(self.root) if python_files is None else python_files)
+        self.files_by_module = {}
+        self.files_importing = {}
+        self.importers = {path: set() for path in python_files}
+
+        imports_by_file = {}
+        for path in python_files:
+            names = module_names_for_file(path, self.root)
+            for name in names:
+                self.files_by_module.setdefault(name, set()).add(path)
+            imports_by_file[path] = self._imported_modules(path, names)
+            for module in imports_by_file[path]:
+                self.files_importing.setdefault(module, set()).add(path)
+
+        for path, modules in imports_by_file.items():
+            for module in modules:
+                for imported in self._resolve(module):
+                    if imported != path:
+                        self.importers[imported].add(path)
+        return self
+
+    def _imported_modules(self, filesystem_path: str, names: List[str]) -> Set[str]:
+        if not names:
+            return set()
+        # Relative imports are resolved against the package-relative name
+        name = names[-1]
+        package = name if filesystem_path.endswith("__init__.py") else name.rpartition(".")[0]
+
+        def compute(entry: ParsedModule) -> Set[str]:
+            return extract_imports(entry.tree, package)
+        try:
+            return parsed_module_cache.get_derived(filesystem_path, f"imports:{package}", compute)
+        except (OSError, SyntaxError, UnicodeDecodeError, ValueError):
+            return set()
+
+    def _resolve(self, module: str) -> Set[str]:
+        # Importing a.b.c also runs the packages a and a.b
+        files = set()
+        parts = module.split(".")
+        for i in range(1, len(parts) + 1):
+            files.update(self.files_by_module.get(".".join(parts[:i]), ()))
+        return files
+
+    def affected_files(self, changed_files: Iterable[str]) -> Set[str]:
+        """
+        The changed files plus every file that transitively imports one of
+        them. Files that no longer exist are matched by module name.
+        """
+        affected = set()
+        queue = deque()
+        for path in changed_files:
+            affected.add(path)
+            if path in self.importers:
+                queue.extend(self.importers[path])
+            else:
+                for name in module_names_for_file(path, self.root):
+                    for module, importers in self.files_importing.items():
+                        if module == name or module.startswith(name + "."):
+                            queue.extend(importers)
+        while queue:
+            path = queue.popleft()
+            if path not in affected:
+                affected.add(path)
+                queue.extend(self.importers.get(path, ()))
+        return affected
+
+
+def find_impacted_tests(changed_files: List[str], root: str) -> ImpactedTests:
+    """
+    Select the test files affected by `changed_files`: changed test files,
+    tests that transitively import a changed module, and every test below a
+    changed `conftest.py`. Changes to the root `conftest.py` or to pytest's
+    configuration select every test. Other non-python files are assumed not
+    to affect tests.
+    """
+    root = os.path.normpath(root)
+    changed_files = [os.path.normpath(path) for path in changed_files]
+    for path in changed_files:
+        if os.path.dirname(path) == root and os.path.basename(path) in TEST_CONFIGURATION_FILES:
+            return ImpactedTests(None, changed_files, f"{os.path.basename(path)} changed")
+
+    changed_python = [path for path in changed_files if path.endswith(".py")]
+    if not changed_python:
+        return ImpactedTests([], changed_files, "No python files changed")
+    graph = ImportGraph(root).build()
+    affected = graph.affected_files(changed_python)
+
+    test_files = {path for path in affected if is_test_file(path) and os.path.exists(path)}
+    for path in changed_python:
+        if os.path.basename(path) == "conftest.py":
+            conftest_dir = os.path.dirname(path) + os.sep
+            test_files.update(test for test in graph.importers if is_test_file(test) and test.startswith(conftest_dir))
+    return ImpactedTests(sorted(test_files), changed_files,
+                         f"{len(test_files)} test files affected by {len(changed_python)} changed python files")
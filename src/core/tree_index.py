@@ -0,0 +1,234 @@
+import atexit
+import os
+import threading
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import watchfiles
+
+from src.core.config import settings
+from src.core.file_events import notify_file_changed, register_file_change_listener, CREATED, MODIFIED, DELETED
+from src.core.llmignore import LLMIgnoreMatcher, get_llmignore_matcher, relative_to_repo_root
+from src.utils import WalkEntry, walk_directory, glob_matches
+
+
+_WATCHFILES_CHANGES = {
+    watchfiles.Change.added: CREATED,
+    watchfiles.Change.modified: MODIFIED,
+    watchfiles.Change.deleted: DELETED,
+}
+
+
+def coalesce_changes(changes: Set[Tuple[watchfiles.Change, str]]) -> Dict[str, str]:
+    """
+    Reduce a batch of watcher events to one change per path, judged by
+    whether the path exists now: a file that was created and then deleted
+    within the batch is dropped, one that was deleted and re-created is
+    reported as modified.
+    """
+    changes_by_path: Dict[str, Set[str]] = {}
+    for change, path in changes:
+        changes_by_path.setdefault(path, set()).add(_WATCHFILES_CHANGES[change])
+
+    coalesced = {}
+    for path, path_changes in changes_by_path.items():
+        exists = os.path.lexists(path)
+        if CREATED in path_changes and DELETED not in path_changes:
+            coalesced[path] = CREATED
+        elif DELETED in path_changes and not exists:
+            if CREATED not in path_changes:
+                coalesced[path] = DELETED
+        elif exists:
+            coalesced[path] = MODIFIED
+    return coalesced
+
+
+class TreeIndex:
+    """
+    In-memory copy of the repo's file tree (minus `.git` and `.llmignore`d
+    paths) so directory listings and file structure requests don't touch the
+    disk. Built once, then kept current from file change notifications, which
+    come both from the API's own writes and from a `watchfiles` watcher for
+    changes made by anything else (e.g. commands run in the target repo's
+    container).
+    """
+
+    def __init__(self, root: str, build_mode: str):
+        self.root = os.path.normpath(root)
+        self.build_mode = build_mode
+        # directory path -> {child name: file size, or None for directories}
+        self._dirs: Dict[str, Dict[str, Optional[int]]] = {}
+        self._matcher: Optional[LLMIgnoreMatcher] = None
+        self._lock = threading.RLock()
+        self._watcher: Optional[threading.Thread] = None
+        self._stop_watching = threading.Event()
+
+    @property
+    def enabled(self) -> bool:
+        return self.build_mode in ("eager", "lazy")
+
+    @property
+    def watching(self) -> bool:
+        return self._watcher is not None
+
+    @property
+    def is_built(self) -> bool:
+        return self._matcher is not None
+
+    def covers(self, filesystem_path: str) -> bool:
+        path = os.path.normpath(filesystem_path)
+        return path == self.root or path.startswith(self.root + "/")
+
+    def ensure_ready(self) -> bool:
+        """
+        Build the index if it hasn't been built yet, or rebuild it if
+        `.llmignore` changed since it was built. Returns False if the index is
+        disabled, in which case callers should read from disk.
+        """
+        if not self.enabled:
+            return False
+        matcher = get_llmignore_matcher()
+        if self._matcher is matcher:
+            return True
+        with self._lock:
+            if self._matcher is not matcher:
+                self._build(matcher)
+        self.start_watching()
+        return True
+
+    def _build(self, matcher: LLMIgnoreMatcher) -> None:
+        dirs: Dict[str, Dict[str, Optional[int]]] = {self.root: {}}
+        for entry in walk_directory(self.root):
+            dirs[os.path.dirname(entry.path)][entry.name] = entry.size
+            if entry.is_dir and not os.path.islink(entry.path):
+                dirs[entry.path] = {}
+        self._dirs = dirs
+        self._matcher = matcher
+
+    def start_watching(self) -> None:
+        with self._lock:
+            if self._watcher is not None:
+                return
+            self._stop_watching.clear()
+            self._watcher = threading.Thread(target=self._watch, daemon=True)
+            self._watcher.start()
+
+    def stop_watching(self) -> None:
+        self._stop_watching.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=5)
+            self._watcher = None
+
+    def _watch(self) -> None:
+        def watch_filter(change: watchfiles.Change, path: str) -> bool:
+            if "/.git/" in path or path.endswith("/.git"):
+                return False
+            # Changes inside ignored trees (node_modules, virtualenvs) are
+            # dropped here rather than by every listener
+            return not get_llmignore_matcher().is_ignored(relative_to_repo_root(path), os.path.isdir(path))
+
+        for changes in watchfiles.watch(self.root,
+                                        watch_filter=watch_filter,
+                                        debounce=settings.FILE_WATCHER_DEBOUNCE_MS,
+                                        stop_event=self._stop_watching):
+            # Sorted so parent directories are handled before their contents
+            for path, change in sorted(coalesce_changes(changes).items()):
+                notify_file_changed(path, change)
+
+    def walk(self,
+             filesystem_path: str,
+             max_depth: Optional[int] = None,
+             include: Optional[List[str]] = None) -> Iterator[WalkEntry]:
+        """
+        Same as `walk_directory`, but served from memory.
+        """
+        stack = [(os.path.normpath(filesystem_path), 0)]
+        while stack:
+            dir_path, depth = stack.pop()
+            with self._lock:
+                children = list(self._dirs.get(dir_path, {}).items())
+
+            subdirectories = []
+            for name, size in children:
+                path = os.path.join(dir_path, name)
+                if size is None:
+                    yield WalkEntry(path, name, True, None, depth + 1)
+                    if (max_depth is None or depth + 1 < max_depth) and path in self._dirs:
+                        subdirectories.append((path, depth + 1))
+                elif not include or glob_matches(name, relative_to_repo_root(path), include):
+                    yield WalkEntry(path, name, False, size, depth + 1)
+            stack.extend(reversed(subdirectories))
+
+    def list_directory(self, filesystem_path: str) -> Optional[List[str]]:
+        """
+        Names of the entries in a directory, or None if it is not an indexed
+        directory.
+        """
+        with self._lock:
+            children = self._dirs.get(os.path.normpath(filesystem_path))
+            return list(children) if children is not None else None
+
+    def update_path(self, filesystem_path: str) -> None:
+        """
+        Apply a change to a single file or directory to the index.
+        """
+        if not self.covers(filesystem_path):
+            return
+        path = os.path.normpath(filesystem_path)
+        parent, name = os.path.split(path)
+        with self._lock:
+            matcher = self._matcher
+            if matcher is None:
+                return
+            if path == os.path.normpath(str(settings.LLMIGNORE_PATH)):
+                # The ignore patterns changed, rebuild on next use
+                self._matcher = None
+                return
+            if path == self.root:
+                return
+            siblings = self._dirs.get(parent)
+            if siblings is None:
+                # Inside an ignored directory, or the parent's creation hasn't
+                # been applied yet (it will index this path when it is)
+                return
+            is_dir = os.path.isdir(path) and not os.path.islink(path)
+            if not os.path.lexists(path) or name == ".git" or \
+                    matcher.is_ignored(relative_to_repo_root(path), is_dir):
+                siblings.pop(name, None)
+                self._remove_directory(path)
+            elif is_dir:
+                if path not in self._dirs:
+                    # New (or moved in) directory: index everything inside it.
+                    # Existing directories need no work, their contents report
+                    # their own changes.
+                    siblings[name] = None
+                    self._dirs[path] = {}
+                    for entry in walk_directory(path):
+                        self._dirs[os.path.dirname(entry.path)][entry.name] = entry.size
+                        if entry.is_dir and not os.path.islink(entry.path):
+                            self._dirs[entry.path] = {}
+            else:
+                self._remove_directory(path)
+                try:
+                    siblings[name] = os.stat(path).st_size
+                except OSError:
+                    siblings.pop(name, None)
+
+    def _remove_directory(self, path: str) -> None:
+        if path not in self._dirs:
+            return
+        prefix = path + "/"
+        for dir_path in [dir_path for dir_path in self._dirs if dir_path == path or dir_path.startswith(prefix)]:
+            del self._dirs[dir_path]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "directories": len(self._dirs),
+                "files": sum(1 for children in self._dirs.values() for size in children.values() if size is not None),
+            }
+
+
+tree_index = TreeIndex(settings.REPO_ROOT, settings.TREE_INDEX_BUILD)
+register_file_change_listener(tree_index.update_path)
+# The watcher thread must be stopped before the interpreter tears down
+atexit.register(tree_index.stop_watching)
@@ -0,0 +1,480 @@
+import ast
+import json
+import math
+import os
+import re
+import threading
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
+
+import numpy as np
+
+from src.core.config import settings
+from src.core.file_events import register_file_change_listener
+from src.core.retrieval_index import tokenize
+from src.core.symbol_index import iter_python_files, module_name_for_path
+from src.utils import get_endpoint_path, is_llmignored
+
+
+# Rows of the matrix multiplied at a time when scoring, so scoring a
+# memory-mapped index doesn't page the whole matrix in at once
+BLOCK_ROWS = 8192
+VECTORS_FILE = "vectors.npy"
+METADATA_FILE = "chunks.json"
+
+# Identifiers, numbers and single punctuation characters
+TOKEN_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|[0-9]+|[^\sA-Za-z0-9_]")
+
+
+class Chunk(NamedTuple):
+    file_path: str  # endpoint path, relative to the repo root
+    start_line: int
+    end_line: int
+    kind: str  # "module", "class" or "function"
+    name: str  # qualified name of the module, class or function
+
+
+# (filesystem path, (st_mtime_ns, st_size) or None if the file is gone or
+# could not be parsed, chunks, one row per chunk)
+FileVectors = Tuple[str, Optional[Tuple[int, int]], List[Chunk], np.ndarray]
+
+
+def _definition_start(node: ast.AST) -> int:
+    return min([node.lineno] + [decorator.lineno for decorator in node.decorator_list])
+
+
+def _chunk_scope(body: List[ast.stmt],
+                 start_line: int,
+                 end_line: int,
+                 kind: str,
+                 name: str,
+                 lines: List[str],
+                 file_path: str,
+                 chunks: List[Tuple[Chunk, str]]) -> None:
+    def add_chunk(chunk_start: int, chunk_end: int, chunk_kind: str, chunk_name: str) -> None:
+        text = "\n".join(lines[chunk_start - 1:chunk_end])
+        if text.strip():
+            chunks.append((Chunk(file_path, chunk_start, chunk_end, chunk_kind, chunk_name), text))
+
+    position = start_line
+    for node in body:
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            continue
+        node_start = _definition_start(node)
+        add_chunk(position, node_start - 1, kind, name)
+        qualname = f"{name}.{node.name}" if name else node.name
+        if isinstance(node, ast.ClassDef):
+            _chunk_scope(node.body, node_start, node.end_lineno, "class", qualname, lines, file_path, chunks)
+        else:
+            add_chunk(node_start, node.end_lineno, "function", qualname)
+        position = node.end_lineno + 1
+    add_chunk(position, end_line, kind, name)
+
+
+def chunk_python_module(parsed_ast: ast.Module, source: str, endpoint_path: str) -> List[Tuple[Chunk, str]]:
+    """
+    Split a module into chunks at function and class boundaries, using the
+    same line spans (including decorators) as the definition endpoints.
+    Each function or method is a chunk; the code of a class or module
+    between its definitions (imports, class attributes) forms chunks of its
+    own. Returns the chunks with their source.
+    """
+    lines = source.splitlines()
+    chunks: List[Tuple[Chunk, str]] = []
+    _chunk_scope(parsed_ast.body, 1, len(lines), "module", module_name_for_path(endpoint_path),
+                 lines, endpoint_path, chunks)
+    return chunks
+
+
+def _features(text: str) -> Dict[str, int]:
+    tokens = TOKEN_RE.findall(text)
+    features: Dict[str, int] = {}
+    for token in tokens:
+        if token[0].isalpha() or token[0] == "_":
+            features["id:" + token] = features.get("id:" + token, 0) + 1
+            for part in tokenize(token):
+                features["w:" + part] = features.get("w:" + part, 0) + 1
+    for first, second in zip(tokens, tokens[1:]):
+        bigram = f"{first} {second}"
+        features[bigram] = features.get(bigram, 0) + 1
+    return features
+
+
+def embed(text: str, dimensions: int) -> np.ndarray:
+    """
+    Embed code as a unit-length vector of hashed features: identifiers, the
+    words they are made of, and pairs of adjacent tokens. Feature counts are
+    dampened logarithmically. Uses crc32 rather than `hash` so vectors are
+    the same in every process and across restarts.
+    """
+    vector = np.zeros(dimensions, dtype=np.float32)
+    features = _features(text)
+    if not features:
+        return vector
+    indices = np.empty(len(features), dtype=np.int64)
+    values = np.empty(len(features), dtype=np.float32)
+    for i, (feature, count) in enumerate(features.items()):
+        digest = zlib.crc32(feature.encode("utf-8"))
+        indices[i] = digest % dimensions
+        # Signed so that colliding features tend to cancel out
+        values[i] = (1.0 + math.log(count)) * (1.0 if digest & 0x80000000 else -1.0)
+    np.add.at(vector, indices, values)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def cosine_similarities(matrix: np.ndarray, queries: np.ndarray) -> np.ndarray:
+    """
+    Cosine similarity of every row of `matrix` with every row of `queries`,
+    as a (rows, queries) array. Both must hold unit-length vectors.
+    """
+    scores = np.empty((matrix.shape[0], queries.shape[0]), dtype=np.float32)
+    for start in range(0, matrix.shape[0], BLOCK_ROWS):
+        scores[start:start + BLOCK_ROWS] = matrix[start:start + BLOCK_ROWS] @ queries.T
+    return scores
+
+
+def embed_python_files(batch: List[str], dimensions: int) -> List[FileVectors]:
+    """
+    Chunk and embed a batch of python files. Runs in worker processes.
+    Files that are gone, can't be parsed or are `.llmignore`d get no key, so
+    they are removed from the index.
+    """
+    records: List[FileVectors] = []
+    for file_path in batch:
+        if is_llmignored(file_path):
+            records.append((file_path, None, [], np.zeros((0, dimensions), dtype=np.float32)))
+            continue
+        try:
+            with open(file_path, "r") as file:
+                stat = os.fstat(file.fileno())
+                source = file.read()
+            chunks = chunk_python_module(ast.parse(source), source, get_endpoint_path(file_path))
+        except (OSError, SyntaxError, UnicodeDecodeError, ValueError):
+            records.append((file_path, None, [], np.zeros((0, dimensions), dtype=np.float32)))
+            continue
+        vectors = np.zeros((len(chunks), dimensions), dtype=np.float32)
+        for row, (_, text) in enumerate(chunks):
+            vectors[row] = embed(text, dimensions)
+        records.append((file_path, (stat.st_mtime_ns, stat.st_size), [chunk for chunk, _ in chunks], vectors))
+    return records
+
+
+class VectorIndex:
+    """
+    Matrix of embedded python code chunks for finding code similar to a
+    snippet. If `directory` is set the index is saved there and, on the next
+    start, the matrix is memory-mapped rather than rebuilt, so loading is
+    instant and only files changed since are re-embedded.
+
+    Rows of removed or changed chunks are masked out rather than deleted,
+    and new rows are kept in memory beside the (read-only) saved matrix
+    until the index is next saved.
+    """
+
+    def __init__(self,
+                 root: str,
+                 dimensions: int,
+                 directory: Optional[str] = None,
+                 workers: int = 1,
+                 batch_size: int = 64):
+        self.root = root
+        self.dimensions = dimensions
+        self.directory = directory
+        self.workers = workers
+        self.batch_size = batch_size
+        self._lock = threading.RLock()
+        self._clear()
+        self._built = threading.Event()
+        self._build_started = False
+        # Set when a build finishes, whether or not it succeeded
+        self._build_finished = threading.Event()
+        # Paths changed while a build is running, applied once it finishes
+        self._building = False
+        self._pending_paths: Set[str] = set()
+
+    def _clear(self) -> None:
+        # Saved (possibly memory-mapped) rows, then rows added since
+        self._base = np.zeros((0, self.dimensions), dtype=np.float32)
+        self._extra: List[np.ndarray] = []
+        self._extra_matrix: Optional[np.ndarray] = None
+        # Rows added since `_alive` was last extended are alive; it is
+        # extended once when needed rather than once per file
+        self._alive = np.zeros(0, dtype=bool)
+        self._chunks: List[Optional[Chunk]] = []
+        self._rows_by_file: Dict[str, List[int]] = {}
+        self._file_keys: Dict[str, Tuple[int, int]] = {}
+        self._changed = False
+
+    @property
+    def is_built(self) -> bool:
+        return self._built.is_set()
+
+    @property
+    def is_memory_mapped(self) -> bool:
+        return isinstance(self._base, np.memmap)
+
+    def begin_build(self) -> bool:
+        """
+        Claim the initial build of the index. Returns False if a build has
+        already been started elsewhere. Paths changed until the build
+        finishes are applied after it.
+        """
+        with self._lock:
+            if self._build_started:
+                return False
+            self._build_started = True
+            self._building = True
+            self._build_finished.clear()
+        return True
+
+    def ensure_built(self) -> None:
+        while not self.is_built:
+            if self.begin_build():
+                self.build()
+            else:
+                self._build_finished.wait()
+
+    def build(self) -> None:
+        """
+        Load the saved index and re-embed the files that changed since it
+        was saved, or embed every python file under the repo root if there
+        is no usable saved index.
+        """
+        try:
+            with self._lock:
+                self._clear()
+                loaded = self.load()
+            file_paths = list(iter_python_files(self.root))
+            if loaded:
+                stale = [file_path for file_path in file_paths if self._file_key(file_path) != self._file_keys.get(file_path)]
+                # Files deleted or ignored since the index was saved
+                seen = set(file_paths)
+                with self._lock:
+                    for file_path in [file_path for file_path in self._rows_by_file if file_path not in seen]:
+                        self._remove_file(file_path)
+            else:
+                stale = file_paths
+            batches = [stale[i:i + self.batch_size] for i in range(0, len(stale), self.batch_size)]
+            if self.workers > 1 and len(batches) > 1:
+                with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                    for records in executor.map(embed_python_files, batches, [self.dimensions] * len(batches)):
+                        self._add_records(records)
+            else:
+                for batch in batches:
+                    self._add_records(embed_python_files(batch, self.dimensions))
+            if self._changed or not loaded:
+                self.save()
+        except BaseException:
+            # Leave it unbuilt rather than half built, so the next
+            # `ensure_built` tries again
+            with self._lock:
+                self._clear()
+                self._build_started = False
+            raise
+        else:
+            self._built.set()
+        finally:
+            with self._lock:
+                self._building = False
+                pending, self._pending_paths = self._pending_paths, set()
+                self._build_finished.set()
+        for path in sorted(pending):
+            self.update_path(path)
+
+    def update_path(self, filesystem_path: str) -> None:
+        """
+        Bring the index up to date for a file or directory that was created,
+        modified or deleted.
+        """
+        path = os.path.normpath(filesystem_path)
+        with self._lock:
+            if self._building:
+                self._pending_paths.add(path)
+                return
+        if not self.is_built:
+            return
+        if is_llmignored(path):
+            paths = []
+        elif os.path.isdir(path):
+            paths = list(iter_python_files(path))
+        elif path.endswith(".py"):
+            paths = [path]
+        else:
+            paths = []
+        with self._lock:
+            prefix = path + "/"
+            keep = set(paths)
+            for file_path in [file_path for file_path in self._rows_by_file
+                              if (file_path == path or file_path.startswith(prefix)) and file_path not in keep]:
+                self._remove_file(file_path)
+        self._add_records(embed_python_files(paths, self.dimensions))
+
+    def search(self, snippet: str, limit: int = 10, kind: Optional[str] = None) -> List[Tuple[Chunk, float]]:
+        """
+        Return the `limit` chunks most similar to `snippet` with their cosine
+        similarity, best first.
+        """
+        query = embed(snippet, self.dimensions)
+        if not query.any():
+            return []
+        return self.search_vectors(query[np.newaxis, :], limit, kind)[0]
+
+    def search_vectors(self,
+                       queries: np.ndarray,
+                       limit: int = 10,
+                       kind: Optional[str] = None) -> List[List[Tuple[Chunk, float]]]:
+        """
+        Like `search`, for a batch of already embedded queries, scored with
+        a single pass over the matrix.
+        """
+        with self._lock:
+            scores = np.empty((len(self._chunks), queries.shape[0]), dtype=np.float32)
+            scores[:self._base.shape[0]] = cosine_similarities(self._base, queries)
+            if self._extra:
+                if self._extra_matrix is None:
+                    self._extra_matrix = np.vstack(self._extra)
+                scores[self._base.shape[0]:] = cosine_similarities(self._extra_matrix, queries)
+            self._sync_alive()
+            mask = self._alive
+            if kind is not None:
+                mask = mask & np.array([chunk is not None and chunk.kind == kind for chunk in self._chunks], dtype=bool)
+            scores[~mask] = -np.inf
+            limit = min(limit, int(mask.sum()))
+            results = []
+            for column in scores.T:
+                if limit == 0:
+                    results.append([])
+                    continue
+                best = np.argpartition(-column, limit - 1)[:limit]
+                best = best[np.argsort(-column[best], kind="stable")]
+                results.append([(self._chunks[row], round(float(column[row]), 4)) for row in best])
+            return results
+
+    def save(self) -> None:
+        """
+        Write the live rows to `directory` and memory-map them, dropping the
+        rows of removed chunks. Does nothing if `directory` is not set.
+        """
+        if not self.directory:
+            return
+        with self._lock:
+            self._sync_alive()
+            rows = np.flatnonzero(self._alive)
+            matrix = np.zeros((len(rows), self.dimensions), dtype=np.float32)
+            base_rows = rows[rows < self._base.shape[0]]
+            matrix[:len(base_rows)] = self._base[base_rows]
+            if len(base_rows) < len(rows):
+                if self._extra_matrix is None:
+                    self._extra_matrix = np.vstack(self._extra)
+                matrix[len(base_rows):] = self._extra_matrix[rows[len(base_rows):] - self._base.shape[0]]
+            new_rows = {int(row): new_row for new_row, row in enumerate(rows)}
+            metadata = {
+                "dimensions": self.dimensions,
+                "chunks": [list(self._chunks[row]) for row in rows],
+                "files": {
+                    get_endpoint_path(file_path): [list(self._file_keys[file_path]), [new_rows[row] for row in file_rows]]
+                    for file_path, file_rows in self._rows_by_file.items()
+                },
+            }
+            os.makedirs(self.directory, exist_ok=True)
+            vectors_path = os.path.join(self.directory, VECTORS_FILE)
+            metadata_path = os.path.join(self.directory, METADATA_FILE)
+            with open(f"{vectors_path}.tmp", "wb") as f:
+                np.save(f, matrix)
+            with open(f"{metadata_path}.tmp", "w") as f:
+                json.dump(metadata, f)
+            # The old matrix stays readable through its mapping after being
+            # replaced
+            os.replace(f"{vectors_path}.tmp", vectors_path)
+            os.replace(f"{metadata_path}.tmp", metadata_path)
+            self.load()
+
+    def load(self) -> bool:
+        """
+        Memory-map the index saved in `directory`, replacing the contents of
+        the index. Returns False, leaving the index as it was, if there is no
+        saved index or it doesn't match the configured dimensions.
+        """
+        if not self.directory:
+            return False
+        try:
+            with open(os.path.join(self.directory, METADATA_FILE), "r") as f:
+                metadata = json.load(f)
+            matrix = np.load(os.path.join(self.directory, VECTORS_FILE), mmap_mode="r")
+        except (OSError, ValueError):
+            return False
+        if metadata.get("dimensions") != self.dimensions or matrix.shape != (len(metadata["chunks"]), self.dimensions):
+            return False
+        with self._lock:
+            self._clear()
+            self._base = matrix
+            self._alive = np.ones(matrix.shape[0], dtype=bool)
+            self._chunks = [Chunk(*chunk) for chunk in metadata["chunks"]]
+            for endpoint_path, (key, rows) in metadata["files"].items():
+                file_path = os.path.join(self.root, endpoint_path)
+                self._file_keys[file_path] = tuple(key)
+                self._rows_by_file[file_path] = rows
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._sync_alive()
+            return {
+                "files": len(self._rows_by_file),
+                "chunks": int(self._alive.sum()),
+                "rows": len(self._chunks),
+                "dimensions": self.dimensions,
+                "memory_mapped": self.is_memory_mapped,
+                "built": self.is_built,
+            }
+
+    @staticmethod
+    def _file_key(file_path: str) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _sync_alive(self) -> None:
+        if len(self._alive) < len(self._chunks):
+            self._alive = np.concatenate([self._alive, np.ones(len(self._chunks) - len(self._alive), dtype=bool)])
+
+    def _add_records(self, records: List[FileVectors]) -> None:
+        with self._lock:
+            for file_path, key, chunks, vectors in records:
+                self._remove_file(file_path)
+                if key is None:
+                    continue
+                first_row = len(self._chunks)
+                self._chunks.extend(chunks)
+                self._rows_by_file[file_path] = list(range(first_row, first_row + len(chunks)))
+                self._file_keys[file_path] = key
+                if chunks:
+                    self._extra.append(vectors)
+                    self._extra_matrix = None
+                self._changed = True
+
+    def _remove_file(self, file_path: str) -> None:
+        self._file_keys.pop(file_path, None)
+        rows = self._rows_by_file.pop(file_path, None)
+        if rows is None:
+            return
+        for row in rows:
+            self._chunks[row] = None
+        if rows and max(rows) >= len(self._alive):
+            self._sync_alive()
+        self._alive[rows] = False
+        self._changed = True
+
+
+vector_index = VectorIndex(
+    settings.REPO_ROOT,
+    dimensions=settings.VECTOR_INDEX_DIMENSIONS,
+    directory=settings.VECTOR_INDEX_DIR,
+    workers=settings.INDEXER_WORKERS or os.cpu_count() or 1,
+    batch_size=settings.INDEXER_BATCH_SIZE,
+)
+register_file_change_listener(vector_index.update_path)
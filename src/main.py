@@ -1,8 +1,17 @@
+import threading
+
 from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
 
 from src.api.api import api_router, ai_plugin_router
 from src.core.config import settings
+from src.core.indexer import repo_indexer
+from src.core.tree_index import tree_index
+from src.core.search_index import search_index
+from src.core.regex_scan import regex_scanner
+from src.core.vector_index import vector_index
+from src.core.container_pool import container_pool
+from src.core.command_executor import command_executor
 
 app = FastAPI(
     title=settings.PROJECT_NAME, 
@@ -21,3 +30,55 @@ if settings.BACKEND_CORS_ORIGINS:
 
 app.include_router(api_router, prefix=settings.API_V1_STR)
 app.include_router(ai_plugin_router)
+
+
+@app.on_event("startup")
+def build_symbol_index() -> None:
+    # Index in the background so the API can serve requests straight away;
+    # symbol endpoints wait for the build to finish on first use.
+    if settings.SYMBOL_INDEX_ON_STARTUP:
+        repo_indexer.start()
+
+
+@app.on_event("startup")
+def build_search_index() -> None:
+    if settings.SEARCH_INDEX_ON_STARTUP and search_index.begin_build():
+        threading.Thread(target=search_index.build, daemon=True).start()
+
+
+@app.on_event("startup")
+def build_vector_index() -> None:
+    if settings.VECTOR_INDEX_ON_STARTUP and vector_index.begin_build():
+        threading.Thread(target=vector_index.build, daemon=True).start()
+
+
+@app.on_event("startup")
+def build_tree_index() -> None:
+    if settings.TREE_INDEX_BUILD == "eager":
+        threading.Thread(target=tree_index.ensure_ready, daemon=True).start()
+
+
+@app.on_event("shutdown")
+def stop_file_watcher() -> None:
+    tree_index.stop_watching()
+
+
+@app.on_event("shutdown")
+def remove_pooled_containers() -> None:
+    container_pool.close()
+
+
+@app.on_event("shutdown")
+def stop_command_executor() -> None:
+    command_executor.shutdown()
+
+
+@app.on_event("shutdown")
+def stop_regex_scanner() -> None:
+    regex_scanner.shutdown()
+
+
+@app.on_event("shutdown")
+def save_vector_index() -> None:
+    if vector_index.is_built:
+        vector_index.save()
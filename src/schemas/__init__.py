@@ -1,6 +1,7 @@
 from .file import CreateFileRequest, UpdateEntireFileRequest, UpdateFileLineNumberRequest
 from .directory import DirectoryRequest
-from .programming import UpdateFunctionDefinitionRequest, UpdateClassDefinitionRequest, NewFunctionDefinitionRequest, NewClassDefinitionRequest, UpdateFunctionDocstringRequest
-from .command import Command, CommandResponseModel, load_commands
+from .programming import UpdateFunctionDefinitionRequest, UpdateClassDefinitionRequest, NewFunctionDefinitionRequest, NewClassDefinitionRequest, UpdateFunctionDocstringRequest, SymbolResponseModel, RetrievalResultModel, SimilarCodeRequest, CodeChunkResponseModel
+from .command import Command, CommandResponseModel, CommandUsageModel, ShardResponseModel, JobResponseModel, JobOutputResponseModel, PytestCaseModel, PytestResultsModel, PytestResultsResponseModel, load_commands
 from .util import MoveRequest
 from .msg import Msg
+from .search import SearchMatchModel, SearchResponseModel
@@ -1,5 +1,5 @@
 import yaml
-from pydantic import BaseModel, Field, ValidationError
+from pydantic import BaseModel, Field, ValidationError, validator
 from typing import List, Optional
 
 class Flag(BaseModel):
@@ -21,11 +21,112 @@ class Command(BaseModel):
     description: str
     args: Optional[List[Argument]]
     flags: Optional[List[Flag]]
+    max_concurrency: Optional[int] = Field(default=None, gt=0)
+    cacheable: bool = Field(default=False)
+    # Repo-relative paths a cacheable command's result depends on. Defaults
+    # to the paths passed as its arguments, or the whole repo if none are.
+    cache_inputs: Optional[List[str]] = Field(default=None)
+    # "affected_tests" appends the test files affected by the uncommitted
+    # changes in the repo to the command line
+    mode: str = Field(default="default")
+    # Split pytest runs across this many containers running at once
+    shards: Optional[int] = Field(default=None, gt=0)
+    # Have pytest write a JUnit XML report, parsed into per-test results
+    # and used to rerun only the tests that failed
+    junit_xml: bool = Field(default=False)
+    # How the command is run, see COMMAND_BACKEND, which is used if unset
+    backend: Optional[str] = Field(default=None)
+    timeout_seconds: Optional[float] = Field(default=None, gt=0)
+
+    @validator("mode")
+    def validate_mode(cls, v: str) -> str:
+        if v not in ("default", "affected_tests"):
+            raise ValueError("mode must be one of 'default' or 'affected_tests'")
+        return v
+
+    @validator("backend")
+    def validate_backend(cls, v: Optional[str]) -> Optional[str]:
+        if v is not None and v not in ("docker", "docker-pool", "local"):
+            raise ValueError("backend must be one of 'docker', 'docker-pool' or 'local'")
+        return v
+
+class CommandUsageModel(BaseModel):
+    # Time spent waiting for a free slot, starting the command, and running it
+    queue_wait_seconds: Optional[float]
+    start_latency_seconds: Optional[float]
+    wall_seconds: Optional[float]
+    # Not measured by every backend
+    cpu_seconds: Optional[float]
+    peak_memory_bytes: Optional[int]
+    output_bytes: int
+
+class ShardResponseModel(BaseModel):
+    command: str
+    status: str
+    exit_code: Optional[int]
+    test_count: int
+    # Unset in results served from the cache
+    output_handle: Optional[str]
+    duration_seconds: Optional[float]
+    usage: Optional[CommandUsageModel]
+
+class PytestCaseModel(BaseModel):
+    node_id: str
+    outcome: str
+    duration_seconds: float
+    message: Optional[str]
+
+class PytestResultsModel(BaseModel):
+    passed: int
+    failed: int
+    errors: int
+    skipped: int
+    duration_seconds: float
+    failures: List[PytestCaseModel]
+    failures_truncated: bool
+
+class PytestResultsResponseModel(BaseModel):
+    id: str
+    tests: List[PytestCaseModel]
 
 class CommandResponseModel(BaseModel):
     command: str
     exit_code: int
+    # Only the start and end of long output, the rest can be read in pages
+    # from `/commands/output/{output_handle}`
+    output_str: str
+    # Unset in results served from the cache, whose job may be gone
+    output_handle: Optional[str]
+    output_size: int = 0
+    output_truncated: bool = False
+    # Results of each shard, for sharded test runs
+    shards: Optional[List[ShardResponseModel]]
+    # Per-test results, for commands with `junit_xml` set. The result of
+    # every test can be read from `/commands/test_results/{output_handle}`
+    test_results: Optional[PytestResultsModel]
+    usage: Optional[CommandUsageModel]
+
+
+class JobResponseModel(BaseModel):
+    id: str
+    command: str
+    status: str
+    priority: int
+    timeout_seconds: float
+    exit_code: Optional[int]
+    error: Optional[str]
+    output_size: int
+    created_at: float
+    started_at: Optional[float]
+    finished_at: Optional[float]
+    usage: Optional[CommandUsageModel]
+
+class JobOutputResponseModel(BaseModel):
+    id: str
+    status: str
     output_str: str
+    offset: int
+    next_offset: int
 
 
 def load_commands(file_path: str) -> List[Command]:
@@ -20,3 +20,31 @@ class NewClassDefinitionRequest(BaseModel):
 
 class UpdateFunctionDocstringRequest(BaseModel):
     new_docstring: str
+
+
+class SymbolResponseModel(BaseModel):
+    qualname: str
+    name: str
+    kind: str
+    file_path: str
+    start_line: int
+    end_line: int
+    signature: str
+
+
+class RetrievalResultModel(SymbolResponseModel):
+    docstring: Optional[str]
+    score: float
+
+
+class SimilarCodeRequest(BaseModel):
+    snippet: str
+
+
+class CodeChunkResponseModel(BaseModel):
+    file_path: str
+    start_line: int
+    end_line: int
+    kind: str
+    name: str
+    score: float
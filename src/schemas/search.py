@@ -0,0 +1,19 @@
+from pydantic import BaseModel
+from typing import List
+
+
+class SearchMatchModel(BaseModel):
+    path: str
+    line_number: int
+    column: int
+    line: str
+    before: List[str]
+    after: List[str]
+
+
+class SearchResponseModel(BaseModel):
+    matches: List[SearchMatchModel]
+    # Files the index could not rule out, which were read to find matches
+    candidate_files: int
+    files_with_matches: int
+    truncated: bool
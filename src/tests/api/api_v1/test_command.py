@@ -1,10 +1,16 @@
 from fastapi.testclient import TestClient
 from src.main import app
 import pytest
+from docker.models.containers import ExecResult
 import os
+import shutil
 from src.core.config import settings
 import tempfile
+import json
+import threading
+import time
 from src.utils import get_filesystem_path, get_endpoint_path
+from src.core.file_events import notify_file_changed
 
 client = TestClient(app)
 
@@ -46,3 +52,430 @@ def test_tests_use_separate_testing_virtualenv(temp_test_file):
     assert 'collected 1 item' in response.text
     assert '1 passed' in response.text
 
+
+
+@pytest.fixture
+def fake_docker(monkeypatch):
+    from src.api.endpoints import command as command_endpoints
+    from src.core.command_cache import command_result_cache
+    from src.core.container_pool import container_pool
+    from src.tests.utils.fake_docker import FakeDockerClient
+
+    release = threading.Event()
+
+    def slow_exec(command):
+        release.wait(timeout=5)
+        return ExecResult(0, ("ran: " + " ".join(command)).encode("utf-8"))
+
+    fake_client = FakeDockerClient(slow_exec)
+    monkeypatch.setattr(settings, 'COMMAND_BACKEND', 'docker-pool')
+    # Run every command in the fake containers, even those configured for
+    # another backend
+    for command in command_endpoints.commands:
+        monkeypatch.setattr(command, 'backend', None)
+    monkeypatch.setattr(container_pool, 'client_factory', lambda: fake_client)
+    command_result_cache.clear()
+    release.fake_client = fake_client
+    yield release
+    release.set()
+    container_pool.close()
+    command_result_cache.clear()
+
+
+def test_running_command_does_not_block_other_requests(fake_docker):
+    release = fake_docker
+    with TestClient(app) as concurrent_client:
+        responses = []
+        command_thread = threading.Thread(
+            target=lambda: responses.append(concurrent_client.post("/api/v1/commands/command/grep?pattern=foo")))
+        command_thread.start()
+
+        deadline = time.monotonic() + 2
+        while concurrent_client.get("/api/v1/commands/queue/stats").json()['commands']['grep']['running'] != 1:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        response = concurrent_client.get("/api/v1/directories/")
+        assert response.status_code == 200
+        assert command_thread.is_alive()
+
+        release.set()
+        command_thread.join(timeout=5)
+    assert responses[0].status_code == 200
+    assert responses[0].json()['output_str'] == 'ran: grep foo --recursive'
+
+
+def test_stream_command_output(fake_docker):
+    release = fake_docker
+    release.set()
+    with TestClient(app) as concurrent_client:
+        response = concurrent_client.post("/api/v1/commands/command/grep/stream?pattern=foo")
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/event-stream')
+    events = [(block.split('\n')[0], json.loads(block.split('data: ', 1)[1]))
+              for block in response.text.strip().split('\n\n')]
+    assert events == [
+        ('event: start', {'command': 'grep foo --recursive'}),
+        ('event: output', {'output_str': 'ran: grep foo --recursive'}),
+        ('event: exit', {'exit_code': 0}),
+    ]
+
+
+def test_command_jobs(fake_docker):
+    release = fake_docker
+    with TestClient(app) as concurrent_client:
+        response = concurrent_client.post("/api/v1/commands/command/grep/jobs?pattern=foo&priority=2")
+        assert response.status_code == 202
+        job = response.json()
+        assert job['command'] == 'grep foo --recursive'
+        assert job['priority'] == 2
+        assert job['status'] in ('queued', 'running')
+
+        release.set()
+        deadline = time.monotonic() + 5
+        while job['status'] in ('queued', 'running'):
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+            job = concurrent_client.get(f"/api/v1/commands/jobs/{job['id']}").json()
+        assert job['status'] == 'completed'
+        assert job['exit_code'] == 0
+
+        response = concurrent_client.get(f"/api/v1/commands/jobs/{job['id']}/output", params={'offset': 5})
+        assert response.json() == {'id': job['id'], 'status': 'completed', 'output_str': 'grep foo --recursive',
+                                   'offset': 5, 'next_offset': 25}
+        assert job['id'] in [listed['id'] for listed in concurrent_client.get("/api/v1/commands/jobs").json()]
+
+        response = concurrent_client.post(f"/api/v1/commands/jobs/{job['id']}/cancel")
+        assert response.status_code == 409
+
+
+def test_cancel_command_job(fake_docker):
+    release = fake_docker
+    with TestClient(app) as concurrent_client:
+        job = concurrent_client.post("/api/v1/commands/command/grep/jobs?pattern=foo").json()
+        response = concurrent_client.post(f"/api/v1/commands/jobs/{job['id']}/cancel")
+        assert response.status_code == 200
+        # The fake command doesn't notice its container being removed
+        release.set()
+
+        deadline = time.monotonic() + 5
+        while job['status'] in ('queued', 'running'):
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+            job = concurrent_client.get(f"/api/v1/commands/jobs/{job['id']}").json()
+        assert job['status'] == 'cancelled'
+
+
+def test_cancelling_a_queued_command_answers_409(fake_docker, monkeypatch):
+    from src.core.command_executor import command_executor
+    release = fake_docker
+    monkeypatch.setattr(command_executor._state('grep'), 'limit', 1)
+    with TestClient(app) as concurrent_client:
+        responses = {}
+        threads = [threading.Thread(target=lambda pattern=pattern: responses.__setitem__(
+            pattern, concurrent_client.post(f"/api/v1/commands/command/grep?pattern={pattern}")))
+            for pattern in ('first', 'second')]
+        threads[0].start()
+        deadline = time.monotonic() + 5
+        while not concurrent_client.get("/api/v1/commands/jobs", params={'status': 'running'}).json():
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        threads[1].start()
+        while not (queued := concurrent_client.get("/api/v1/commands/jobs", params={'status': 'queued'}).json()):
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        assert concurrent_client.post(f"/api/v1/commands/jobs/{queued[0]['id']}/cancel").status_code == 200
+        threads[1].join(timeout=5)
+        release.set()
+        threads[0].join(timeout=5)
+    assert responses['second'].status_code == 409
+    assert 'cancelled' in responses['second'].json()['detail']
+    assert responses['first'].status_code == 200
+
+
+def test_unknown_job_is_404(client):
+    assert client.get("/api/v1/commands/jobs/nope").status_code == 404
+
+
+def test_cacheable_command_results_are_reused(fake_docker, temp_test_file, monkeypatch):
+    from src.api.endpoints import command as command_endpoints
+    grep = next(command for command in command_endpoints.commands if command.name == 'grep')
+    monkeypatch.setattr(grep, 'cacheable', True)
+    release = fake_docker
+    release.set()
+    exec_count = lambda: sum(len(c.exec_commands) for c in release.fake_client.containers.created)
+    with TestClient(app) as concurrent_client:
+        first = concurrent_client.post("/api/v1/commands/command/grep?pattern=cached")
+        assert first.headers['X-Command-Cache'] == 'miss'
+        second = concurrent_client.post("/api/v1/commands/command/grep?pattern=cached")
+        assert second.headers['X-Command-Cache'] == 'hit'
+        # The cached result didn't use any resources, and its run's output
+        # may no longer be available
+        assert first.json()['usage'] is not None and second.json()['usage'] is None
+        assert first.json()['output_handle'] is not None and second.json()['output_handle'] is None
+        assert dict(second.json(), usage=None, output_handle=None) == dict(first.json(), usage=None, output_handle=None)
+        assert exec_count() == 1
+
+        # A different command line is a different result
+        other = concurrent_client.post("/api/v1/commands/command/grep?pattern=other")
+        assert other.headers['X-Command-Cache'] == 'miss'
+
+        # Changing a file in the repo invalidates cached results
+        with open(temp_test_file, 'a') as f:
+            f.write("# changed\n")
+        notify_file_changed(temp_test_file).result()
+        third = concurrent_client.post("/api/v1/commands/command/grep?pattern=cached")
+        assert third.headers['X-Command-Cache'] == 'miss'
+        assert exec_count() == 3
+
+
+def test_cached_results_only_depend_on_their_input_paths(fake_docker, temp_test_file, monkeypatch):
+    from src.api.endpoints import command as command_endpoints
+    grep = next(command for command in command_endpoints.commands if command.name == 'grep')
+    monkeypatch.setattr(grep, 'cacheable', True)
+    fake_docker.set()
+    other_dir = tempfile.mkdtemp(dir=settings.REPO_ROOT)
+    try:
+        params = {'pattern': 'thumbs_up', 'path': get_endpoint_path(temp_test_file)}
+        with TestClient(app) as concurrent_client:
+            assert concurrent_client.post("/api/v1/commands/command/grep", params=params).headers['X-Command-Cache'] == 'miss'
+            # A file the command doesn't search changed
+            with open(os.path.join(other_dir, 'unrelated.py'), 'w') as f:
+                f.write("x = 1\n")
+            notify_file_changed(other_dir).result()
+            assert concurrent_client.post("/api/v1/commands/command/grep", params=params).headers['X-Command-Cache'] == 'hit'
+            with open(temp_test_file, 'a') as f:
+                f.write("# changed\n")
+            notify_file_changed(temp_test_file).result()
+            assert concurrent_client.post("/api/v1/commands/command/grep", params=params).headers['X-Command-Cache'] == 'miss'
+    finally:
+        shutil.rmtree(other_dir)
+
+
+def test_long_command_output_is_paged(fake_docker, monkeypatch):
+    release = fake_docker
+    release.set()
+    lines = [f'match {i}\n'.encode() for i in range(2000)]
+    release.fake_client.exec_handler = lambda command: ExecResult(0, iter(lines))
+    monkeypatch.setattr(settings, 'COMMAND_OUTPUT_MEMORY_LIMIT', 1024)
+    monkeypatch.setattr(settings, 'COMMAND_OUTPUT_HEAD_BYTES', 64)
+    monkeypatch.setattr(settings, 'COMMAND_OUTPUT_TAIL_BYTES', 64)
+    monkeypatch.setattr(settings, 'COMMAND_OUTPUT_PAGE_BYTES', 4096)
+    expected = b''.join(lines).decode()
+
+    with TestClient(app) as concurrent_client:
+        result = concurrent_client.post("/api/v1/commands/command/grep?pattern=paged").json()
+        assert result['output_truncated']
+        assert result['output_size'] == len(expected)
+        assert result['output_str'].startswith('match 0\n')
+        assert result['output_str'].endswith('match 1999\n')
+        assert 'bytes omitted' in result['output_str']
+
+        pages = []
+        offset = 0
+        while offset < result['output_size']:
+            page = concurrent_client.get(f"/api/v1/commands/output/{result['output_handle']}",
+                                         params={'offset': offset, 'limit': 10000}).json()
+            assert len(page['output_str']) <= 4096
+            pages.append(page['output_str'])
+            offset = page['next_offset']
+        assert ''.join(pages) == expected
+
+        assert concurrent_client.get("/api/v1/commands/output/unknown").status_code == 404
+
+
+def test_run_affected_tests_passes_changed_tests_to_pytest(fake_docker, temp_test_file):
+    release = fake_docker
+    release.set()
+    with TestClient(app) as concurrent_client:
+        response = concurrent_client.post("/api/v1/commands/command/run_affected_tests")
+    assert response.status_code == 200
+    command = response.json()['command'].split(' ')
+    assert command[0] == 'pytest'
+    # The new test file is untracked, so it counts as changed
+    assert temp_test_file in command[1:]
+
+
+@pytest.mark.parametrize('endpoint', ['', '/jobs', '/stream'])
+def test_run_affected_tests_without_affected_tests_is_409(fake_docker, monkeypatch, endpoint):
+    from src.api.endpoints import command as command_endpoints
+    monkeypatch.setattr(command_endpoints, 'get_changed_files', lambda root: [os.path.join(root, 'README.md')])
+    with TestClient(app) as concurrent_client:
+        response = concurrent_client.post(f"/api/v1/commands/command/run_affected_tests{endpoint}")
+    assert response.status_code == 409
+    assert response.json()['detail'] == 'No tests to run: No python files changed'
+    # Nothing was run
+    assert fake_docker.fake_client.containers.created == []
+
+
+def test_run_tests_sharded(fake_docker):
+    release = fake_docker
+    release.set()
+    node_ids = [f'tests/test_{i}.py::test_{i}' for i in range(8)]
+
+    def fake_pytest(command):
+        if '--collect-only' in command:
+            return ExecResult(0, ('\n'.join(node_ids) + '\n\n8 tests collected\n').encode())
+        tests_dir = os.path.join(settings.REPO_ROOT, 'tests/')
+        tests = [arg for arg in command if arg.startswith(tests_dir)]
+        exit_code = 1 if tests_dir + 'test_3.py' in tests else 0
+        return ExecResult(exit_code, f'{len(tests)} tests ran\n'.encode())
+
+    release.fake_client.exec_handler = fake_pytest
+    with TestClient(app) as concurrent_client:
+        response = concurrent_client.post("/api/v1/commands/command/run_tests_sharded")
+    assert response.status_code == 200
+    result = response.json()
+    assert result['exit_code'] == 1
+    assert len(result['shards']) == 4
+    assert sorted(shard['test_count'] for shard in result['shards']) == [2, 2, 2, 2]
+    assert sorted(shard['exit_code'] for shard in result['shards']) == [0, 0, 0, 1]
+    assert result['output_str'].count('2 tests ran') == 4
+    assert result['output_str'].startswith('===== shard 1/4: 2 tests, completed, exit code')
+
+
+def test_sharded_runs_with_a_failed_shard_are_not_cached(fake_docker, monkeypatch):
+    from src.api.endpoints import command as command_endpoints
+    sharded = next(command for command in command_endpoints.commands if command.name == 'run_tests_sharded')
+    monkeypatch.setattr(sharded, 'cacheable', True)
+    release = fake_docker
+    release.set()
+    node_ids = [f'tests/test_{i}.py::test_{i}' for i in range(8)]
+
+    def fake_pytest(command):
+        if '--collect-only' in command:
+            return ExecResult(0, ('\n'.join(node_ids) + '\n').encode())
+        if os.path.join(settings.REPO_ROOT, 'tests/test_3.py') in command:
+            raise RuntimeError('container died')
+        return ExecResult(0, b'ran\n')
+
+    release.fake_client.exec_handler = fake_pytest
+    with TestClient(app) as concurrent_client:
+        first = concurrent_client.post("/api/v1/commands/command/run_tests_sharded")
+        assert 'failed' in [shard['status'] for shard in first.json()['shards']]
+        second = concurrent_client.post("/api/v1/commands/command/run_tests_sharded")
+    assert second.headers['X-Command-Cache'] == 'miss'
+
+
+def test_sharded_run_of_real_tests_in_a_subdirectory(fake_docker, monkeypatch, tmp_path):
+    from src.api.endpoints import command as command_endpoints
+    from src.core.sharding import DurationHistory
+    sharded = next(command for command in command_endpoints.commands if command.name == 'run_tests_sharded')
+    monkeypatch.setattr(sharded, 'backend', 'local')
+    monkeypatch.setattr(command_endpoints, 'duration_history', DurationHistory(None))
+    # Run pytest outside the repo, like an image whose working directory
+    # isn't the repo root
+    stream_local_command = command_endpoints.stream_local_command
+    monkeypatch.setattr(command_endpoints, 'stream_local_command',
+                        lambda command_line, cwd, **kwargs: stream_local_command(command_line, str(tmp_path), **kwargs))
+    # No ini file, so without an explicit rootdir pytest would report node
+    # IDs relative to the collected directory
+    tests_dir = tempfile.mkdtemp(dir=settings.REPO_ROOT, prefix='sharded_')
+    try:
+        for name in ('a', 'b', 'c'):
+            with open(os.path.join(tests_dir, f'test_{name}.py'), 'w') as f:
+                f.write(f'def test_{name}_one():\n    pass\n\ndef test_{name}_two():\n    assert {name!r} != "c"\n')
+        with TestClient(app) as concurrent_client:
+            response = concurrent_client.post("/api/v1/commands/command/run_tests_sharded",
+                                              params={'path': get_endpoint_path(tests_dir)})
+        result = response.json()
+        assert [shard['status'] for shard in result['shards']] == ['completed'] * len(result['shards'])
+        assert sum(shard['test_count'] for shard in result['shards']) == 6
+        assert 'not found' not in result['output_str']
+        assert result['exit_code'] == 1
+        assert result['test_results']['failed'] == 1
+    finally:
+        shutil.rmtree(tests_dir)
+
+
+def test_run_tests_reports_results_and_reruns_failed(fake_docker, monkeypatch):
+    from src.api.endpoints import command as command_endpoints
+    from src.core.pytest_results import LastFailed
+    release = fake_docker
+    release.set()
+    monkeypatch.setattr(command_endpoints, 'last_failed', LastFailed())
+    os.makedirs(os.path.join(settings.REPO_ROOT, 'tests'), exist_ok=True)
+    test_path = os.path.join(settings.REPO_ROOT, 'tests', 'test_results_example.py')
+    with open(test_path, 'w') as f:
+        f.write('')
+    commands = []
+
+    def fake_pytest(command):
+        commands.append(command)
+        report_path = next(arg for arg in command if arg.startswith('--junitxml=')).split('=', 1)[1]
+        os.makedirs(os.path.dirname(report_path), exist_ok=True)
+        failure = '' if len(commands) > 1 else '<failure message="assert False">E assert False</failure>'
+        with open(report_path, 'w') as f:
+            f.write('<testsuite>'
+                    '<testcase classname="tests.test_results_example" name="test_ok" time="0.5"/>'
+                    f'<testcase classname="tests.test_results_example" name="test_bad" time="0.25">{failure}</testcase>'
+                    '</testsuite>')
+        return ExecResult(1 if failure else 0, b'done\n')
+
+    release.fake_client.exec_handler = fake_pytest
+    try:
+        with TestClient(app) as concurrent_client:
+            response = concurrent_client.post("/api/v1/commands/command/run_tests")
+            assert response.status_code == 200
+            results = response.json()['test_results']
+            assert (results['passed'], results['failed']) == (1, 1)
+            assert results['failures'][0]['node_id'] == 'tests/test_results_example.py::test_bad'
+            assert results['failures'][0]['message'] == 'assert False'
+            assert '--junitxml' not in response.json()['command']
+
+            handle = response.json()['output_handle']
+            tests = concurrent_client.get(f"/api/v1/commands/test_results/{handle}").json()['tests']
+            assert [test['outcome'] for test in tests] == ['passed', 'failed']
+            assert concurrent_client.get("/api/v1/commands/last_failed").json() == \
+                ['tests/test_results_example.py::test_bad']
+
+            response = concurrent_client.post("/api/v1/commands/command/run_tests/rerun_failed")
+            assert response.status_code == 200
+            assert response.json()['exit_code'] == 0
+            assert os.path.join(settings.REPO_ROOT, 'tests/test_results_example.py::test_bad') in commands[-1]
+            assert concurrent_client.get("/api/v1/commands/last_failed").json() == []
+
+            response = concurrent_client.post("/api/v1/commands/command/run_tests/rerun_failed")
+            assert response.json()['output_str'] == 'No failed tests to rerun'
+            assert len(commands) == 2
+    finally:
+        os.unlink(test_path)
+
+
+def test_local_backend_runs_command_without_docker(fake_docker, temp_test_file, monkeypatch):
+    from src.api.endpoints import command as command_endpoints
+    release = fake_docker
+    grep = next(command for command in command_endpoints.commands if command.name == 'grep')
+    monkeypatch.setattr(grep, 'backend', 'local')
+    with TestClient(app) as concurrent_client:
+        response = concurrent_client.post("/api/v1/commands/command/grep",
+                                          params={'pattern': 'thumbs_up', 'path': get_endpoint_path(temp_test_file)})
+    assert response.status_code == 200
+    assert response.json()['exit_code'] == 0
+    assert 'thumbs_up' in response.json()['output_str']
+    # No container was needed
+    assert release.fake_client.containers.created == []
+
+
+def test_command_usage_is_reported(fake_docker):
+    release = fake_docker
+    release.set()
+    with TestClient(app) as concurrent_client:
+        response = concurrent_client.post("/api/v1/commands/command/grep?pattern=foo")
+        usage = response.json()['usage']
+        assert usage['output_bytes'] == response.json()['output_size']
+        assert usage['wall_seconds'] is not None
+        stats = concurrent_client.get("/api/v1/commands/usage/stats").json()
+    assert stats['grep']['runs'] >= 1
+    assert set(stats['grep']['queue_wait_seconds']) == {'p50', 'p90', 'p99', 'max', 'mean'}
+
+
+def test_streamed_command_usage_is_recorded(fake_docker):
+    release = fake_docker
+    release.set()
+    with TestClient(app) as concurrent_client:
+        runs = concurrent_client.get("/api/v1/commands/usage/stats").json().get('grep', {}).get('runs', 0)
+        response = concurrent_client.post("/api/v1/commands/command/grep/stream?pattern=foo")
+        assert 'event: exit' in response.text
+        stats = concurrent_client.get("/api/v1/commands/usage/stats").json()
+    assert stats['grep']['runs'] == runs + 1
+    assert stats['grep']['output_bytes']['max'] >= len('ran: grep foo --recursive')
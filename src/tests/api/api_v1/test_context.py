@@ -1,9 +1,43 @@
+import json
+import os
+import shutil
+import time
+import pytest
 from fastapi.testclient import TestClient
 from src.main import app
+from src.utils import get_endpoint_path, get_filesystem_path
 
 client = TestClient(app)
 
 
+@pytest.fixture(scope='function')
+def temp_tree(custom_tmpdir):
+    # Create a small tree with an ignored `node_modules` directory:
+    # tree/a.py, tree/notes.txt, tree/pkg/b.py, tree/pkg/deep/c.py, tree/node_modules/lib.js
+    root = os.path.join(custom_tmpdir, 'tree')
+    for relative_path in ['a.py', 'notes.txt', 'pkg/b.py', 'pkg/deep/c.py', 'node_modules/lib.js']:
+        file_path = os.path.join(root, relative_path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, 'w') as file:
+            file.write('x = 1\n')
+
+    llmignore_path = get_filesystem_path('.llmignore')
+    backup_path = get_filesystem_path('.llmignore.bak')
+    llmignore_exists = os.path.exists(llmignore_path)
+    if llmignore_exists:
+        shutil.copyfile(llmignore_path, backup_path)
+    with open(llmignore_path, 'w') as llmignore_file:
+        llmignore_file.write('node_modules/\n')
+    yield root
+    os.remove(llmignore_path)
+    if llmignore_exists:
+        shutil.move(backup_path, llmignore_path)
+
+
+def names(item):
+    return sorted(child['name'] for child in item['children'])
+
+
 def test_get_file_structure():
     # Test case for the get_file_structure endpoint
     # Use the root directory of the repository as the test directory
@@ -12,6 +46,130 @@ def test_get_file_structure():
     # Add more assertions based on expected response
 
 
+def test_get_file_structure_prunes_ignored_directories(temp_tree):
+    response = client.post(f"/api/v1/context/file_structure/{get_endpoint_path(temp_tree)}")
+    assert response.status_code == 200
+    structure = response.json()
+    assert names(structure) == ['a.py', 'notes.txt', 'pkg']
+    pkg = next(child for child in structure['children'] if child['name'] == 'pkg')
+    assert names(pkg) == ['b.py', 'deep']
+    a_py = next(child for child in structure['children'] if child['name'] == 'a.py')
+    assert a_py['metadata'] == {'file_size_bytes': 6}
+
+
+def test_get_file_structure_max_depth(temp_tree):
+    response = client.post(f"/api/v1/context/file_structure/{get_endpoint_path(temp_tree)}",
+                           params={'max_depth': 1})
+    structure = response.json()
+    pkg = next(child for child in structure['children'] if child['name'] == 'pkg')
+    assert pkg['children'] == []
+    assert pkg['truncated'] is True
+
+
+def test_get_file_structure_max_entries(temp_tree):
+    response = client.post(f"/api/v1/context/file_structure/{get_endpoint_path(temp_tree)}",
+                           params={'max_entries': 2})
+    structure = response.json()
+    assert len(structure['children']) == 2
+    assert structure['truncated'] is True
+
+
+def test_get_file_structure_include(temp_tree):
+    response = client.post(f"/api/v1/context/file_structure/{get_endpoint_path(temp_tree)}",
+                           params={'include': ['*.txt']})
+    structure = response.json()
+    # `pkg` has no matching files so it is dropped
+    assert names(structure) == ['notes.txt']
+
+
+def test_get_file_structure_ndjson(temp_tree):
+    response = client.post(f"/api/v1/context/file_structure/{get_endpoint_path(temp_tree)}",
+                           params={'format': 'ndjson'})
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert records[0] == {'path': '/' + get_endpoint_path(temp_tree), 'type': 'directory', 'size': None, 'depth': 0}
+    by_name = {os.path.basename(record['path']): record for record in records[1:]}
+    assert sorted(by_name) == ['a.py', 'b.py', 'c.py', 'deep', 'notes.txt', 'pkg']
+    assert by_name['c.py'] == {'path': '/' + get_endpoint_path(os.path.join(temp_tree, 'pkg', 'deep', 'c.py')),
+                               'type': 'file', 'size': 6, 'depth': 3}
+
+
+@pytest.mark.parametrize('format', ['json', 'ndjson'])
+def test_file_structure_is_walked_off_the_event_loop(temp_tree, monkeypatch, format):
+    import asyncio
+    from src.core.tree_index import tree_index
+    ensure_ready = tree_index.ensure_ready
+    calls = []
+
+    def check_ensure_ready():
+        try:
+            asyncio.get_running_loop()
+            calls.append('event loop')
+        except RuntimeError:
+            calls.append('thread')
+        return ensure_ready()
+
+    monkeypatch.setattr(tree_index, 'ensure_ready', check_ensure_ready)
+    response = client.post(f"/api/v1/context/file_structure/{get_endpoint_path(temp_tree)}", params={'format': format})
+    assert response.status_code == 200
+    assert calls == ['thread']
+
+
+def test_file_structure_sees_changes_made_outside_the_api(temp_tree):
+    # Build the in-memory tree, then change the disk behind the API's back
+    client.post(f"/api/v1/context/file_structure/{get_endpoint_path(temp_tree)}")
+    with open(os.path.join(temp_tree, 'pkg', 'external.py'), 'w') as file:
+        file.write('y = 2\n')
+    os.remove(os.path.join(temp_tree, 'notes.txt'))
+
+    # The filesystem watcher applies the changes shortly afterwards
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        structure = client.post(f"/api/v1/context/file_structure/{get_endpoint_path(temp_tree)}").json()
+        pkg = next(child for child in structure['children'] if child['name'] == 'pkg')
+        if 'external.py' in names(pkg) and 'notes.txt' not in names(structure):
+            break
+        time.sleep(0.05)
+    assert names(structure) == ['a.py', 'pkg']
+    assert names(pkg) == ['b.py', 'deep', 'external.py']
+
+
+def test_changes_log_records_api_writes(custom_tmpdir):
+    last_seq = client.get("/api/v1/context/changes/log").json()["last_seq"]
+    endpoint_dir = get_endpoint_path(custom_tmpdir)
+
+    response = client.post('/api/v1/files/', json={'file_name': 'feed.txt', 'path': endpoint_dir, 'content': 'a'})
+    assert response.status_code == 201
+    client.delete(f'/api/v1/files/{endpoint_dir}/feed.txt')
+
+    log = client.get("/api/v1/context/changes/log", params={'since': last_seq}).json()
+    assert log["resync"] is False
+    feed_events = [event for event in log["events"] if event["path"] == f"{endpoint_dir}/feed.txt"]
+    assert [event["type"] for event in feed_events] == ["created", "deleted"]
+    assert feed_events[0]["seq"] < feed_events[1]["seq"] <= log["last_seq"]
+
+
+def test_changes_stream_replays_since(custom_tmpdir):
+    last_seq = client.get("/api/v1/context/changes/log").json()["last_seq"]
+    endpoint_dir = get_endpoint_path(custom_tmpdir)
+    client.post('/api/v1/files/', json={'file_name': 'stream.txt', 'path': endpoint_dir, 'content': 'a'})
+
+    response = client.get("/api/v1/context/changes", params={'since': last_seq, 'timeout': 0.2})
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/event-stream')
+    messages = [message for message in response.text.split('\n\n') if message.startswith('event: change')]
+    events = [json.loads(message.split('data: ', 1)[1]) for message in messages]
+    assert any(event["path"] == f"{endpoint_dir}/stream.txt" and event["type"] == "created" for event in events)
+    assert f"id: {events[0]['seq']}" in messages[0]
+
+
+def test_changes_stream_requests_resync_for_unknown_seq():
+    last_seq = client.get("/api/v1/context/changes/log").json()["last_seq"]
+    response = client.get("/api/v1/context/changes", params={'since': last_seq + 1000, 'timeout': 0.1})
+    assert response.text.startswith('event: resync')
+
+
 def test_git_diff():
     # Test case for the git_diff endpoint
     response = client.get("/api/v1/context/git_diff")
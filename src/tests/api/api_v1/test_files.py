@@ -329,3 +329,131 @@ def test_delete_file_ignored_in_llmignore(temp_file, llmignore_handler):
     # because the file is ignored in .llmignore
     assert response.status_code == 403
     assert response.json() == {'detail': 'File is ignored in `.llmignore`'}
+
+
+@pytest.fixture(scope='function')
+def temp_lines_file():
+    with tempfile.NamedTemporaryFile(mode='w', dir=settings.REPO_ROOT, delete=False) as temp_file:
+        temp_file.write(''.join(f'line {i}\n' for i in range(1, 101)))
+    yield temp_file.name
+    if os.path.exists(temp_file.name):
+        os.unlink(temp_file.name)
+
+
+def test_read_file_lines(temp_lines_file):
+    endpoint_path = get_endpoint_path(temp_lines_file)
+    response = client.get(f'/api/v1/files/{endpoint_path}', params={'start_line': 10, 'end_line': 12})
+    assert response.status_code == 200
+    assert response.json() == {'content': 'line 10\nline 11\nline 12\n', 'start_line': 10, 'end_line': 12,
+                               'total_lines': 100, 'truncated': False}
+    # end_line is clamped to the end of the file
+    response = client.get(f'/api/v1/files/{endpoint_path}', params={'start_line': 99, 'end_line': 500})
+    assert response.json()['content'] == 'line 99\nline 100\n'
+
+    # Line offsets are recomputed when the file changes
+    with open(temp_lines_file, 'a') as file:
+        file.write('line 101\n')
+    response = client.get(f'/api/v1/files/{endpoint_path}', params={'start_line': 101})
+    assert response.json()['content'] == 'line 101\n'
+
+    assert client.get(f'/api/v1/files/{endpoint_path}', params={'start_line': 200}).status_code == 400
+    assert client.get(f'/api/v1/files/{endpoint_path}', params={'start_line': 5, 'end_line': 4}).status_code == 400
+    assert client.get(f'/api/v1/files/{endpoint_path}', params={'start_line': 1, 'start_byte': 0}).status_code == 400
+
+
+def test_read_file_bytes(temp_lines_file):
+    endpoint_path = get_endpoint_path(temp_lines_file)
+    response = client.get(f'/api/v1/files/{endpoint_path}', params={'start_byte': 7, 'end_byte': 13})
+    assert response.json() == {'content': 'line 2', 'start_byte': 7, 'end_byte': 13, 'size': 792, 'truncated': False}
+    assert client.get(f'/api/v1/files/{endpoint_path}', params={'start_byte': 1000}).status_code == 400
+
+
+def test_line_and_byte_windows_are_capped(temp_lines_file, monkeypatch):
+    endpoint_path = get_endpoint_path(temp_lines_file)
+    monkeypatch.setattr(settings, 'FILE_JSON_MAX_BYTES', 20)
+    # Only whole lines that fit are returned
+    response = client.get(f'/api/v1/files/{endpoint_path}', params={'start_line': 1})
+    assert response.json() == {'content': 'line 1\nline 2\n', 'start_line': 1, 'end_line': 2,
+                               'total_lines': 100, 'truncated': True}
+    response = client.get(f'/api/v1/files/{endpoint_path}', params={'start_byte': 0})
+    assert response.json() == {'content': 'line 1\nline 2\nline 3', 'start_byte': 0, 'end_byte': 20,
+                               'size': 792, 'truncated': True}
+
+    # A line longer than the limit is cut short
+    monkeypatch.setattr(settings, 'FILE_JSON_MAX_BYTES', 4)
+    response = client.get(f'/api/v1/files/{endpoint_path}', params={'start_line': 10, 'end_line': 11})
+    assert response.json()['content'] == 'line'
+    assert (response.json()['end_line'], response.json()['truncated']) == (10, True)
+
+
+def test_read_file_range_header(temp_lines_file, monkeypatch):
+    from src.api.endpoints import files
+    # Streamed in several chunks
+    monkeypatch.setattr(files, 'RANGE_CHUNK_BYTES', 100)
+    endpoint_path = get_endpoint_path(temp_lines_file)
+    response = client.get(f'/api/v1/files/{endpoint_path}', headers={'Range': 'bytes=7-12'})
+    assert response.status_code == 206
+    assert response.content == b'line 2'
+    assert response.headers['content-range'] == 'bytes 7-12/792'
+    response = client.get(f'/api/v1/files/{endpoint_path}', headers={'Range': 'bytes=-9'})
+    assert response.content == b'line 100\n'
+    response = client.get(f'/api/v1/files/{endpoint_path}', headers={'Range': 'bytes=0-'})
+    with open(temp_lines_file, 'rb') as file:
+        assert response.content == file.read()
+    assert response.headers['content-length'] == '792'
+    response = client.get(f'/api/v1/files/{endpoint_path}', headers={'Range': 'bytes=2000-'})
+    assert response.status_code == 416
+    assert response.headers['content-range'] == 'bytes */792'
+    # Multiple ranges are not supported, so the header is ignored
+    response = client.get(f'/api/v1/files/{endpoint_path}', headers={'Range': 'bytes=0-1,5-6'})
+    assert response.status_code == 200
+    assert response.json()['content'].startswith('line 1\n')
+
+
+def write_temp_file(content: bytes, suffix: str = '') -> str:
+    with tempfile.NamedTemporaryFile(mode='wb', dir=settings.REPO_ROOT, suffix=suffix, delete=False) as temp_file:
+        temp_file.write(content)
+    return temp_file.name
+
+
+def test_read_binary_file_is_streamed_raw():
+    file_path = write_temp_file(b'\x89PNG\r\n\x1a\n\0\0\0\rIHDR', suffix='.png')
+    try:
+        response = client.get(f'/api/v1/files/{get_endpoint_path(file_path)}')
+        assert response.status_code == 200
+        assert response.headers['content-type'] == 'image/png'
+        assert response.headers['content-length'] == '16'
+        assert response.content == b'\x89PNG\r\n\x1a\n\0\0\0\rIHDR'
+
+        with open(file_path, 'wb') as file:
+            file.write(b'\0\1\2 not text')
+        os.rename(file_path, file_path[:-len('.png')] + '.txt')
+        file_path = file_path[:-len('.png')] + '.txt'
+        response = client.get(f'/api/v1/files/{get_endpoint_path(file_path)}')
+        assert response.headers['content-type'] == 'application/octet-stream'
+    finally:
+        os.unlink(file_path)
+
+
+def test_read_large_or_non_utf8_text_is_streamed_raw(monkeypatch):
+    file_path = write_temp_file(b'x' * 100)
+    try:
+        monkeypatch.setattr(settings, 'FILE_JSON_MAX_BYTES', 99)
+        response = client.get(f'/api/v1/files/{get_endpoint_path(file_path)}')
+        assert response.headers['content-type'] == 'text/plain; charset=utf-8'
+        assert response.headers['content-length'] == '100'
+        assert response.content == b'x' * 100
+
+        monkeypatch.setattr(settings, 'FILE_JSON_MAX_BYTES', 100)
+        assert client.get(f'/api/v1/files/{get_endpoint_path(file_path)}').json() == {'content': 'x' * 100}
+        assert client.get(f'/api/v1/files/{get_endpoint_path(file_path)}', params={'raw': True}).content == b'x' * 100
+
+        with open(file_path, 'wb') as file:
+            file.write('café'.encode('utf-8'))
+        assert client.get(f'/api/v1/files/{get_endpoint_path(file_path)}').json() == {'content': 'café'}
+
+        with open(file_path, 'wb') as file:
+            file.write('café'.encode('latin-1'))
+        assert client.get(f'/api/v1/files/{get_endpoint_path(file_path)}').content == 'café'.encode('latin-1')
+    finally:
+        os.unlink(file_path)
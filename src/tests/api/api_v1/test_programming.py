@@ -1,8 +1,14 @@
 import os
+import shutil
 from fastapi.testclient import TestClient
 from src.main import app
 import pytest
 from src.utils import get_endpoint_path
+from src.core.file_events import notify_file_changed
+from src.core.symbol_index import symbol_index
+from src.core.retrieval_index import retrieval_index
+from src.core.vector_index import vector_index
+from src.core.indexer import repo_indexer
 
 client = TestClient(app)
 
@@ -280,3 +286,143 @@ def test_update_class_docstring_success(temp_python_file_with_class):
     # Assert that the response contains the expected message
     assert response.json() == {"status": "success", "message": "Class docstring updated"}
 
+
+def test_get_summary_reuses_parsed_module(temp_python_file_with_class):
+    file_path, class_name, _ = temp_python_file_with_class
+    endpoint_path = get_endpoint_path(file_path)
+
+    response = client.get(f"/api/v1/programming/summary/python/{endpoint_path}")
+    assert response.status_code == 200
+    hits_before = client.get("/api/v1/programming/ast_cache/stats").json()["hits"]
+
+    # Second request for the unchanged file is served from the cache
+    response = client.get(f"/api/v1/programming/summary/python/{endpoint_path}")
+    assert response.status_code == 200
+    assert response.json()["summary"][0]["name"] == class_name
+    # (the watcher may also re-index the new file through the cache meanwhile)
+    assert client.get("/api/v1/programming/ast_cache/stats").json()["hits"] >= hits_before + 1
+
+
+def test_get_summary_sees_file_changes(temp_python_file_with_class):
+    file_path, _, _ = temp_python_file_with_class
+    endpoint_path = get_endpoint_path(file_path)
+
+    response = client.get(f"/api/v1/programming/summary/python/{endpoint_path}")
+    assert response.json()["summary"][0]["name"] == "SampleClass"
+
+    # Changing the file size invalidates the cached parse even if mtime is unchanged
+    with open(file_path, 'w') as file:
+        file.write("class RenamedSampleClass:\n    pass\n")
+
+    response = client.get(f"/api/v1/programming/summary/python/{endpoint_path}")
+    assert response.json()["summary"][0]["name"] == "RenamedSampleClass"
+
+
+@pytest.fixture
+def temp_python_package(custom_tmpdir):
+    # Create a temporary package with a class, a method and a top level function
+    package_dir = os.path.join(custom_tmpdir, 'symbolpkg')
+    os.makedirs(package_dir)
+    with open(os.path.join(package_dir, '__init__.py'), 'w') as file:
+        file.write("")
+    file_path = os.path.join(package_dir, 'shapes.py')
+    with open(file_path, 'w') as file:
+        file.write(
+            "class UniqueSquareShape:\n"
+            "    def unique_area_method(self, scale: int = 1) -> int:\n"
+            "        return 4 * scale\n"
+            "\n"
+            "def unique_shape_factory(name):\n"
+            "    return UniqueSquareShape()\n"
+        )
+    symbol_index.ensure_built()
+    retrieval_index.ensure_built()
+    vector_index.ensure_built()
+    notify_file_changed(package_dir).result()
+    yield file_path
+    shutil.rmtree(package_dir)
+    notify_file_changed(package_dir).result()
+
+
+def test_search_symbols_by_name(temp_python_package):
+    response = client.get("/api/v1/programming/symbols/search", params={"q": "unique_area"})
+    assert response.status_code == 200
+    symbols = response.json()
+    assert len(symbols) == 1
+    assert symbols[0]["name"] == "unique_area_method"
+    assert symbols[0]["kind"] == "method"
+    assert symbols[0]["qualname"].endswith("symbolpkg.shapes.UniqueSquareShape.unique_area_method")
+    assert symbols[0]["start_line"] == 2
+    assert symbols[0]["end_line"] == 3
+    assert symbols[0]["signature"] == "def unique_area_method(self, scale: int=1) -> int"
+
+
+def test_get_symbol_by_qualname(temp_python_package):
+    qualname = client.get("/api/v1/programming/symbols/search",
+                          params={"q": "UniqueSquareShape", "kind": "class"}).json()[0]["qualname"]
+    response = client.get(f"/api/v1/programming/symbols/{qualname}")
+    assert response.status_code == 200
+    assert response.json()["file_path"] == get_endpoint_path(temp_python_package)
+
+
+def test_symbol_index_follows_function_updates(temp_python_package):
+    endpoint_path = get_endpoint_path(temp_python_package)
+    response = client.put(
+        f"/api/v1/programming/function_definition/python/{endpoint_path}/unique_shape_factory",
+        json={"new_function_definition": "def unique_renamed_factory(name):\n    return None\n"}
+    )
+    assert response.status_code == 200
+
+    assert client.get("/api/v1/programming/symbols/search", params={"q": "unique_shape_factory"}).json() == []
+    symbols = client.get("/api/v1/programming/symbols/search", params={"q": "unique_renamed"}).json()
+    assert [symbol["name"] for symbol in symbols] == ["unique_renamed_factory"]
+
+
+def test_get_symbol_not_found():
+    response = client.get("/api/v1/programming/symbols/no_such_module.NoSuchSymbol")
+    assert response.status_code == 404
+    assert response.json() == {'detail': 'Symbol not found'}
+
+
+def test_retrieve_ranks_symbols(temp_python_package):
+    response = client.get("/api/v1/programming/retrieve", params={"q": "unique square shape area"})
+    assert response.status_code == 200
+    results = response.json()
+    assert [result["name"] for result in results[:2]] == ["unique_area_method", "UniqueSquareShape"]
+    assert results[0]["start_line"] == 2
+    assert results[0]["end_line"] == 3
+    assert results[0]["score"] > results[1]["score"]
+
+    with open(temp_python_package, 'a') as file:
+        file.write('\ndef unique_triangle_area():\n    """Area of a unique triangle."""\n')
+    notify_file_changed(temp_python_package).result()
+    results = client.get("/api/v1/programming/retrieve", params={"q": "triangle", "kind": "function"}).json()
+    assert [result["name"] for result in results] == ["unique_triangle_area"]
+    assert results[0]["docstring"] == "Area of a unique triangle."
+
+
+def test_find_similar_code(temp_python_package):
+    response = client.post("/api/v1/programming/similar", params={"limit": 1, "kind": "function"},
+                           json={"snippet": "def unique_circle_area(self, scale):\n    return 3 * scale"})
+    assert response.status_code == 200
+    [chunk] = response.json()
+    assert chunk["name"].endswith("symbolpkg.shapes.UniqueSquareShape.unique_area_method")
+    assert (chunk["start_line"], chunk["end_line"]) == (2, 3)
+    assert chunk["file_path"] == get_endpoint_path(temp_python_package)
+    assert 0 < chunk["score"] <= 1
+    assert client.get("/api/v1/programming/similar/stats").json()["built"]
+
+
+def test_rebuild_index_reports_progress(temp_python_package):
+    response = client.post("/api/v1/programming/index/rebuild")
+    assert response.status_code == 200
+    repo_indexer.wait(timeout=60)
+
+    progress = client.get("/api/v1/programming/index/progress").json()
+    assert progress["status"] == "done"
+    assert progress["files_indexed"] == progress["files_discovered"]
+    assert progress["files_discovered"] >= 2
+    symbols = client.get("/api/v1/programming/symbols/search", params={"q": "UniqueSquareShape"}).json()
+    assert len(symbols) == 1
+    results = client.get("/api/v1/programming/retrieve", params={"q": "UniqueSquareShape", "kind": "class"}).json()
+    assert [result["name"] for result in results] == ["UniqueSquareShape"]
@@ -0,0 +1,90 @@
+import json
+import os
+
+from fastapi.testclient import TestClient
+from src.main import app
+from src.core.config import settings
+from src.core.file_events import notify_file_changed
+from src.utils import get_endpoint_path
+
+client = TestClient(app)
+
+
+def test_search_finds_new_files(custom_tmpdir):
+    file_path = os.path.join(custom_tmpdir, 'search_target.py')
+    with open(file_path, 'w') as file:
+        file.write('def zebra_crossing_handler():\n    return "ZEBRA"\n')
+    notify_file_changed(file_path).result()
+
+    response = client.get('/api/v1/search/', params={'q': 'zebra_crossing', 'context_lines': 1})
+    assert response.status_code == 200
+    result = response.json()
+    assert [(match['path'], match['line_number']) for match in result['matches']] == \
+        [(get_endpoint_path(file_path), 1)]
+    assert result['matches'][0]['after'] == ['    return "ZEBRA"']
+
+    response = client.get('/api/v1/search/', params={'q': r'zebra_\w+\(', 'regex': True, 'include': '*.md'})
+    assert response.json()['matches'] == []
+    response = client.get('/api/v1/search/', params={'q': 'Zebra', 'ignore_case': True, 'include': '*.py'})
+    assert len(response.json()['matches']) == 2
+
+    os.remove(file_path)
+    notify_file_changed(file_path).result()
+    assert client.get('/api/v1/search/', params={'q': 'zebra_crossing'}).json()['matches'] == []
+
+
+def test_invalid_regex_is_rejected():
+    response = client.get('/api/v1/search/', params={'q': '(unclosed', 'regex': True})
+    assert response.status_code == 400
+
+
+def test_scan_streams_matches(custom_tmpdir):
+    file_path = os.path.join(custom_tmpdir, 'scan_target.py')
+    with open(file_path, 'w') as file:
+        file.write('x = 1\ndef okapi_walk():\n    okapi_walk()\n')
+
+    response = client.get('/api/v1/search/scan', params={
+        'q': r'okapi_\w+\(', 'path': get_endpoint_path(custom_tmpdir), 'include': '*.py',
+    })
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    *matches, summary = [json.loads(line) for line in response.text.splitlines()]
+    assert matches == [
+        {'path': get_endpoint_path(file_path), 'line_number': 2, 'column': 5, 'line': 'def okapi_walk():'},
+        {'path': get_endpoint_path(file_path), 'line_number': 3, 'column': 5, 'line': '    okapi_walk()'},
+    ]
+    assert summary['done'] and summary['matches'] == 2 and not summary['truncated']
+
+    response = client.get('/api/v1/search/scan', params={
+        'q': 'okapi', 'path': get_endpoint_path(custom_tmpdir), 'max_results': 1,
+    })
+    *matches, summary = [json.loads(line) for line in response.text.splitlines()]
+    assert len(matches) == 1
+    assert summary['truncated']
+    os.remove(file_path)
+
+
+def test_scan_rejects_invalid_regex_and_missing_directory():
+    assert client.get('/api/v1/search/scan', params={'q': '(unclosed'}).status_code == 400
+    assert client.get('/api/v1/search/scan', params={'q': 'x', 'path': 'no/such/dir'}).status_code == 404
+
+
+def test_search_applies_llmignore_changes(custom_tmpdir):
+    file_path = os.path.join(custom_tmpdir, 'ignored_secret.txt')
+    with open(file_path, 'w') as file:
+        file.write('quokka_secret_token\n')
+    notify_file_changed(file_path).result()
+    assert len(client.get('/api/v1/search/', params={'q': 'quokka_secret_token'}).json()['matches']) == 1
+
+    llmignore_path = settings.LLMIGNORE_PATH
+    original = open(llmignore_path).read() if os.path.exists(llmignore_path) else None
+    try:
+        with open(llmignore_path, 'a') as file:
+            file.write('\nignored_secret.txt\n')
+        assert client.get('/api/v1/search/', params={'q': 'quokka_secret_token'}).json()['matches'] == []
+    finally:
+        if original is None:
+            os.remove(llmignore_path)
+        else:
+            with open(llmignore_path, 'w') as file:
+                file.write(original)
@@ -0,0 +1,36 @@
+import os
+
+from src.core.change_feed import ChangeFeed
+from src.core.file_events import CREATED, DELETED, MODIFIED
+
+
+def types(feed):
+    return [event['type'] for event in feed.events_since(0)]
+
+
+def test_watcher_echo_of_a_change_is_dropped(tmp_path):
+    feed = ChangeFeed(str(tmp_path), max_events=100, coalesce_seconds=60)
+    path = tmp_path / 'echo.txt'
+    path.write_text('a')
+    feed.record(str(path), CREATED)
+    # The watcher reports the same write, possibly as a modification
+    feed.record(str(path), CREATED)
+    feed.record(str(path), MODIFIED)
+    path.unlink()
+    feed.record(str(path), DELETED)
+    feed.record(str(path), DELETED)
+    assert types(feed) == [CREATED, DELETED]
+
+
+def test_writes_in_quick_succession_are_all_recorded(tmp_path):
+    feed = ChangeFeed(str(tmp_path), max_events=100, coalesce_seconds=60)
+    path = tmp_path / 'busy.txt'
+    path.write_text('a')
+    feed.record(str(path), MODIFIED)
+    path.write_text('bb')
+    feed.record(str(path), MODIFIED)
+    # Same size, different mtime
+    path.write_text('cc')
+    os.utime(path, ns=(0, 1))
+    feed.record(str(path), MODIFIED)
+    assert types(feed) == [MODIFIED, MODIFIED, MODIFIED]
@@ -0,0 +1,112 @@
+import pytest
+
+from src.core.config import settings
+from src.core.command_cache import CommandResultCache, RepoFingerprinter
+
+
+@pytest.fixture
+def repo(tmp_path):
+    (tmp_path / 'pkg').mkdir()
+    (tmp_path / 'pkg' / 'module.py').write_text('x = 1\n')
+    (tmp_path / 'README.md').write_text('readme\n')
+    return tmp_path
+
+
+def test_fingerprint_is_stable_for_unchanged_tree(repo):
+    fingerprinter = RepoFingerprinter(['.git'])
+    assert fingerprinter.fingerprint(str(repo)) == fingerprinter.fingerprint(str(repo))
+
+
+@pytest.mark.parametrize('change', ['modify', 'create', 'delete', 'rename'])
+def test_fingerprint_changes_with_tree(repo, change):
+    fingerprinter = RepoFingerprinter(['.git'])
+    before = fingerprinter.fingerprint(str(repo))
+    module = repo / 'pkg' / 'module.py'
+    if change == 'modify':
+        module.write_text('x = 22\n')
+    elif change == 'create':
+        (repo / 'pkg' / 'other.py').write_text('')
+    elif change == 'delete':
+        module.unlink()
+    else:
+        module.rename(repo / 'pkg' / 'renamed.py')
+    assert fingerprinter.fingerprint(str(repo)) != before
+
+
+def test_fingerprint_skips_ignored_names(repo):
+    fingerprinter = RepoFingerprinter(['__pycache__', '.pytest_cache'])
+    before = fingerprinter.fingerprint(str(repo))
+    (repo / 'pkg' / '__pycache__').mkdir()
+    (repo / 'pkg' / '__pycache__' / 'module.cpython-311.pyc').write_bytes(b'\0')
+    (repo / '.pytest_cache').mkdir()
+    assert fingerprinter.fingerprint(str(repo)) == before
+
+
+def test_fingerprint_skips_llmignored_directories(repo, monkeypatch):
+    (repo / '.llmignore').write_text('node_modules/\n')
+    monkeypatch.setattr(settings, 'REPO_ROOT', str(repo))
+    monkeypatch.setattr(settings, 'LLMIGNORE_PATH', str(repo / '.llmignore'))
+    fingerprinter = RepoFingerprinter(['.git'])
+    before = fingerprinter.fingerprint(str(repo))
+    (repo / 'node_modules').mkdir()
+    (repo / 'node_modules' / 'left-pad.js').write_text('')
+    assert fingerprinter.fingerprint(str(repo)) == before
+    (repo / 'pkg' / 'module.py').write_text('x = 22\n')
+    assert fingerprinter.fingerprint(str(repo)) != before
+
+
+def test_fingerprint_of_file_and_missing_path(repo):
+    fingerprinter = RepoFingerprinter([])
+    assert fingerprinter.fingerprint(str(repo / 'README.md')) != fingerprinter.fingerprint(str(repo / 'pkg'))
+    assert fingerprinter.fingerprint(str(repo / 'nope')) == 'missing'
+
+
+@pytest.fixture
+def watched(repo, monkeypatch):
+    from src.core import command_cache
+    monkeypatch.setattr(settings, 'REPO_ROOT', str(repo))
+    monkeypatch.setattr(command_cache, 'tree_index', type('Watcher', (), {'watching': True, 'covers': lambda self, path: True})())
+    return repo
+
+
+def test_directory_hashes_are_memoized_until_a_change_is_reported(watched):
+    fingerprinter = RepoFingerprinter(['.git'])
+    before = fingerprinter.fingerprint(str(watched))
+    module = watched / 'pkg' / 'module.py'
+    module.write_text('x = 22\n')
+    # Not rescanned
+    assert fingerprinter.fingerprint(str(watched)) == before
+    fingerprinter.invalidate(str(module))
+    after = fingerprinter.fingerprint(str(watched))
+    assert after != before
+
+    # Only the changed file's directories are rescanned
+    (watched / 'other').mkdir()
+    assert fingerprinter.fingerprint(str(watched)) == after
+    fingerprinter.invalidate(str(watched / 'other'))
+    assert fingerprinter.fingerprint(str(watched)) != after
+
+
+def test_dependency_files_are_part_of_every_fingerprint(watched):
+    fingerprinter = RepoFingerprinter(['.git'], dependency_files=['requirements.txt'])
+    before = fingerprinter.fingerprint_inputs([str(watched / 'pkg')])
+    (watched / 'requirements.txt').write_text('emoji\n')
+    assert fingerprinter.fingerprint_inputs([str(watched / 'pkg')]) != before
+    # Files outside the inputs don't count
+    changed = fingerprinter.fingerprint_inputs([str(watched / 'pkg')])
+    (watched / 'README.md').write_text('changed\n')
+    fingerprinter.invalidate(str(watched / 'README.md'))
+    assert fingerprinter.fingerprint_inputs([str(watched / 'pkg')]) == changed
+
+
+def test_result_cache_evicts_least_recently_used():
+    cache = CommandResultCache(max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.stats() == {'hits': 3, 'misses': 1, 'entries': 2, 'max_entries': 2}
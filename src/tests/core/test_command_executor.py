@@ -0,0 +1,172 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.core.command_executor import CommandExecutor
+from src.core.container_pool import CommandStream
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out waiting for condition")
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def executor():
+    executor = CommandExecutor(max_workers=4, default_limit=2)
+    yield executor
+    executor.shutdown()
+
+
+def test_runs_jobs_and_returns_results(executor):
+    assert executor.submit('echo', lambda x: x * 2, 21).result(timeout=2) == 42
+    assert executor.stats()['commands']['echo']['completed'] == 1
+
+
+def test_propagates_exceptions(executor):
+    def fail():
+        raise ValueError('boom')
+
+    with pytest.raises(ValueError):
+        executor.submit('fail', fail).result(timeout=2)
+    assert executor.stats()['commands']['fail']['failed'] == 1
+
+
+def test_limits_concurrent_runs_per_command(executor):
+    release = threading.Event()
+    futures = [executor.submit('pytest', release.wait) for _ in range(5)]
+
+    wait_until(lambda: executor.stats()['commands']['pytest']['running'] == 2)
+    stats = executor.stats()['commands']['pytest']
+    assert stats['queued'] == 3
+
+    # A different command still gets a worker while pytest is at its limit
+    assert executor.submit('grep', lambda: 'found').result(timeout=2) == 'found'
+
+    release.set()
+    for future in futures:
+        future.result(timeout=2)
+    stats = executor.stats()['commands']['pytest']
+    assert (stats['running'], stats['queued'], stats['completed']) == (0, 0, 5)
+
+
+def test_per_command_limit_can_be_configured(executor):
+    executor.set_limit('pytest', 1)
+    release = threading.Event()
+    futures = [executor.submit('pytest', release.wait) for _ in range(3)]
+
+    wait_until(lambda: executor.stats()['commands']['pytest']['running'] == 1)
+    assert executor.stats()['commands']['pytest']['queued'] == 2
+    release.set()
+    for future in futures:
+        future.result(timeout=2)
+
+
+def test_a_command_never_takes_every_worker(executor):
+    executor.set_limit('pytest', 4)
+    assert executor.stats()['commands']['pytest']['limit'] == 3
+    release = threading.Event()
+    futures = [executor.submit('pytest', release.wait) for _ in range(4)]
+
+    wait_until(lambda: executor.stats()['commands']['pytest']['running'] == 3)
+    assert executor.submit('grep', lambda: 'found').result(timeout=2) == 'found'
+    release.set()
+    for future in futures:
+        future.result(timeout=2)
+
+
+def test_cancelled_queued_jobs_are_dropped(executor):
+    executor.set_limit('pytest', 1)
+    release = threading.Event()
+    calls = []
+    running = executor.submit('pytest', release.wait)
+    queued = executor.submit('pytest', calls.append, 'queued')
+
+    assert queued.cancel()
+    release.set()
+    running.result(timeout=2)
+    wait_until(lambda: executor.stats()['commands']['pytest']['cancelled'] == 1)
+    assert calls == []
+
+
+def test_run_does_not_block_event_loop(executor):
+    async def main():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticker = asyncio.create_task(tick())
+        result = await executor.run('sleep', lambda: time.sleep(0.2) or 'done')
+        ticker.cancel()
+        return result, ticks
+
+    result, ticks = asyncio.run(main())
+    assert result == 'done'
+    assert ticks > 5
+
+
+def test_restarts_after_shutdown(executor):
+    executor.submit('echo', lambda: None).result(timeout=2)
+    executor.shutdown()
+    assert executor.submit('echo', lambda: 'again').result(timeout=2) == 'again'
+
+
+def test_stream_yields_output_then_exit_code(executor):
+    closed = []
+    command_stream = CommandStream([b'a', b'b'], wait=lambda: 1, kill=lambda: None, close=closed.append)
+
+    async def collect():
+        return [event async for event in executor.stream('pytest', lambda: command_stream)]
+
+    assert asyncio.run(collect()) == [('output', b'a'), ('output', b'b'), ('exit', 1)]
+    assert closed == [True]
+
+
+def test_stream_cancels_command_when_consumer_stops(executor):
+    killed = threading.Event()
+    closed = []
+
+    def endless_output():
+        while not killed.is_set():
+            yield b'.'
+            time.sleep(0.01)
+
+    command_stream = CommandStream(endless_output(), wait=lambda: 0, kill=killed.set, close=closed.append)
+
+    async def read_one():
+        events = executor.stream('pytest', lambda: command_stream, max_buffered_chunks=2)
+        first = await events.__anext__()
+        await events.aclose()
+        return first
+
+    assert asyncio.run(read_one()) == ('output', b'.')
+    assert killed.wait(timeout=2)
+    wait_until(lambda: closed == [False])
+    assert command_stream.exit_code is None
+
+
+def test_stream_kills_command_after_timeout(executor):
+    killed = threading.Event()
+
+    def endless_output():
+        while not killed.is_set():
+            yield b'.'
+            time.sleep(0.01)
+
+    command_stream = CommandStream(endless_output(), wait=lambda: 0, kill=killed.set, close=lambda healthy: None)
+
+    async def last_event():
+        events = [event async for event in executor.stream('pytest', lambda: command_stream, timeout_seconds=0.1)]
+        return events[-1]
+
+    assert asyncio.run(last_event()) == ('timeout', 0.1)
+    assert killed.is_set()
@@ -0,0 +1,87 @@
+import pytest
+
+from src.core.command_output import CommandOutput
+
+
+def write_lines(output, count):
+    expected = b''
+    for i in range(count):
+        line = f'line {i}\n'.encode()
+        output.append(line)
+        expected += line
+    return expected
+
+
+def test_small_output_stays_in_memory(tmp_path):
+    output = CommandOutput(memory_limit=1024, head_bytes=100, tail_bytes=100, spill_dir=str(tmp_path))
+    expected = write_lines(output, 10)
+
+    assert not output.spilled
+    assert output.size == len(expected)
+    assert output.read() == expected
+    assert output.summary() == expected.decode()
+    assert not output.truncated
+
+
+def test_large_output_spills_to_disk(tmp_path):
+    output = CommandOutput(memory_limit=256, head_bytes=32, tail_bytes=32, spill_dir=str(tmp_path))
+    expected = write_lines(output, 1000)
+
+    assert output.spilled
+    assert output.size == len(expected)
+    assert output.read() == expected
+    assert output.read(100, 50) == expected[100:150]
+    assert output.read(len(expected) - 5, 100) == expected[-5:]
+    assert output.read(len(expected), 100) == b''
+    # Memory held for the summary stays bounded
+    assert len(output._head) == 32
+    assert len(output._tail) <= 64
+
+
+def test_spill_moves_output_to_disk(tmp_path):
+    output = CommandOutput(memory_limit=1024, head_bytes=16, tail_bytes=16, spill_dir=str(tmp_path))
+    expected = write_lines(output, 50)
+    summary = output.summary()
+
+    output.spill()
+    assert output.spilled
+    assert output.memory_bytes == 0
+    assert len(output._tail) == 16
+    assert output.read() == expected
+    assert output.summary() == summary
+
+
+def test_summary_of_truncated_output_has_head_and_tail(tmp_path):
+    output = CommandOutput(memory_limit=256, head_bytes=14, tail_bytes=8, spill_dir=str(tmp_path))
+    expected = write_lines(output, 100)
+
+    assert output.truncated
+    omitted = len(expected) - 14 - 8
+    assert output.summary() == f'line 0\nline 1\n\n... [{omitted} bytes omitted] ...\nline 99\n'
+
+
+def test_summary_when_output_just_fits(tmp_path):
+    output = CommandOutput(memory_limit=256, head_bytes=4, tail_bytes=8, spill_dir=str(tmp_path))
+    for chunk in (b'abc', b'defgh', b'ijkl'):
+        output.append(chunk)
+    assert output.summary() == 'abcdefghijkl'
+
+
+def test_close_discards_output(tmp_path):
+    output = CommandOutput(memory_limit=16, head_bytes=4, tail_bytes=4, spill_dir=str(tmp_path))
+    write_lines(output, 10)
+    assert output.spilled
+    output.close()
+
+    assert output.read() == b''
+    output.append(b'more')
+    assert output.read() == b''
+
+
+def test_iter_lines_across_pages(tmp_path):
+    output = CommandOutput(memory_limit=64, head_bytes=8, tail_bytes=8, spill_dir=str(tmp_path))
+    expected = write_lines(output, 50)
+    output.append('naïve last line'.encode())
+
+    lines = list(output.iter_lines(page_bytes=7))
+    assert lines == expected.decode().splitlines() + ['naïve last line']
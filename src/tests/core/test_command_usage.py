@@ -0,0 +1,23 @@
+from src.core.command_usage import CommandUsageStats, percentile
+
+
+def test_percentile_uses_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([7], 90) == 7
+
+
+def test_stats_skip_unmeasured_metrics():
+    stats = CommandUsageStats(max_samples=10)
+    for wall in (1.0, 2.0, 3.0, 4.0):
+        stats.record('grep', {'wall_seconds': wall, 'cpu_seconds': None, 'output_bytes': 10})
+
+    grep = stats.stats()['grep']
+    assert grep['runs'] == 4
+    assert grep['wall_seconds'] == {'p50': 2.0, 'p90': 4.0, 'p99': 4.0, 'max': 4.0, 'mean': 2.5}
+    assert grep['cpu_seconds'] is None
+    assert grep['peak_memory_bytes'] is None
+
+    stats.clear()
+    assert stats.stats() == {}
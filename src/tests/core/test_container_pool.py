@@ -0,0 +1,162 @@
+import threading
+import time
+
+import pytest
+from docker.models.containers import ExecResult
+
+from src.core.container_pool import ContainerPool
+from src.tests.utils.fake_docker import FakeDockerClient
+
+
+def make_pool(client, size=2, max_uses=3):
+    return ContainerPool(lambda: client, image_name='target-image', size=size, max_uses=max_uses,
+                         volumes={'/host/repo': {'bind': '/repo', 'mode': 'rw'}})
+
+
+def test_pool_reuses_containers():
+    client = FakeDockerClient()
+    pool = make_pool(client)
+
+    assert pool.run(['pytest', '-x']) == (0, 'ran: pytest -x')
+    assert pool.run(['grep', 'foo']) == (0, 'ran: grep foo')
+
+    assert len(client.containers.created) == 1
+    container = client.containers.created[0]
+    assert container.exec_commands == [['pytest', '-x'], ['grep', 'foo']]
+    assert container.run_kwargs['image'] == 'target-image'
+    assert container.run_kwargs['volumes'] == {'/host/repo': {'bind': '/repo', 'mode': 'rw'}}
+
+
+def test_pool_recycles_containers_after_max_uses():
+    client = FakeDockerClient()
+    pool = make_pool(client, max_uses=2)
+
+    for _ in range(5):
+        pool.run(['true'])
+
+    assert len(client.containers.created) == 3
+    assert [container.removed for container in client.containers.created] == [True, True, False]
+    assert pool.stats()['recycled'] == 2
+
+
+def test_pool_replaces_stopped_containers():
+    client = FakeDockerClient()
+    pool = make_pool(client)
+    pool.run(['true'])
+    client.containers.created[0].stop()
+
+    assert pool.run(['true']) == (0, 'ran: true')
+    assert len(client.containers.created) == 2
+    assert client.containers.created[0].removed
+    assert pool.stats()['unhealthy'] == 1
+
+
+def test_pool_discards_container_when_exec_fails():
+    def failing_exec(command):
+        raise RuntimeError('exec failed')
+
+    client = FakeDockerClient(failing_exec)
+    pool = make_pool(client)
+    with pytest.raises(RuntimeError):
+        pool.run(['true'])
+
+    assert client.containers.created[0].removed
+    assert pool.stats()['containers'] == 0
+
+
+def test_pool_limits_concurrent_containers():
+    running = []
+    max_running = []
+    lock = threading.Lock()
+
+    def slow_exec(command):
+        with lock:
+            running.append(command)
+            max_running.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.remove(command)
+        return ExecResult(0, b'')
+
+    client = FakeDockerClient(slow_exec)
+    pool = make_pool(client, size=2, max_uses=100)
+    threads = [threading.Thread(target=pool.run, args=([f'cmd{i}'],)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(max_running) == 2
+    assert len(client.containers.created) == 2
+
+
+def test_pool_close_removes_containers():
+    client = FakeDockerClient()
+    pool = make_pool(client)
+    pool.run(['true'])
+    pool.close()
+
+    assert all(container.removed for container in client.containers.created)
+    assert pool.stats()['containers'] == 0
+
+
+def test_pool_streams_command_output():
+    def chunked_exec(command):
+        return ExecResult(3, iter([b'collected 2 items\n', b'1 failed, 1 passed\n']))
+
+    client = FakeDockerClient(chunked_exec)
+    pool = make_pool(client)
+    stream = pool.stream(['pytest'])
+
+    assert list(stream) == [b'collected 2 items\n', b'1 failed, 1 passed\n']
+    assert stream.exit_code == 3
+    # The container went back to the pool
+    assert pool.stats()['idle'] == 1
+    assert pool.run(['true']) == (3, 'collected 2 items\n1 failed, 1 passed\n')
+    assert len(client.containers.created) == 1
+
+
+def test_pool_measures_cpu_time_of_streamed_commands():
+    client = FakeDockerClient()
+    pool = ContainerPool(lambda: client, image_name='target-image', size=1, max_uses=3,
+                         volumes={'/host/repo': {'bind': '/repo', 'mode': 'rw'}}, collect_stats=True)
+    stream = pool.stream(['pytest'])
+    list(stream)
+    assert stream.resource_usage.cpu_seconds == pytest.approx(0.1)
+    assert stream.resource_usage.peak_memory_bytes is None
+
+    # Not measured unless asked for
+    stream = make_pool(client).stream(['pytest'])
+    list(stream)
+    assert stream.resource_usage.cpu_seconds is None
+
+
+def test_cancelled_stream_removes_container():
+    def endless_exec(command):
+        def output():
+            while True:
+                yield b'.'
+        return ExecResult(0, output())
+
+    client = FakeDockerClient(endless_exec)
+    pool = make_pool(client)
+    stream = pool.stream(['pytest'])
+    chunks = iter(stream)
+    assert next(chunks) == b'.'
+
+    stream.cancel()
+    assert list(chunks) == []
+    assert stream.exit_code is None
+    assert client.containers.created[0].removed
+    assert pool.stats()['containers'] == 0
+
+
+def test_pool_runs_commands_through_the_image_entrypoint():
+    client = FakeDockerClient(entrypoint=['/docker-entrypoint.sh'])
+    pool = make_pool(client)
+
+    assert pool.run(['pytest']) == (0, 'ran: /docker-entrypoint.sh pytest')
+    stream = pool.stream(['grep', 'foo'])
+    assert b''.join(stream) == b'ran: /docker-entrypoint.sh grep foo'
+    container = client.containers.created[0]
+    assert container.run_kwargs['entrypoint'] == ['tail', '-f', '/dev/null']
@@ -0,0 +1,16 @@
+from src.core import file_events
+from src.core.file_events import MODIFIED, notify_file_changed
+
+
+def test_failing_listener_does_not_stop_the_others(monkeypatch, caplog):
+    calls = []
+
+    def failing_listener(path):
+        raise RuntimeError('broken index')
+
+    monkeypatch.setattr(file_events, '_listeners', [failing_listener, calls.append])
+    monkeypatch.setattr(file_events, '_event_listeners', [lambda *event: calls.append(event)])
+    notify_file_changed('/repo/module.py').result(timeout=5)
+
+    assert calls == ['/repo/module.py', ('/repo/module.py', MODIFIED, None)]
+    assert 'broken index' in caplog.text
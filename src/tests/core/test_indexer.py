@@ -0,0 +1,61 @@
+import pytest
+
+from src.core import indexer as indexer_module
+from src.core.config import settings
+from src.core.indexer import RepoIndexer
+from src.core.retrieval_index import RetrievalIndex
+from src.core.symbol_index import SymbolIndex
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'REPO_ROOT', str(tmp_path))
+    monkeypatch.setattr(settings, 'LLMIGNORE_PATH', str(tmp_path / '.llmignore'))
+    (tmp_path / 'first.py').write_text('def first():\n    pass\n')
+    (tmp_path / 'second.py').write_text('def second():\n    pass\n')
+    return tmp_path
+
+
+def test_failed_run_does_not_load_partial_results(repo, monkeypatch):
+    index = SymbolIndex(str(repo))
+    retrieval = RetrievalIndex(str(repo))
+    indexer = RepoIndexer(index, workers=1, batch_size=1, retrieval_index=retrieval)
+    index_python_files = indexer_module.index_python_files
+    calls = []
+
+    def fail_on_second_batch(batch):
+        calls.append(batch)
+        if len(calls) > 1:
+            raise MemoryError()
+        return index_python_files(batch)
+
+    monkeypatch.setattr(indexer_module, 'index_python_files', fail_on_second_batch)
+    indexer.start()
+    indexer.wait(timeout=10)
+    assert indexer.progress()['status'] == 'failed'
+    assert not index.is_built and not retrieval.is_built
+
+    # The next lookup builds the index itself
+    index.ensure_built()
+    assert [symbol.qualname for symbol in index.search('')] == ['first.first', 'second.second']
+
+
+def test_paths_changed_during_a_run_are_applied_after_it(repo, monkeypatch):
+    index = SymbolIndex(str(repo))
+    retrieval = RetrievalIndex(str(repo))
+    indexer = RepoIndexer(index, workers=1, batch_size=1, retrieval_index=retrieval)
+    index_python_files = indexer_module.index_python_files
+
+    def add_file_while_indexing(batch):
+        if not (repo / 'third.py').exists():
+            (repo / 'third.py').write_text('def third():\n    pass\n')
+            index.update_path(str(repo / 'third.py'))
+            retrieval.update_path(str(repo / 'third.py'))
+        return index_python_files(batch)
+
+    monkeypatch.setattr(indexer_module, 'index_python_files', add_file_while_indexing)
+    indexer.start()
+    indexer.wait(timeout=10)
+    assert indexer.progress()['status'] == 'done'
+    assert index.get('third.third') is not None
+    assert [result.symbol.qualname for result in retrieval.search('third')] == ['third.third']
@@ -0,0 +1,198 @@
+import threading
+import time
+
+import pytest
+
+from src.core.command_executor import CommandExecutor
+from src.core.command_usage import CommandUsageStats
+from src.core.container_pool import CommandStream, ResourceUsage
+from src.core.jobs import JobStore, COMPLETED, FAILED, CANCELLED, TIMED_OUT, QUEUED
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out waiting for condition")
+        time.sleep(0.01)
+
+
+def blocking_stream(release: threading.Event, killed: threading.Event, output=b'working\n'):
+    def chunks():
+        yield output
+        while not release.is_set() and not killed.is_set():
+            time.sleep(0.01)
+    return CommandStream(chunks(), wait=lambda: 0, kill=killed.set, close=lambda healthy: None)
+
+
+@pytest.fixture
+def executor():
+    executor = CommandExecutor(max_workers=1, default_limit=1)
+    yield executor
+    executor.shutdown()
+
+
+@pytest.fixture
+def store(executor):
+    return JobStore(executor, max_jobs=100, ttl_seconds=60)
+
+
+def test_job_collects_output_and_exit_code(store):
+    stream = CommandStream([b'1 failed, ', b'2 passed\n'], wait=lambda: 1, kill=lambda: None, close=lambda healthy: None)
+    job = store.submit('pytest', ['pytest'], lambda: stream)
+
+    job.future.result(timeout=2)
+    assert job.status == COMPLETED
+    assert job.exit_code == 1
+    assert job.output.read() == b'1 failed, 2 passed\n'
+    assert job.output.read(offset=2, limit=6) == b'failed'
+    assert store.get(job.id) is job
+
+
+def test_job_that_cannot_start_fails(store):
+    def open_stream():
+        raise RuntimeError('image not found')
+
+    job = store.submit('pytest', ['pytest'], open_stream)
+    with pytest.raises(RuntimeError):
+        job.future.result(timeout=2)
+    assert job.status == FAILED
+    assert job.error == 'image not found'
+
+
+def test_higher_priority_jobs_run_first(store):
+    release, killed = threading.Event(), threading.Event()
+    blocker = store.submit('pytest', ['pytest'], lambda: blocking_stream(release, killed))
+    wait_until(lambda: blocker.started_at is not None)
+
+    order = []
+
+    def recording_stream(name):
+        def open_stream():
+            order.append(name)
+            return CommandStream([], wait=lambda: 0, kill=lambda: None, close=lambda healthy: None)
+        return open_stream
+
+    low = store.submit('grep', ['grep'], recording_stream('low'), priority=-1)
+    normal = store.submit('pytest', ['pytest'], recording_stream('normal'))
+    high = store.submit('grep', ['grep'], recording_stream('high'), priority=5)
+    release.set()
+    for job in (low, normal, high):
+        job.future.result(timeout=2)
+    assert order == ['high', 'normal', 'low']
+
+
+def test_job_is_killed_after_timeout(store):
+    release, killed = threading.Event(), threading.Event()
+    job = store.submit('pytest', ['pytest'], lambda: blocking_stream(release, killed), timeout_seconds=0.1)
+
+    wait_until(lambda: job.finished)
+    assert killed.is_set()
+    assert job.status == TIMED_OUT
+    assert job.exit_code is None
+    assert job.output.read() == b'working\n'
+
+
+def test_cancel_running_job(store):
+    release, killed = threading.Event(), threading.Event()
+    job = store.submit('pytest', ['pytest'], lambda: blocking_stream(release, killed))
+    wait_until(lambda: job.output.size > 0)
+
+    assert job.stop(CANCELLED)
+    wait_until(lambda: job.finished)
+    assert killed.is_set()
+    assert job.status == CANCELLED
+    assert not job.stop(CANCELLED)
+
+
+def test_cancel_queued_job(store):
+    release, killed = threading.Event(), threading.Event()
+    blocker = store.submit('pytest', ['pytest'], lambda: blocking_stream(release, killed))
+    opened = []
+    queued = store.submit('pytest', ['pytest'], lambda: opened.append(True))
+    assert queued.status == QUEUED
+
+    assert queued.stop(CANCELLED)
+    assert queued.status == CANCELLED
+    release.set()
+    blocker.future.result(timeout=2)
+    assert opened == []
+
+
+def test_finished_jobs_expire(executor):
+    store = JobStore(executor, max_jobs=100, ttl_seconds=0.05)
+    stream = CommandStream([], wait=lambda: 0, kill=lambda: None, close=lambda healthy: None)
+    job = store.submit('pytest', ['pytest'], lambda: stream)
+    job.future.result(timeout=2)
+
+    assert store.get(job.id) is job
+    time.sleep(0.1)
+    assert store.get(job.id) is None
+
+
+def test_oldest_finished_jobs_are_evicted_over_max_jobs(executor):
+    store = JobStore(executor, max_jobs=2, ttl_seconds=60)
+    jobs = []
+    for _ in range(3):
+        stream = CommandStream([], wait=lambda: 0, kill=lambda: None, close=lambda healthy: None)
+        jobs.append(store.submit('pytest', ['pytest'], lambda stream=stream: stream))
+        jobs[-1].future.result(timeout=2)
+
+    assert [job.id for job in store.list()] == [job.id for job in jobs[1:]]
+
+
+def test_oldest_finished_jobs_output_moves_to_disk_over_memory_limit(executor):
+    store = JobStore(executor, max_jobs=100, ttl_seconds=60, max_output_memory=250)
+    jobs = []
+    for i in range(3):
+        stream = CommandStream([b'x' * 100], wait=lambda: 0, kill=lambda: None, close=lambda healthy: None)
+        jobs.append(store.submit('pytest', ['pytest'], lambda stream=stream: stream))
+        jobs[-1].future.result(timeout=2)
+        wait_until(lambda: jobs[-1].finished)
+
+    wait_until(lambda: jobs[0].output.spilled)
+    assert [job.output.spilled for job in jobs] == [True, False, False]
+    assert all(job.output.read() == b'x' * 100 for job in jobs)
+
+
+def test_job_records_resource_usage(executor):
+    usage_stats = CommandUsageStats(max_samples=2)
+    store = JobStore(executor, max_jobs=100, ttl_seconds=60, usage_stats=usage_stats)
+
+    def open_stream():
+        time.sleep(0.05)
+        stream = CommandStream([b'ok\n'], wait=lambda: 0, kill=lambda: None, close=lambda healthy: None)
+        stream.resource_usage = ResourceUsage(cpu_seconds=0.5, peak_memory_bytes=1024)
+        return stream
+
+    jobs = [store.submit('pytest', ['pytest'], open_stream) for _ in range(3)]
+    for job in jobs:
+        job.future.result(timeout=2)
+    wait_until(lambda: usage_stats.stats().get('pytest', {}).get('runs') == 3)
+
+    usage = jobs[-1].usage()
+    assert usage['start_latency_seconds'] >= 0.05
+    # It waited for the first two jobs to run on the only worker
+    assert usage['queue_wait_seconds'] >= 0.1
+    assert usage['wall_seconds'] >= 0
+    assert (usage['cpu_seconds'], usage['peak_memory_bytes'], usage['output_bytes']) == (0.5, 1024, 3)
+    assert jobs[-1].to_dict()['usage'] == usage
+
+    stats = usage_stats.stats()['pytest']
+    # Only the most recent runs are kept
+    assert stats['samples'] == 2
+    assert stats['cpu_seconds'] == {'p50': 0.5, 'p90': 0.5, 'p99': 0.5, 'max': 0.5, 'mean': 0.5}
+    assert stats['output_bytes']['max'] == 3
+
+
+def test_jobs_cancelled_while_queued_are_not_recorded(executor):
+    usage_stats = CommandUsageStats(max_samples=10)
+    store = JobStore(executor, max_jobs=100, ttl_seconds=60, usage_stats=usage_stats)
+    release, killed = threading.Event(), threading.Event()
+    running = store.submit('pytest', ['pytest'], lambda: blocking_stream(release, killed))
+    queued = store.submit('pytest', ['pytest'], lambda: blocking_stream(release, killed))
+    wait_until(lambda: running.status == 'running')
+    queued.stop(CANCELLED)
+    release.set()
+    running.future.result(timeout=2)
+    wait_until(lambda: usage_stats.stats().get('pytest', {}).get('runs') == 1)
@@ -0,0 +1,51 @@
+from src.core import line_index
+from src.core.line_index import LineOffsetCache, compute_line_offsets, read_bytes
+
+
+def test_line_offsets(tmp_path):
+    path = tmp_path / 'lines.txt'
+    path.write_bytes(b'one\ntwo\n\nfour')
+    offsets = compute_line_offsets(str(path))
+    assert offsets.starts.tolist() == [0, 4, 8, 9]
+    assert offsets.line_count == 4
+    assert offsets.byte_span(2, 3) == (4, 9)
+    assert offsets.byte_span(4, 4) == (9, 13)
+    assert read_bytes(str(path), *offsets.byte_span(1, 2)) == b'one\ntwo\n'
+
+    path.write_bytes(b'one\ntwo\n')
+    assert compute_line_offsets(str(path)).line_count == 2
+    path.write_bytes(b'')
+    assert compute_line_offsets(str(path)).line_count == 0
+
+
+def test_offsets_span_read_blocks(tmp_path, monkeypatch):
+    monkeypatch.setattr(line_index, 'READ_BLOCK_BYTES', 7)
+    path = tmp_path / 'lines.txt'
+    path.write_bytes(b''.join(b'line %d\n' % i for i in range(100)))
+    offsets = compute_line_offsets(str(path))
+    assert offsets.line_count == 100
+    assert read_bytes(str(path), *offsets.byte_span(57, 58)) == b'line 56\nline 57\n'
+
+
+def test_cache_is_invalidated_when_file_changes(tmp_path):
+    path = tmp_path / 'lines.txt'
+    path.write_bytes(b'a\nb\n')
+    cache = LineOffsetCache(max_bytes=1024)
+    assert cache.get(str(path)).line_count == 2
+    assert cache.get(str(path)).line_count == 2
+    assert cache.stats()['hits'] == 1
+
+    path.write_bytes(b'a\nb\nc\n')
+    assert cache.get(str(path)).line_count == 3
+    assert cache.stats()['misses'] == 2
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = LineOffsetCache(max_bytes=3 * 8)
+    for name in ('a', 'b'):
+        (tmp_path / name).write_bytes(b'x\ny\n')
+        cache.get(str(tmp_path / name))
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['entries'] == 1
+    cache.invalidate(str(tmp_path / 'b'))
+    assert cache.stats()['current_bytes'] == 0
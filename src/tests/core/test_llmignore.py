@@ -0,0 +1,35 @@
+import pytest
+
+from src.core.llmignore import LLMIgnoreMatcher
+
+
+@pytest.mark.parametrize('patterns, path, is_dir, expected', [
+    # Patterns without a slash match at any depth
+    (['*.pyc'], 'module.pyc', False, True),
+    (['*.pyc'], 'src/pkg/module.pyc', False, True),
+    (['*.pyc'], 'src/pkg/module.py', False, False),
+    # `*` does not cross directories in anchored patterns
+    (['/src/*.py'], 'src/main.py', False, True),
+    (['/src/*.py'], 'src/pkg/main.py', False, False),
+    (['/src/*.py'], 'other/src/main.py', False, False),
+    # `**` does cross directories
+    (['src/**/test_*.py'], 'src/a/b/test_x.py', False, True),
+    (['src/**/test_*.py'], 'src/test_x.py', False, True),
+    (['**/build'], 'a/b/build', True, True),
+    (['logs/**'], 'logs/today/out.log', False, True),
+    # Trailing slash only matches directories, and everything inside them
+    (['build/'], 'build', True, True),
+    (['build/'], 'build', False, False),
+    (['build/'], 'pkg/build/lib/x.py', False, True),
+    (['node_modules'], 'web/node_modules/react/index.js', False, True),
+    # Later negations re-include, last match wins
+    (['*.log', '!keep.log'], 'keep.log', False, False),
+    (['*.log', '!keep.log'], 'other.log', False, True),
+    (['*.log', '!keep.log', 'keep.log'], 'keep.log', False, True),
+    # A file inside an ignored directory can't be re-included
+    (['build/', '!build/keep.txt'], 'build/keep.txt', False, True),
+    (['venv*'], 'venv3/lib/site.py', False, True),
+    ([], 'anything.py', False, False),
+])
+def test_llmignore_matcher(patterns, path, is_dir, expected):
+    assert LLMIgnoreMatcher(patterns).is_ignored(path, is_dir) is expected
@@ -0,0 +1,76 @@
+import sys
+import threading
+import time
+
+import pytest
+
+from src.core.local_process import stream_local_command
+
+
+def run(command_line, cwd, max_output_bytes=1024 * 1024, cpu_seconds=10):
+    stream = stream_local_command(command_line, str(cwd), cpu_seconds=cpu_seconds,
+                                  memory_bytes=1024 * 1024 * 1024, max_output_bytes=max_output_bytes)
+    return stream, b"".join(stream)
+
+
+def test_runs_command_in_directory(tmp_path):
+    (tmp_path / "hello.txt").write_text("hello\n")
+    stream, output = run(["cat", "hello.txt"], tmp_path)
+    assert output == b"hello\n"
+    assert stream.exit_code == 0
+
+
+def test_measures_resource_usage(tmp_path):
+    stream, _ = run([sys.executable, "-c", "x = bytearray(64 * 1024 * 1024); sum(range(10 ** 6))"], tmp_path)
+    assert stream.exit_code == 0
+    assert stream.resource_usage.cpu_seconds > 0
+    assert stream.resource_usage.peak_memory_bytes > 64 * 1024 * 1024
+
+
+def test_reports_exit_code_and_stderr(tmp_path):
+    stream, output = run(["sh", "-c", "echo oops >&2; exit 3"], tmp_path)
+    assert output == b"oops\n"
+    assert stream.exit_code == 3
+
+
+def test_server_environment_is_not_passed_on(tmp_path, monkeypatch):
+    monkeypatch.setenv("SECRET_TOKEN", "hunter2")
+    _, output = run(["sh", "-c", "echo ${SECRET_TOKEN:-unset}"], tmp_path)
+    assert output == b"unset\n"
+
+
+def test_output_limit_kills_command(tmp_path):
+    stream, output = run(["yes"], tmp_path, max_output_bytes=1000)
+    assert output.startswith(b"y\n" * 500)
+    assert b"output limit of 1000 bytes reached" in output
+    assert stream.exit_code == 137
+
+
+def test_cpu_limit_kills_command(tmp_path):
+    stream, _ = run(["sh", "-c", "while :; do :; done"], tmp_path, cpu_seconds=1)
+    # SIGXCPU
+    assert stream.exit_code == 152
+
+
+def test_limits_apply_from_the_start_and_to_children(tmp_path):
+    # Read by a process the command starts, which inherits the limits
+    script = "import resource; print(resource.getrlimit(resource.RLIMIT_CPU), resource.getrlimit(resource.RLIMIT_FSIZE))"
+    _, output = run(["sh", "-c", f"{sys.executable} -c '{script}'"], tmp_path, cpu_seconds=7, max_output_bytes=4096)
+    assert output == b"(7, 8) (4096, 4096)\n"
+
+
+def test_cancel_kills_process_group(tmp_path):
+    stream = stream_local_command(["sh", "-c", "sleep 30 & sleep 30"], str(tmp_path), cpu_seconds=10,
+                                  memory_bytes=1024 * 1024 * 1024, max_output_bytes=1024)
+    threading.Timer(0.1, stream.cancel).start()
+    start = time.monotonic()
+    assert b"".join(stream) == b""
+    assert time.monotonic() - start < 5
+    assert stream.cancelled
+    assert stream.exit_code is None
+
+
+def test_missing_command_raises(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        stream_local_command(["no-such-command-xyz"], str(tmp_path), cpu_seconds=1,
+                             memory_bytes=1024 * 1024 * 1024, max_output_bytes=1024)
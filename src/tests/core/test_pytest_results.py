@@ -0,0 +1,100 @@
+import os
+
+from src.core.pytest_results import (ERROR, FAILED, PASSED, SKIPPED, LastFailed, PytestResults, node_id_from_junit,
+                                     parse_junit_xml, record_test_results)
+from src.core.sharding import DurationHistory
+
+
+JUNIT_XML = """<?xml version="1.0" encoding="utf-8"?>
+<testsuites><testsuite name="pytest" errors="1" failures="1" skipped="1" tests="5" time="1.2">
+<testcase classname="tests.test_a" name="test_one" time="0.5" />
+<testcase classname="tests.test_a" name="test_two" time="0.25">
+<failure message="assert 1 == 2">def test_two():
+&gt;       assert 1 == 2
+E       assert 1 == 2</failure>
+</testcase>
+<testcase classname="tests.test_b.TestB" name="test_three[x y]" time="0.1">
+<skipped type="pytest.skip" message="not today">tests/test_b.py:3: not today</skipped>
+</testcase>
+<testcase classname="tests.test_b.TestB" name="test_four" time="0.05">
+<error message="failed on setup with &quot;fixture 'db' not found&quot;">fixture 'db' not found</error>
+</testcase>
+<testcase classname="tests.test_deleted" name="test_gone" time="0.0" />
+</testsuite></testsuites>
+"""
+
+
+def make_repo(tmp_path):
+    (tmp_path / "tests").mkdir()
+    (tmp_path / "tests" / "test_a.py").write_text("")
+    (tmp_path / "tests" / "test_b.py").write_text("")
+    report = tmp_path / "junit.xml"
+    report.write_text(JUNIT_XML)
+    return str(report)
+
+
+def test_node_id_from_junit(tmp_path):
+    make_repo(tmp_path)
+    assert node_id_from_junit("tests.test_a", "test_one", str(tmp_path)) == "tests/test_a.py::test_one"
+    assert node_id_from_junit("tests.test_b.TestB", "test_x[1]", str(tmp_path)) == "tests/test_b.py::TestB::test_x[1]"
+    assert node_id_from_junit("tests.test_deleted", "test_gone", str(tmp_path)) == "tests/test_deleted.py::test_gone"
+
+
+def test_parse_junit_xml(tmp_path):
+    results = parse_junit_xml(make_repo(tmp_path), str(tmp_path))
+    assert [(case.node_id, case.outcome) for case in results.cases] == [
+        ("tests/test_a.py::test_one", PASSED),
+        ("tests/test_a.py::test_two", FAILED),
+        ("tests/test_b.py::TestB::test_three[x y]", SKIPPED),
+        ("tests/test_b.py::TestB::test_four", ERROR),
+        ("tests/test_deleted.py::test_gone", PASSED),
+    ]
+    assert results.cases[1].message == "assert 1 == 2"
+    assert results.cases[0].duration == 0.5
+
+    summary = results.summary(max_failures=1)
+    assert (summary["passed"], summary["failed"], summary["errors"], summary["skipped"]) == (2, 1, 1, 1)
+    assert summary["duration_seconds"] == 0.9
+    assert [failure["node_id"] for failure in summary["failures"]] == ["tests/test_a.py::test_two"]
+    assert summary["failures_truncated"]
+
+
+def test_merge_results():
+    merged = PytestResults.merge([PytestResults([]), None, PytestResults([])])
+    assert merged.cases == []
+    assert merged.summary()["passed"] == 0
+
+
+def test_last_failed_tracks_latest_outcome(tmp_path):
+    path = str(tmp_path / "last_failed.json")
+    last_failed = LastFailed(path)
+    last_failed.update(parse_junit_xml(make_repo(tmp_path), str(tmp_path)))
+    assert last_failed.node_ids() == ["tests/test_a.py::test_two", "tests/test_b.py::TestB::test_four"]
+
+    # A later run where one of them passed
+    (tmp_path / "rerun.xml").write_text('<testsuite><testcase classname="tests.test_a" name="test_two" time="0.1"/>'
+                                        '</testsuite>')
+    last_failed.update(parse_junit_xml(str(tmp_path / "rerun.xml"), str(tmp_path)))
+    assert last_failed.node_ids() == ["tests/test_b.py::TestB::test_four"]
+    # Saved across restarts
+    assert LastFailed(path).node_ids() == ["tests/test_b.py::TestB::test_four"]
+
+    last_failed.clear()
+    assert LastFailed(path).node_ids() == []
+
+
+def test_record_test_results(tmp_path):
+    report = make_repo(tmp_path)
+    last_failed = LastFailed()
+    durations = DurationHistory()
+    results = record_test_results(report, str(tmp_path), last_failed, durations)
+    assert len(results.cases) == 5
+    assert not os.path.exists(report)
+    assert durations.get("tests/test_a.py::test_one") == 0.5
+    # Skipped tests don't say how long they take to run
+    assert durations.get("tests/test_b.py::TestB::test_three[x y]") is None
+    assert len(last_failed.node_ids()) == 2
+
+    # Pytest was killed before writing a report
+    assert record_test_results(report, str(tmp_path), last_failed, durations) is None
+    assert len(last_failed.node_ids()) == 2
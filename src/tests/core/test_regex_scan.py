@@ -0,0 +1,91 @@
+import os
+
+import pytest
+
+from src.core.config import settings
+from src.core.regex_scan import RegexScanner, ScanSummary, compile_scan_pattern, scan_file
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'REPO_ROOT', str(tmp_path))
+    files = {
+        'app/main.py': 'import os\n\ndef handle_request(request):\n    return handle_request(request)\n',
+        'app/café.py': '# café handle_request\n',
+        'docs/guide.md': 'Call handle_request with a request.\r\n',
+        'data/blob.bin': 'handle_request\0\x01\x02',
+        'empty.txt': '',
+        '.git/config': 'handle_request',
+    }
+    for path, content in files.items():
+        os.makedirs(tmp_path / os.path.dirname(path), exist_ok=True)
+        (tmp_path / path).write_text(content)
+    return tmp_path
+
+
+def scan(root, pattern, workers=1, ignore_case=False, **kwargs):
+    scanner = RegexScanner(workers=workers, batch_size=1)
+    try:
+        *matches, summary = scanner.scan(str(root), compile_scan_pattern(pattern, ignore_case), **kwargs)
+    finally:
+        scanner.shutdown()
+    return sorted((match.path, match.line_number, match.column) for match in matches), summary
+
+
+def test_scan_file_reports_lines_and_columns(repo):
+    regex = compile_scan_pattern(r'handle_\w+', ignore_case=False)
+    matches = scan_file(str(repo / 'app' / 'main.py'), regex, limit=10)
+    # One match per line
+    assert [match[1:] for match in matches] == [
+        (3, 5, 'def handle_request(request):'),
+        (4, 12, '    return handle_request(request)'),
+    ]
+    # Columns count characters, not bytes
+    assert scan_file(str(repo / 'app' / 'café.py'), regex, limit=10)[0][2] == 8
+    assert scan_file(str(repo / 'docs' / 'guide.md'), regex, limit=10)[0][3] == 'Call handle_request with a request.'
+    assert len(scan_file(str(repo / 'app' / 'main.py'), regex, limit=1)) == 1
+
+
+def test_scan_skips_binary_empty_and_git_files(repo):
+    matches, summary = scan(repo, 'handle_request')
+    assert [path for path, _, _ in matches] == ['app/café.py', 'app/main.py', 'app/main.py', 'docs/guide.md']
+    assert summary == ScanSummary(files_scanned=5, matches=4, truncated=False)
+
+
+def test_scan_honors_llmignore_and_include(repo, monkeypatch):
+    (repo / '.llmignore').write_text('docs/\n')
+    monkeypatch.setattr(settings, 'LLMIGNORE_PATH', str(repo / '.llmignore'))
+    matches, _ = scan(repo, 'handle_request')
+    assert 'docs/guide.md' not in [path for path, _, _ in matches]
+    matches, _ = scan(repo, 'HANDLE', ignore_case=True, include=['main.py'])
+    assert matches == [('app/main.py', 3, 5), ('app/main.py', 4, 12)]
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_scan_stops_at_max_results(repo, workers):
+    matches, summary = scan(repo, 'handle_request', workers=workers, max_results=2)
+    assert len(matches) == 2
+    assert summary.matches == 2
+    assert summary.truncated
+    matches, summary = scan(repo, 'handle_request', workers=workers)
+    assert len(matches) == 4
+    assert not summary.truncated
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_scan_interrupts_batches_that_take_too_long(repo, workers):
+    # Catastrophic backtracking: exponential in the number of "a"s
+    (repo / 'app' / 'slow.txt').write_text('a' * 40 + '!\n')
+    scanner = RegexScanner(workers=workers, batch_size=1, batch_timeout_seconds=0.5)
+    try:
+        *_, summary = scanner.scan(str(repo), compile_scan_pattern(r'^(a+)+$', ignore_case=False))
+        assert summary.timed_out
+        assert summary.truncated
+        # The interrupted worker carries on with the next search
+        executor = scanner._executor
+        *matches, summary = scanner.scan(str(repo), compile_scan_pattern('handle_request', ignore_case=False))
+        assert len(matches) == 4
+        assert not summary.timed_out
+        assert scanner._executor is executor
+    finally:
+        scanner.shutdown()
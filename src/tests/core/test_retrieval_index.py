@@ -0,0 +1,113 @@
+import os
+
+import pytest
+
+from src.core.config import settings
+from src.core.retrieval_index import RetrievalIndex, tokenize
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'REPO_ROOT', str(tmp_path))
+    files = {
+        'app/http/retries.py': (
+            'class RetryPolicy:\n'
+            '    """Decide when failed HTTP requests are retried."""\n'
+            '\n'
+            '    def backoff_seconds(self, attempt):\n'
+            '        return 2 ** attempt\n'
+        ),
+        'app/users.py': (
+            'def getUserId(request):\n'
+            '    """Return the id of the user making the request.\n'
+            '\n'
+            '    Falls back to the session."""\n'
+            '    return request.user.id\n'
+            '\n'
+            'def load_user(user_id):\n'
+            '    return None\n'
+        ),
+        'app/broken.py': 'def oops(:\n',
+    }
+    for path, content in files.items():
+        os.makedirs(tmp_path / os.path.dirname(path), exist_ok=True)
+        (tmp_path / path).write_text(content)
+    index = RetrievalIndex(str(tmp_path))
+    index.build()
+    return index
+
+
+def qualnames(results):
+    return [result.symbol.qualname for result in results]
+
+
+def test_tokenize_splits_identifiers():
+    assert tokenize('get_user_id getUserId') == ['get', 'user', 'id', 'get', 'user', 'id']
+    assert tokenize('parseHTTPResponse2 x') == ['parse', 'http', 'response']
+
+
+def test_search_ranks_by_name_path_and_docstring(repo):
+    # Name matches outrank parameter and docstring matches
+    assert qualnames(repo.search('user id')) == ['app.users.getUserId', 'app.users.load_user']
+    # Docstring
+    assert qualnames(repo.search('when are requests retried'))[0] == 'app.http.retries.RetryPolicy'
+    # Module path
+    assert set(qualnames(repo.search('retries'))) == \
+        {'app.http.retries.RetryPolicy', 'app.http.retries.RetryPolicy.backoff_seconds'}
+    assert repo.search('nothing matches this') == []
+
+
+def test_search_returns_spans_and_docstring_summary(repo):
+    result = repo.search('getUserId')[0]
+    assert result.symbol.file_path == 'app/users.py'
+    assert (result.symbol.start_line, result.symbol.end_line) == (1, 5)
+    assert result.docstring == 'Return the id of the user making the request.'
+    assert result.score > 0
+
+
+def test_search_filters_kind_and_limits(repo):
+    assert qualnames(repo.search('retry backoff', kind='method')) == ['app.http.retries.RetryPolicy.backoff_seconds']
+    assert len(repo.search('user', limit=1)) == 1
+
+
+def test_index_is_updated_incrementally(repo, tmp_path):
+    (tmp_path / 'app' / 'users.py').write_text('def find_account(account_id):\n    pass\n')
+    repo.update_path(str(tmp_path / 'app' / 'users.py'))
+    assert repo.search('load user') == []
+    assert qualnames(repo.search('account')) == ['app.users.find_account']
+
+    os.remove(tmp_path / 'app' / 'http' / 'retries.py')
+    os.rmdir(tmp_path / 'app' / 'http')
+    repo.update_path(str(tmp_path / 'app' / 'http'))
+    assert repo.search('retry') == []
+    assert repo.stats()['symbols'] == 1
+
+
+def test_paths_changed_during_a_build_are_applied_after_it(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'REPO_ROOT', str(tmp_path))
+    index = RetrievalIndex(str(tmp_path))
+    assert index.begin_build()
+    (tmp_path / 'late.py').write_text('def late_arrival():\n    pass\n')
+    index.update_path(str(tmp_path / 'late.py'))
+    index.load({})
+    assert qualnames(index.search('late arrival')) == ['late.late_arrival']
+
+
+def test_failed_build_is_retried(tmp_path, monkeypatch):
+    from src.core import retrieval_index as retrieval_index_module
+    monkeypatch.setattr(settings, 'REPO_ROOT', str(tmp_path))
+    (tmp_path / 'module.py').write_text('def retried():\n    pass\n')
+    index = RetrievalIndex(str(tmp_path))
+
+    def failing_walk(root):
+        yield str(tmp_path / 'module.py')
+        raise OSError('walk failed')
+
+    monkeypatch.setattr(retrieval_index_module, 'iter_python_files', failing_walk)
+    with pytest.raises(OSError):
+        index.ensure_built()
+    assert not index.is_built
+    monkeypatch.undo()
+    monkeypatch.setattr(settings, 'REPO_ROOT', str(tmp_path))
+    index.ensure_built()
+    assert qualnames(index.search('retried')) == ['module.retried']
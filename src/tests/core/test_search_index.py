@@ -0,0 +1,128 @@
+import os
+import re
+
+import pytest
+
+from src.core import search_index as search_index_module
+from src.core.config import settings
+from src.core.search_index import TrigramIndex, literal_query, regex_query, trigrams
+from src.utils import walk_directory
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'REPO_ROOT', str(tmp_path))
+    files = {
+        'app/main.py': 'import os\n\ndef handle_request(request):\n    return Response(request)\n',
+        'app/models.py': 'class Response:\n    """An HTTP response."""\n    status = 200\n',
+        'docs/guide.md': 'Call handle_request with a request.\nRESPONSE codes are documented elsewhere.\n',
+        'data/blob.bin': 'handle_request\0\x01\x02',
+        'big.txt': 'handle_request ' * 100,
+        '.git/config': 'handle_request',
+    }
+    for path, content in files.items():
+        os.makedirs(tmp_path / os.path.dirname(path), exist_ok=True)
+        (tmp_path / path).write_text(content)
+    index = TrigramIndex(str(tmp_path), max_file_bytes=1000)
+    index.build()
+    return index
+
+
+def lines(result):
+    return [(match.path, match.line_number) for match in result.matches]
+
+
+def test_literal_query_trigrams():
+    assert literal_query('Abcd', ignore_case=False).alternatives == [{b'abc', b'bcd'}]
+    # Too short to prefilter
+    assert literal_query('ab', ignore_case=False).matches_all
+
+
+def test_regex_query_uses_literal_runs():
+    assert regex_query(r'handle_\w+\(', ignore_case=False).alternatives == [trigrams(b'handle_')]
+    assert sorted(map(sorted, regex_query(r'(?:foo|barbaz)x', ignore_case=False).alternatives)) == \
+        [sorted(trigrams(b'barbaz')), [b'foo']]
+    assert regex_query(r'(?:foo|\w+)', ignore_case=False).matches_all
+    assert regex_query(r'[a-z]+', ignore_case=False).matches_all
+    assert regex_query(r'x(?:abc)+', ignore_case=False).alternatives == [{b'abc'}]
+    assert regex_query(r'x(?:abc)*', ignore_case=False).matches_all
+
+
+def test_index_skips_binary_large_and_git_files(repo):
+    assert repo.stats()['files'] == 3
+
+
+def test_literal_search(repo):
+    result = repo.search('handle_request')
+    assert lines(result) == [('app/main.py', 3), ('docs/guide.md', 1)]
+    assert result.matches[0].column == 5
+    assert result.matches[0].line == 'def handle_request(request):'
+    assert result.candidate_files == 2
+    # Case-sensitive by default, the index only narrows down the files
+    assert lines(repo.search('RESPONSE')) == [('docs/guide.md', 2)]
+    assert lines(repo.search('RESPONSE', ignore_case=True)) == \
+        [('app/main.py', 4), ('app/models.py', 1), ('app/models.py', 2), ('docs/guide.md', 2)]
+
+
+def test_regex_search(repo):
+    assert lines(repo.search(r'^\s+return \w+\(', is_regex=True)) == [('app/main.py', 4)]
+    assert lines(repo.search(r'status = \d+', is_regex=True)) == [('app/models.py', 3)]
+    with pytest.raises(re.error):
+        repo.search('(unclosed', is_regex=True)
+
+
+def test_search_filters_paths_and_limits_results(repo):
+    assert lines(repo.search('request', include=['*.py'])) == [('app/main.py', 3), ('app/main.py', 4)]
+    assert lines(repo.search('request', include=['docs/*'])) == [('docs/guide.md', 1)]
+    result = repo.search('request', max_results=2)
+    assert len(result.matches) == 2
+    assert result.truncated
+
+
+def test_search_returns_context_lines(repo):
+    match = repo.search('def handle_request', context_lines=1).matches[0]
+    assert match.before == ['']
+    assert match.after == ['    return Response(request)']
+    match = repo.search('status', context_lines=5).matches[0]
+    assert match.before == ['class Response:', '    """An HTTP response."""']
+    assert match.after == ['']
+
+
+def test_index_is_updated_incrementally(repo, tmp_path):
+    (tmp_path / 'app' / 'views.py').write_text('from app.main import handle_request\n')
+    repo.update_path(str(tmp_path / 'app' / 'views.py'))
+    assert ('app/views.py', 1) in lines(repo.search('handle_request'))
+
+    (tmp_path / 'app' / 'main.py').write_text('def renamed(request):\n    pass\n')
+    repo.update_path(str(tmp_path / 'app' / 'main.py'))
+    assert ('app/main.py', 3) not in lines(repo.search('handle_request'))
+
+    os.remove(tmp_path / 'docs' / 'guide.md')
+    os.rmdir(tmp_path / 'docs')
+    repo.update_path(str(tmp_path / 'docs'))
+    assert lines(repo.search('handle_request')) == [('app/views.py', 1)]
+    assert repo.stats()['files'] == 3
+
+
+def test_llmignore_changes_are_applied(repo, tmp_path, monkeypatch):
+    (tmp_path / '.llmignore').write_text('docs/\n')
+    monkeypatch.setattr(settings, 'LLMIGNORE_PATH', str(tmp_path / '.llmignore'))
+    # Ignored files are never returned, even before the index is rebuilt
+    assert lines(repo.search('handle_request')) == [('app/main.py', 3)]
+    assert not repo.is_current
+    repo.ensure_built()
+    assert repo.is_current
+    assert repo.stats()['files'] == 3  # app/main.py, app/models.py and .llmignore
+
+
+def test_paths_changed_during_a_build_are_applied_after_it(repo, tmp_path, monkeypatch):
+    def walk_and_change(root):
+        entries = list(walk_directory(root))
+        # Written after the walk found the files, before the index is swapped in
+        (tmp_path / 'app' / 'late.py').write_text('handle_request()\n')
+        repo.update_path(str(tmp_path / 'app' / 'late.py'))
+        return entries
+
+    monkeypatch.setattr(search_index_module, 'walk_directory', walk_and_change)
+    repo.build()
+    assert ('app/late.py', 1) in lines(repo.search('handle_request'))
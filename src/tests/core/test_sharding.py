@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+from src.core.command_executor import CommandExecutor
+from src.core.container_pool import CommandStream
+from src.core.jobs import JobStore
+from src.core.sharding import (DurationHistory, compact_node_ids, merge_exit_codes, parse_collected_node_ids,
+                               parse_durations, partition_tests, run_sharded_tests)
+
+
+COLLECT_OUTPUT = """tests/test_a.py::test_one
+tests/test_a.py::test_two
+tests/test_b.py::TestB::test_three[x y]
+tests/test_c.py::test_four
+
+4 tests collected in 0.01s
+"""
+
+DURATIONS_OUTPUT = """============================= slowest durations =============================
+2.50s call     tests/test_a.py::test_one
+0.10s setup    tests/test_a.py::test_one
+0.30s call     tests/test_b.py::TestB::test_three[x y]
+
+(3 durations < 0.005s hidden.  Use -vv to show these durations.)
+======================== 4 passed in 2.95s ========================
+"""
+
+
+def test_parse_collected_node_ids():
+    assert parse_collected_node_ids(COLLECT_OUTPUT.splitlines()) == [
+        'tests/test_a.py::test_one',
+        'tests/test_a.py::test_two',
+        'tests/test_b.py::TestB::test_three[x y]',
+        'tests/test_c.py::test_four',
+    ]
+
+
+def test_parse_durations():
+    assert parse_durations(DURATIONS_OUTPUT.splitlines()) == {
+        'tests/test_a.py::test_one': pytest.approx(2.6),
+        'tests/test_b.py::TestB::test_three[x y]': pytest.approx(0.3),
+    }
+
+
+def test_partition_balances_by_duration():
+    durations = {'a': 5.0, 'b': 1.0, 'c': 4.0, 'd': 2.0, 'e': 2.0}
+    groups = partition_tests(durations, 2)
+
+    assert sorted(sum(durations[test] for test in group) for group in groups) == [7.0, 7.0]
+    assert sorted(test for group in groups for test in group) == sorted(durations)
+    # Tests stay in collection order within a shard
+    assert all(group == sorted(group) for group in groups)
+
+
+def test_partition_with_more_shards_than_tests():
+    assert partition_tests({'a': 1.0, 'b': 1.0}, 4) == [['a'], ['b']]
+
+
+def test_compact_node_ids_uses_file_paths_for_whole_files():
+    all_ids = ['t/a.py::x', 't/a.py::y', 't/b.py::z', 't/b.py::w']
+    assert compact_node_ids(['t/a.py::x', 't/a.py::y', 't/b.py::w'], all_ids) == ['t/a.py', 't/b.py::w']
+
+
+@pytest.mark.parametrize('exit_codes, expected', [
+    ([0, 0], 0),
+    ([0, 1], 1),
+    ([1, 2, 0], 2),
+    ([0, 5], 0),
+    ([5, 5], 5),
+    ([0, None], 1),
+])
+def test_merge_exit_codes(exit_codes, expected):
+    assert merge_exit_codes(exit_codes) == expected
+
+
+def test_duration_history_is_saved(tmp_path):
+    path = str(tmp_path / 'durations.json')
+    history = DurationHistory(path)
+    history.update({'a': 2.0, 'b': 4.0, 'c': 6.0})
+
+    reloaded = DurationHistory(path)
+    assert reloaded.get('b') == 4.0
+    # Unknown tests are estimated with the median
+    assert reloaded.estimate(['a', 'new']) == {'a': 2.0, 'new': 2.0}
+    assert DurationHistory(None).estimate(['x']) == {'x': 1.0}
+
+
+def test_run_sharded_tests():
+    executor = CommandExecutor(max_workers=4, default_limit=4)
+    store = JobStore(executor, max_jobs=100, ttl_seconds=60)
+    history = DurationHistory(None)
+    history.update({'tests/test_a.py::test_one': 10.0, 'tests/test_a.py::test_two': 1.0,
+                    'tests/test_c.py::test_four': 1.0})
+    command_lines = []
+
+    def open_stream(command_line):
+        command_lines.append(command_line)
+        if '--collect-only' in command_line:
+            output = COLLECT_OUTPUT.encode()
+        else:
+            output = DURATIONS_OUTPUT.encode()
+        return lambda: CommandStream([output], wait=lambda: 0, kill=lambda: None, close=lambda healthy: None)
+
+    def submit_job(command_line):
+        return store.submit('pytest', command_line, open_stream(command_line))
+
+    run = asyncio.run(run_sharded_tests(submit_job, ['pytest', 'tests'], ['pytest'], 2, history, '/repo'))
+    executor.shutdown()
+
+    assert command_lines[0] == ['pytest', 'tests', '--rootdir=/repo', '--collect-only', '-q']
+    # The slow test gets a shard to itself
+    assert sorted(command_lines[1:]) == [
+        ['pytest', '--rootdir=/repo', '--durations=0', '/repo/tests/test_a.py::test_one'],
+        ['pytest', '--rootdir=/repo', '--durations=0',
+         '/repo/tests/test_a.py::test_two', '/repo/tests/test_b.py', '/repo/tests/test_c.py'],
+    ]
+    assert sorted(run.shard_tests) == [1, 3]
+    assert all(job.exit_code == 0 for job in run.shard_jobs)
+    assert history.get('tests/test_b.py::TestB::test_three[x y]') == pytest.approx(0.3)
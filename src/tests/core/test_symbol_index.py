@@ -0,0 +1,31 @@
+from src.core.config import settings
+from src.core.symbol_index import SymbolIndex
+
+SOURCE = (
+    'class Account:\n'
+    '    @property\n'
+    '    def balance(self):\n'
+    '        return self._balance\n'
+    '\n'
+    '    @balance.setter\n'
+    '    def balance(self, value):\n'
+    '        self._balance = value\n'
+)
+
+
+def test_symbols_defined_twice_are_removed_with_their_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'REPO_ROOT', str(tmp_path))
+    monkeypatch.setattr(settings, 'LLMIGNORE_PATH', str(tmp_path / '.llmignore'))
+    index = SymbolIndex(str(tmp_path))
+    index.load({})
+    path = tmp_path / 'account.py'
+    path.write_text(SOURCE)
+    index.update_path(str(path))
+    assert [symbol.qualname for symbol in index.search('balance')] == ['account.Account.balance']
+    # The setter is the last definition
+    assert index.get('account.Account.balance').start_line == 6
+
+    path.write_text('')
+    index.update_path(str(path))
+    assert index.search('balance') == []
+    assert index._by_name == [] and index._by_qualname == []
@@ -0,0 +1,89 @@
+import ast
+import os
+
+import pytest
+
+from src.core.test_impact import ImportGraph, extract_imports, find_impacted_tests, module_names_for_file
+
+
+@pytest.fixture
+def repo(tmp_path):
+    files = {
+        'pkg/__init__.py': '',
+        'pkg/core.py': 'VALUE = 1\n',
+        'pkg/util.py': 'from .core import VALUE\n',
+        'app.py': 'import pkg.util\n',
+        'tests/conftest.py': '',
+        'tests/test_core.py': 'from pkg import core\n',
+        'tests/test_app.py': 'from app import *\n',
+        'tests/test_other.py': 'import os\n',
+        'tests/test_gone.py': 'import pkg.gone\n',
+        'integration/test_util.py': 'from pkg.util import VALUE\n',
+    }
+    for path, content in files.items():
+        os.makedirs(tmp_path / os.path.dirname(path), exist_ok=True)
+        (tmp_path / path).write_text(content)
+    return str(tmp_path)
+
+
+def impacted(repo, *changed):
+    result = find_impacted_tests([os.path.join(repo, path) for path in changed], repo)
+    if result.test_files is None:
+        return None
+    return sorted(os.path.relpath(path, repo) for path in result.test_files)
+
+
+def test_module_names_for_file(tmp_path):
+    os.makedirs(tmp_path / 'src' / 'pkg' / 'sub')
+    for path in ('src/pkg/__init__.py', 'src/pkg/sub/__init__.py', 'src/pkg/sub/mod.py', 'scripts/run.py'):
+        os.makedirs(tmp_path / os.path.dirname(path), exist_ok=True)
+        (tmp_path / path).write_text('')
+    root = str(tmp_path)
+
+    assert module_names_for_file(os.path.join(root, 'src/pkg/sub/mod.py'), root) == ['src.pkg.sub.mod', 'pkg.sub.mod']
+    assert module_names_for_file(os.path.join(root, 'src/pkg/sub/__init__.py'), root) == ['src.pkg.sub', 'pkg.sub']
+    assert module_names_for_file(os.path.join(root, 'scripts/run.py'), root) == ['scripts.run', 'run']
+
+
+def test_extract_imports_resolves_relative_imports():
+    tree = ast.parse('import a.b\nfrom . import sibling\nfrom ..parent import name\nfrom x import *\n')
+    assert extract_imports(tree, 'pkg.sub') == {
+        'a.b', 'pkg.sub', 'pkg.sub.sibling', 'pkg.parent', 'pkg.parent.name', 'x',
+    }
+
+
+def test_import_graph_importers(repo):
+    graph = ImportGraph(repo).build()
+    assert graph.importers[os.path.join(repo, 'pkg/core.py')] == {
+        os.path.join(repo, 'pkg/util.py'), os.path.join(repo, 'tests/test_core.py'),
+    }
+    # Importing a submodule runs the package's __init__
+    assert os.path.join(repo, 'app.py') in graph.importers[os.path.join(repo, 'pkg/__init__.py')]
+
+
+def test_change_selects_transitive_importers(repo):
+    assert impacted(repo, 'pkg/core.py') == ['integration/test_util.py', 'tests/test_app.py', 'tests/test_core.py']
+    assert impacted(repo, 'app.py') == ['tests/test_app.py']
+
+
+def test_changed_test_file_is_selected(repo):
+    assert impacted(repo, 'tests/test_other.py') == ['tests/test_other.py']
+
+
+def test_deleted_module_selects_its_importers(repo):
+    assert impacted(repo, 'pkg/gone.py') == ['tests/test_gone.py']
+
+
+def test_conftest_change_selects_tests_below_it(repo):
+    assert impacted(repo, 'tests/conftest.py') == [
+        'tests/test_app.py', 'tests/test_core.py', 'tests/test_gone.py', 'tests/test_other.py',
+    ]
+
+
+def test_configuration_change_selects_everything(repo):
+    assert impacted(repo, 'pytest.ini') is None
+    assert impacted(repo, 'conftest.py') is None
+
+
+def test_non_python_change_selects_nothing(repo):
+    assert impacted(repo, 'README.md') == []
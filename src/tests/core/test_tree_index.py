@@ -0,0 +1,23 @@
+from src.core.config import settings
+from src.core.tree_index import TreeIndex
+
+
+def test_changes_after_llmignore_changes_wait_for_the_rebuild(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'REPO_ROOT', str(tmp_path))
+    monkeypatch.setattr(settings, 'LLMIGNORE_PATH', str(tmp_path / '.llmignore'))
+    (tmp_path / 'build').mkdir()
+    (tmp_path / 'build' / 'out.txt').write_text('')
+    index = TreeIndex(str(tmp_path), 'lazy')
+    monkeypatch.setattr(index, 'start_watching', lambda: None)
+    assert index.ensure_ready()
+    assert index.list_directory(str(tmp_path)) == ['build']
+
+    (tmp_path / '.llmignore').write_text('build/\n')
+    index.update_path(str(tmp_path / '.llmignore'))
+    assert not index.is_built
+    # Changes arriving before the rebuild are left to it
+    (tmp_path / 'new.txt').write_text('')
+    index.update_path(str(tmp_path / 'new.txt'))
+
+    assert index.ensure_ready()
+    assert sorted(index.list_directory(str(tmp_path))) == ['.llmignore', 'new.txt']
@@ -0,0 +1,147 @@
+import ast
+import os
+
+import numpy as np
+import pytest
+
+from src.core.config import settings
+from src.core.vector_index import VectorIndex, chunk_python_module, embed
+
+SOURCE = (
+    'import os\n'
+    '\n'
+    'LIMIT = 3\n'
+    '\n'
+    'class Cache:\n'
+    '    """Cache of parsed files."""\n'
+    '    size = 0\n'
+    '\n'
+    '    @property\n'
+    '    def is_full(self):\n'
+    '        return self.size >= LIMIT\n'
+    '\n'
+    'def read_config(path):\n'
+    '    with open(path) as config_file:\n'
+    '        return config_file.read()\n'
+)
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'REPO_ROOT', str(tmp_path))
+    files = {
+        'app/cache.py': SOURCE,
+        'app/users.py': (
+            'def load_user(user_id, database):\n'
+            '    row = database.fetch_one("select * from users where id = ?", user_id)\n'
+            '    return User(**row)\n'
+        ),
+        'app/empty.py': '',
+        'app/broken.py': 'def oops(:\n',
+    }
+    for path, content in files.items():
+        os.makedirs(tmp_path / os.path.dirname(path), exist_ok=True)
+        (tmp_path / path).write_text(content)
+    return tmp_path
+
+
+def names(results):
+    return [chunk.name for chunk, _ in results]
+
+
+def test_chunks_split_at_definitions():
+    chunks = chunk_python_module(ast.parse(SOURCE), SOURCE, 'app/cache.py')
+    assert [chunk for chunk, _ in chunks] == [
+        ('app/cache.py', 1, 4, 'module', 'app.cache'),
+        ('app/cache.py', 5, 8, 'class', 'app.cache.Cache'),
+        ('app/cache.py', 9, 11, 'function', 'app.cache.Cache.is_full'),
+        ('app/cache.py', 13, 15, 'function', 'app.cache.read_config'),
+    ]
+    assert chunks[2][1].startswith('    @property\n')
+
+
+def test_embedding_is_deterministic_and_normalised():
+    vector = embed('def read_config(path): pass', 64)
+    assert vector.dtype == np.float32
+    assert np.allclose(vector, embed('def read_config(path): pass', 64))
+    assert np.isclose(np.linalg.norm(vector), 1.0)
+    assert not embed('   ', 64).any()
+
+
+def test_search_finds_similar_code(repo):
+    index = VectorIndex(str(repo), dimensions=256)
+    index.build()
+    results = index.search('def fetch_user(user_id, db):\n    return db.fetch_one("select", user_id)')
+    assert names(results)[0] == 'app.users.load_user'
+    assert results[0][1] > results[1][1]
+    assert names(index.search('open(path).read()', limit=1, kind='function')) == ['app.cache.read_config']
+    assert index.search('') == []
+    assert index.stats()['chunks'] == 5
+
+
+def test_index_is_updated_incrementally(repo):
+    index = VectorIndex(str(repo), dimensions=256)
+    index.build()
+    (repo / 'app' / 'users.py').write_text('def save_order(order):\n    order.save()\n')
+    index.update_path(str(repo / 'app' / 'users.py'))
+    assert 'app.users.load_user' not in names(index.search('load_user user_id database'))
+    assert names(index.search('save_order order', limit=1)) == ['app.users.save_order']
+
+    os.remove(repo / 'app' / 'users.py')
+    index.update_path(str(repo / 'app'))
+    assert index.stats()['files'] == 2
+    assert 'app.users.save_order' not in names(index.search('save_order order'))
+
+
+def test_saved_index_is_memory_mapped_and_refreshed(repo, tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp('vectors'))
+    index = VectorIndex(str(repo), dimensions=256, directory=directory)
+    index.build()
+    assert index.is_memory_mapped
+    (repo / 'app' / 'users.py').write_text('def save_order(order):\n    order.save()\n')
+
+    # A new process loads the saved matrix and only re-embeds changed files
+    reloaded = VectorIndex(str(repo), dimensions=256, directory=directory)
+    reloaded.build()
+    assert reloaded.is_memory_mapped
+    assert reloaded.stats()['rows'] == reloaded.stats()['chunks'] == 5
+    assert names(reloaded.search('save_order order', limit=1)) == ['app.users.save_order']
+    assert names(reloaded.search('class Cache size', limit=1)) == ['app.cache.Cache']
+
+    # A saved index with other dimensions is rebuilt
+    resized = VectorIndex(str(repo), dimensions=128, directory=directory)
+    assert not resized.load()
+
+
+def test_reload_drops_files_ignored_since_saved(repo, tmp_path_factory, monkeypatch):
+    directory = str(tmp_path_factory.mktemp('vectors'))
+    VectorIndex(str(repo), dimensions=256, directory=directory).build()
+    (repo / '.llmignore').write_text('users.py\n')
+    monkeypatch.setattr(settings, 'LLMIGNORE_PATH', str(repo / '.llmignore'))
+
+    reloaded = VectorIndex(str(repo), dimensions=256, directory=directory)
+    reloaded.build()
+    assert 'app.users.load_user' not in names(reloaded.search('load_user user_id database'))
+    assert reloaded.stats()['files'] == 2
+
+    # Ignored files are not added back when they change
+    (repo / 'app' / 'users.py').write_text('def load_user(user_id):\n    pass\n')
+    reloaded.update_path(str(repo / 'app' / 'users.py'))
+    assert 'app.users.load_user' not in names(reloaded.search('load_user user_id'))
+
+
+def test_paths_changed_during_a_build_are_applied_after_it(repo, monkeypatch):
+    from src.core import vector_index as vector_index_module
+    index = VectorIndex(str(repo), dimensions=256)
+    embed_python_files = vector_index_module.embed_python_files
+
+    def add_file_while_embedding(batch, dimensions):
+        if not (repo / 'app' / 'late.py').exists():
+            (repo / 'app' / 'late.py').write_text('def late_arrival():\n    return 1\n')
+            index.update_path(str(repo / 'app' / 'late.py'))
+        return embed_python_files(batch, dimensions)
+
+    monkeypatch.setattr(vector_index_module, 'embed_python_files', add_file_while_embedding)
+    assert index.begin_build()
+    index.build()
+    assert 'app.late.late_arrival' in names(index.search('def late_arrival(): return 1'))
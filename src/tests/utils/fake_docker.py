@@ -0,0 +1,123 @@
+import itertools
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from docker.models.containers import ExecResult
+
+
+def echo_command(command: List[str]) -> ExecResult:
+    return ExecResult(0, ("ran: " + " ".join(command)).encode("utf-8"))
+
+
+class FakeContainer:
+    """
+    Stand-in for `docker.models.containers.Container` that runs exec'd
+    commands through a python callable instead of a Docker daemon.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, client: "FakeDockerClient", run_kwargs: dict):
+        self.id = f"fake-{next(self._ids)}"
+        self.client = client
+        self.run_kwargs = run_kwargs
+        self.status = "running"
+        self.removed = False
+        self.exec_commands: List[List[str]] = []
+
+    def exec_run(self, command: List[str], **kwargs: Any) -> ExecResult:
+        if self.status != "running":
+            raise RuntimeError(f"Container {self.id} is not running")
+        self.exec_commands.append(command)
+        result = self.client.exec_handler(command)
+        if not isinstance(result.output, bytes):
+            result = ExecResult(result.exit_code, b"".join(result.output))
+        return result
+
+    def reload(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        self.status = "exited"
+
+    def remove(self, force: bool = False) -> None:
+        self.status = "removed"
+        self.removed = True
+
+
+class FakeContainerCollection:
+    def __init__(self, client: "FakeDockerClient"):
+        self.client = client
+        self.created: List[FakeContainer] = []
+
+    def run(self, **kwargs: Any) -> FakeContainer:
+        container = FakeContainer(self.client, kwargs)
+        self.created.append(container)
+        return container
+
+
+class FakeImage:
+    def __init__(self, entrypoint: Optional[List[str]]):
+        self.attrs = {"Config": {"Entrypoint": entrypoint}}
+
+
+class FakeImageCollection:
+    def __init__(self, entrypoint: Optional[List[str]]):
+        self.entrypoint = entrypoint
+
+    def get(self, name: str) -> FakeImage:
+        return FakeImage(self.entrypoint)
+
+
+class FakeAPIClient:
+    """
+    The parts of the low-level `docker.APIClient` used to stream the output
+    of exec'd commands. Output stops as soon as the container is removed.
+    """
+
+    def __init__(self, client: "FakeDockerClient"):
+        self.client = client
+        self._execs: Dict[str, Tuple[FakeContainer, List[str]]] = {}
+        self._results: Dict[str, ExecResult] = {}
+
+    def exec_create(self, container_id: str, command: List[str]) -> Dict[str, str]:
+        container = next(c for c in self.client.containers.created if c.id == container_id)
+        if container.status != "running":
+            raise RuntimeError(f"Container {container.id} is not running")
+        exec_id = f"exec-{len(self._execs) + 1}"
+        self._execs[exec_id] = (container, command)
+        return {"Id": exec_id}
+
+    def exec_start(self, exec_id: str, stream: bool = False) -> Iterator[bytes]:
+        container, command = self._execs[exec_id]
+        container.exec_commands.append(command)
+        result = self._results[exec_id] = self.client.exec_handler(command)
+        output = result.output.splitlines(keepends=True) if isinstance(result.output, bytes) else result.output
+        for chunk in output:
+            if container.removed:
+                return
+            yield chunk
+
+    def exec_inspect(self, exec_id: str) -> Dict[str, Any]:
+        return {"ExitCode": self._results[exec_id].exit_code, "Running": False}
+
+    def stats(self, container_id: str, stream: bool = True, one_shot: bool = False) -> Dict[str, Any]:
+        # Each exec'd command uses 0.1s of CPU
+        container = next(c for c in self.client.containers.created if c.id == container_id)
+        return {"cpu_stats": {"cpu_usage": {"total_usage": len(container.exec_commands) * 100_000_000}}}
+
+
+class FakeDockerClient:
+    """
+    Minimal fake of `docker.DockerClient` for testing command execution
+    without a Docker daemon. `exec_handler` decides what an exec'd command
+    returns (echoes the command by default), and `entrypoint` is the
+    image's entrypoint.
+    """
+
+    def __init__(self,
+                 exec_handler: Optional[Callable[[List[str]], ExecResult]] = None,
+                 entrypoint: Optional[List[str]] = None):
+        self.exec_handler = exec_handler or echo_command
+        self.containers = FakeContainerCollection(self)
+        self.images = FakeImageCollection(entrypoint)
+        self.api = FakeAPIClient(self)
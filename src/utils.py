@@ -3,13 +3,23 @@ import subprocess
 import pathlib
 from pathlib import Path
 import ast
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, NamedTuple, Optional
 from fastapi import HTTPException
 import fnmatch
-import docker
+import json
 from typing import Tuple
 
 from src.core.config import settings
+from src.core.ast_cache import parsed_module_cache
+from src.core.llmignore import get_llmignore_matcher, read_llmignore_patterns, relative_to_repo_root
+from src.core.container_pool import CommandStream, get_docker_client
+
+
+# Bytes sniffed at the start of a file to decide whether it is binary
+BINARY_SNIFF_BYTES = 8192
+
+# Longer lines (e.g. in minified files) are cut short in search results
+MAX_LINE_CHARS = 1000
 
 
 def sanitize_path(path: str) -> str:
@@ -43,9 +53,10 @@ def get_endpoint_path(file_path: str) -> str:
     return endpoint_path
 
 
-def extract_python_summary(file_content: str) -> List[Dict[str, Any]]:
+def extract_python_summary(file_content: str, parsed_ast: Optional[ast.Module] = None) -> List[Dict[str, Any]]:
     summary = []
-    parsed_ast = ast.parse(file_content)
+    if parsed_ast is None:
+        parsed_ast = ast.parse(file_content)
 
     for node in ast.iter_child_nodes(parsed_ast):
         if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
@@ -105,24 +116,116 @@ def extract_file_summary(file_content: str, language: str) -> List[Dict[str, Any
         raise ValueError(f"Language {language} not supported")
 
 
+def extract_file_summary_from_path(filesystem_path: str, language: str) -> List[Dict[str, Any]]:
+    """
+    Like `extract_file_summary`, but reads the file through the parsed module
+    cache so repeated summaries of an unchanged file are not re-parsed.
+    """
+    if language == "python":
+        return parsed_module_cache.get_derived(
+            filesystem_path,
+            "summary",
+            lambda module: extract_python_summary(module.source, module.tree),
+        )
+    else:
+        raise ValueError(f"Language {language} not supported")
+
+
 def load_llmignore_patterns() -> List[str]:
     if os.path.exists(settings.LLMIGNORE_PATH):
-        with open(settings.LLMIGNORE_PATH, "r") as f:
-            return [line.strip() for line in f.readlines() if line.strip() and not line.startswith("#")]
+        return read_llmignore_patterns(settings.LLMIGNORE_PATH)
     return []
 
 
-def is_llmignored(filesystem_path: str) -> bool:
-    llmignore_patterns = load_llmignore_patterns()
-    path_obj = Path(filesystem_path)
-    for pattern in llmignore_patterns:
-        if fnmatch.fnmatch(path_obj.name, pattern):
-            return True
-        if fnmatch.fnmatch(str(path_obj), pattern):
-            return True
-        if fnmatch.fnmatch(str(path_obj.relative_to(path_obj.anchor)), pattern):
-            return True
-    return False
+def is_llmignored(filesystem_path: str, is_dir: Optional[bool] = None) -> bool:
+    """
+    Whether a path (absolute, or relative to the repo root) or one of its parent
+    directories is ignored by `.llmignore`. `is_dir` only needs to be given to
+    avoid a stat call when the file contains directory-only patterns.
+    """
+    matcher = get_llmignore_matcher()
+    if not matcher:
+        return False
+    if is_dir is None:
+        is_dir = matcher.has_directory_only_patterns and os.path.isdir(
+            filesystem_path if os.path.isabs(filesystem_path) else os.path.join(settings.REPO_ROOT, filesystem_path)
+        )
+    return matcher.is_ignored(relative_to_repo_root(filesystem_path), is_dir)
+
+
+def looks_binary(sample: bytes) -> bool:
+    """
+    Guess whether a file is binary from its first bytes, the way git and grep
+    do: text files don't contain NUL bytes.
+    """
+    return b"\0" in sample
+
+
+def glob_matches(name: str, relative_path: str, patterns: List[str]) -> bool:
+    return any(fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(relative_path, pattern) for pattern in patterns)
+
+
+class WalkEntry(NamedTuple):
+    path: str  # filesystem path
+    name: str
+    is_dir: bool
+    size: Optional[int]  # file size in bytes, None for directories
+    depth: int  # 1 for entries directly inside the walked directory
+
+
+def walk_directory(root: str,
+                   max_depth: Optional[int] = None,
+                   include: Optional[List[str]] = None) -> Iterator[WalkEntry]:
+    """
+    Iteratively walk `root` with `os.scandir`, yielding each entry before the
+    contents of the directory it names. `.git` and `.llmignore`d directories
+    are pruned before they are descended into, and file sizes come from the
+    `DirEntry` so each entry costs at most one stat call.
+
+    `include` is a list of glob patterns; when given only files whose name or
+    repo-relative path matches one of them are yielded (directories are
+    always yielded).
+    """
+    matcher = get_llmignore_matcher()
+    stack = [(root, 0)]
+    while stack:
+        dir_path, depth = stack.pop()
+        try:
+            with os.scandir(dir_path) as it:
+                entries = list(it)
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            continue
+
+        subdirectories = []
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                continue
+            if is_dir and entry.name == ".git":
+                continue
+            # Parent directories have already been checked, so only the entry
+            # itself needs to be matched
+            if matcher and matcher.match(relative_to_repo_root(entry.path), is_dir):
+                continue
+
+            if is_dir:
+                yield WalkEntry(entry.path, entry.name, True, None, depth + 1)
+                # Don't follow symlinked directories, they can form cycles
+                if (max_depth is None or depth + 1 < max_depth) and not entry.is_symlink():
+                    subdirectories.append((entry.path, depth + 1))
+            else:
+                if include and not glob_matches(entry.name, relative_to_repo_root(entry.path), include):
+                    continue
+                try:
+                    size = entry.stat().st_size
+                except FileNotFoundError:
+                    # E.g. broken symlinks in virtualenvs
+                    continue
+                yield WalkEntry(entry.path, entry.name, False, size, depth + 1)
+
+        # Reversed so directories are visited in the order they were listed
+        stack.extend(reversed(subdirectories))
 
 
 def is_git_repository(directory: str) -> bool:
@@ -160,8 +263,37 @@ def get_git_diff(directory: str) -> str:
     return result.stdout
 
 
+def get_changed_files(directory: str) -> List[str]:
+    """
+    Filesystem paths of files that differ from the last commit, i.e. the files
+    in `get_git_diff`, plus untracked files. Paths of deleted files are
+    included even though they no longer exist.
+    """
+    if not is_git_repository(directory):
+        raise ValueError("The directory is not a git repository")
+
+    check_commits = subprocess.run(["git", "-C", directory, "rev-parse", "--quiet", "--verify", "HEAD"],
+                                   capture_output=True,
+                                   text=True)
+    if check_commits.returncode != 0:
+        # No commits, so every file is new
+        changed = ["ls-files", "--cached"]
+    else:
+        changed = ["diff", "HEAD", "--name-only", "--no-renames"]
+
+    top_level = subprocess.run(["git", "-C", directory, "rev-parse", "--show-toplevel"],
+                               check=True, capture_output=True, text=True).stdout.strip()
+    paths = []
+    for args in (changed, ["ls-files", "--others", "--exclude-standard"]):
+        result = subprocess.run(["git", "-C", directory, *args], check=True, capture_output=True, text=True)
+        # diff paths are relative to the top level, ls-files paths to `directory`
+        base = top_level if args[0] == "diff" else directory
+        paths.extend(os.path.join(base, line) for line in result.stdout.splitlines() if line)
+    return sorted(set(paths))
+
+
 def run_command_in_image(image_name: str, command: List[str]) -> Tuple[int, str]:
-    client = docker.from_env()
+    client = get_docker_client()
 
     # Run the command in a new container
     container = client.containers.run(image=image_name, 
@@ -186,3 +318,34 @@ def run_command_in_image(image_name: str, command: List[str]) -> Tuple[int, str]
     exit_code = result['StatusCode']
 
     return exit_code, output_str
+
+
+def stream_command_in_image(image_name: str, command: List[str]) -> CommandStream:
+    """
+    Start the command in a new container and return a stream of its output
+    (standard output and standard error) as it is produced.
+    """
+    client = get_docker_client()
+    container = client.containers.run(image=image_name,
+                                      command=command,
+                                      detach=True,
+                                      volumes={settings.TARGET_REPO_PATH: {"bind": settings.REPO_ROOT, "mode": "rw"}})
+    try:
+        chunks = container.logs(stream=True, follow=True)
+    except BaseException:
+        container.remove(force=True)
+        raise
+    return CommandStream(chunks,
+                         wait=lambda: container.wait()['StatusCode'],
+                         kill=container.kill,
+                         close=lambda healthy: container.remove(force=True))
+
+
+def format_sse(event: str, data: Dict[str, Any], event_id: Optional[int] = None) -> str:
+    """
+    Format a server-sent event with a JSON payload.
+    """
+    message = f"event: {event}\n"
+    if event_id is not None:
+        message += f"id: {event_id}\n"
+    return message + f"data: {json.dumps(data)}\n\n"